@@ -0,0 +1,295 @@
+'''
+Benchmarks of the pipeline stages on synthetic data, compared with a baseline.
+Run from pipeline/, see docs/bench-test.md:
+
+    python3 bench-test/bench.py [--sizes 10000 100000] [--tolerance 0.25] [--update]
+
+Exits with 1 when the throughput of a stage fell more than the tolerance below
+its baseline.
+'''
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import contextlib
+from datetime import datetime
+
+import pandas
+
+# Run as a script from pipeline/, like main.py.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.client import _Client
+from src.config import config
+from src.tables import engines
+from src.tables import CTran_Data, Flagged_Data, Flags, Service_Periods, Watermarks, Row_Hashes
+from src.workload import Workload
+from flaggers.flagger import flaggers
+from flaggers.flagger import Flags as flag_enums
+
+
+BASELINE = "bench-test/baseline.json"
+TOLERANCE = 0.25
+# Schemas of the benchmark tables, so a real database's are left alone.
+PORTAL_SCHEMA = "bench_aperture"
+PIPELINE_SCHEMA = "bench_hive"
+# Rows of a vehicle over the days of a workload.
+DAYS = 5
+TRIPS = 10
+STOPS = 20
+
+
+#############################################################################
+# Benchmarks
+# Each takes the context and the CTran rows of the size being run, and
+# returns (setup, run): setup is called untimed before every run, and run
+# must return a true value on success.
+
+def flagger_benchmark(flagger):
+    def benchmark(context, df):
+        return None, lambda: flagger.flag_frame(df, config) is not None
+    return benchmark
+
+
+def duplicate_benchmark(context, df):
+    duplicate = next(flagger for flagger in flaggers if flagger.name == "Duplicate")
+    return None, lambda: duplicate.flag(df, config) is not None
+
+
+def service_periods_benchmark(context, df):
+    # A new table each run, so its interval index is loaded every time; the
+    # periods themselves are inserted by the first run.
+    dates = df["service_date"]
+    return None, lambda: Service_Periods(schema=PIPELINE_SCHEMA, engine=context["url"]) \
+        .resolve(dates).notna().all()
+
+
+def write_table_benchmark(context, df):
+    flagged = context["flagged"]
+    rows = flagged_frame(df)
+
+    def setup():
+        flagged.delete_schema()
+        flagged.create_table()
+    return setup, lambda: flagged._write_table(rows)
+
+
+def write_csv_benchmark(context, df):
+    flagged = context["flagged"]
+    path = os.path.join(context["directory"], "flagged.csv")
+    rows = flagged_frame(df).values.tolist()
+    data = []
+
+    def setup():
+        # write_csv adds the header to the list it is given.
+        data[:] = list(rows)
+    return setup, lambda: flagged.write_csv(path, data)
+
+
+def process_data_benchmark(context, df):
+    client = context["client"]
+    start_date = df["service_date"].min()
+    end_date = df["service_date"].max()
+
+    def setup():
+        client.flagged.delete_schema()
+        client.create_hive()
+    return setup, lambda: client.process_data(start_date, end_date)
+
+
+def benchmarks():
+    # (name, benchmark) of every stage, in the order they are run.
+    named = [("flagger." + flagger.name, flagger_benchmark(flagger))
+             for flagger in flaggers if flagger.name != "Duplicate"]
+    return named + [
+        ("duplicate", duplicate_benchmark),
+        ("service_periods.resolve", service_periods_benchmark),
+        ("table._write_table", write_table_benchmark),
+        ("flagged_data.write_csv", write_csv_benchmark),
+        ("process_data", process_data_benchmark),
+    ]
+
+
+#############################################################################
+# Harness
+
+def workload_frame(size, seed=0):
+    # About size rows of synthetic CTran data over DAYS days, with a few of
+    # every anomaly so each flagger has rows to flag.
+    workload = Workload(days=DAYS, vehicles=max(1, round(size / (DAYS * TRIPS * STOPS))),
+                        trips=TRIPS, stops=STOPS, seed=seed, null_rate=0.001,
+                        zero_door_rate=0.05, far_rate=0.02, duplicate_rate=0.001)
+    return pandas.concat(list(workload.frames()))
+
+
+def flagged_frame(df):
+    # One UNOPENED_DOOR flag per CTran row, in the layout of flagged_data.
+    return pandas.DataFrame({
+        "row_id": df.index,
+        "service_key": 1,
+        "flag_id": int(flag_enums.UNOPENED_DOOR),
+        "service_date": pandas.to_datetime(df["service_date"]).dt.strftime("%Y-%m-%d").to_numpy(),
+    })
+
+
+def build_context(url, directory):
+    # Pipeline tables on url, and a client using them.
+    ctran = CTran_Data(schema=PORTAL_SCHEMA, engine=url)
+    flagged = Flagged_Data(schema=PIPELINE_SCHEMA, engine=url)
+
+    client = _Client(read_env_data=False)
+    client.ctran = ctran
+    client.flagged = flagged
+    client.flags = Flags(schema=PIPELINE_SCHEMA, engine=url)
+    client.service_periods = Service_Periods(schema=PIPELINE_SCHEMA, engine=url)
+    client.watermarks = Watermarks(schema=PIPELINE_SCHEMA, engine=url)
+    client.row_hashes = Row_Hashes(schema=PIPELINE_SCHEMA, engine=url)
+    client._output_type = "aperture"
+    config.set_value("stream_chunksize", 0)
+    config.set_value("report_path", "")
+    config.set_value("prometheus_textfile", "")
+    return {"url": url, "directory": directory, "client": client, "flagged": flagged, "ctran": ctran}
+
+
+def load_ctran(context, df):
+    # Replace the CTran rows with df.
+    ctran = context["ctran"]
+    ctran.delete_schema()
+    # The parent's create_table, without loading the sample data.
+    if not super(CTran_Data, ctran).create_table() or not ctran._write_table(df):
+        raise RuntimeError("Could not load the CTran rows, see the log.")
+    context["client"].flagged.delete_schema()
+    context["client"].create_hive()
+
+
+def time_benchmark(benchmark, context, df, repeat):
+    # Best time of repeat runs, in seconds.
+    setup, run = benchmark(context, df)
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        succeeded = run()
+        seconds = time.perf_counter() - start
+        if not succeeded:
+            raise RuntimeError("The run failed, see the log.")
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def run(sizes, url, directory, repeat=3, only=None, quiet=True):
+    # Returns {size: {name: {"seconds", "rows_per_second"}}}, sizes as
+    # strings like the baseline's keys.
+    results = {}
+    output = io.StringIO() if quiet else sys.stdout
+    with contextlib.redirect_stdout(output):
+        context = build_context(url, directory)
+    for size in sizes:
+        df = workload_frame(size)
+        rows = len(df.index)
+        with contextlib.redirect_stdout(output):
+            load_ctran(context, df)
+        results[str(size)] = {}
+        for name, benchmark in benchmarks():
+            if only and not any(part in name for part in only):
+                continue
+            with contextlib.redirect_stdout(output):
+                seconds = time_benchmark(benchmark, context, df, repeat)
+            if quiet:
+                output.seek(0)
+                output.truncate()
+            results[str(size)][name] = {"seconds": seconds, "rows_per_second": rows / seconds}
+            print("{:>10} {:<28} {:>12.0f} rows/s".format(size, name, rows / seconds))
+    with contextlib.redirect_stdout(output):
+        context["ctran"].delete_schema()
+        context["flagged"].delete_schema()
+        engines.dispose()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # Returns (size, name, rows_per_second, baseline rows_per_second, change)
+    # of every result in the baseline, and whether any fell more than
+    # tolerance below it.
+    rows = []
+    regressed = False
+    for size, named in results.items():
+        for name, result in named.items():
+            expected = baseline.get(size, {}).get(name)
+            if expected is None:
+                continue
+            change = result["rows_per_second"] / expected["rows_per_second"] - 1
+            regressed = regressed or change < -tolerance
+            rows.append((size, name, result["rows_per_second"], expected["rows_per_second"], change))
+    return rows, regressed
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages against a baseline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000],
+                        help="approximate CTran rows of each run")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage, the best is kept")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="largest allowed drop in throughput, 0.25 for 25%% "
+                             "(default: the baseline's, or {})".format(TOLERANCE))
+    parser.add_argument("--baseline", default=BASELINE, help="baseline JSON file")
+    parser.add_argument("--update", action="store_true",
+                        help="write the results to the baseline instead of comparing")
+    parser.add_argument("--engine", default=None,
+                        help="database URL to run on (default: a temporary SQLite database)")
+    parser.add_argument("--only", nargs="+", default=None,
+                        help="only run the stages whose name contains one of these")
+    parser.add_argument("--verbose", action="store_true", help="print the pipeline's output")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    tolerance = args.tolerance
+    if tolerance is None:
+        tolerance = baseline.get("tolerance", TOLERANCE)
+
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.engine or "sqlite:///" + os.path.join(directory, "bench.db")
+        results = run(args.sizes, url, directory, args.repeat, args.only, not args.verbose)
+
+    if args.update or not baseline:
+        # Sizes and stages not run are kept.
+        merged = baseline.get("results", {})
+        for size, named in results.items():
+            merged.setdefault(size, {}).update(named)
+        baseline.update({
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "machine": "{} {} ({})".format(platform.node(), platform.machine(), platform.processor()),
+            "python": platform.python_version(),
+            "engine": args.engine or "sqlite",
+            "tolerance": tolerance,
+            "results": merged,
+        })
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        print("Baseline written to " + args.baseline + ".")
+        return 0
+
+    rows, regressed = compare(results, baseline.get("results", {}), tolerance)
+    print()
+    print("{:>10} {:<28} {:>12} {:>12} {:>8}".format("size", "stage", "rows/s", "baseline", "change"))
+    for size, name, throughput, expected, change in rows:
+        print("{:>10} {:<28} {:>12.0f} {:>12.0f} {:>+7.1%}{}".format(
+            size, name, throughput, expected, change, "  REGRESSED" if change < -tolerance else ""))
+    if regressed:
+        print("Throughput fell more than {:.0%} below the baseline.".format(tolerance))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
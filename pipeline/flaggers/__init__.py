@@ -4,11 +4,16 @@ from glob import glob
 
 _dont_import = ['__init__.py', 'boilerplate.py']
 
-# Finds all *.py files in current directory except specified.
-# Note that this also includes flagger.py
-_modules = glob(join(dirname(__file__), '*.py'))
-_modules = ['.' + basename(f)[:-3] for f in _modules 
-            if not list(filter(f.endswith, _dont_import))]
-# Import them. Order doesn't matter.
-for m in _modules:
-  importlib.import_module(m, 'flaggers')
+
+# Imports every flagger module, each of which registers its flagger in
+# flagger.flaggers. Called by that list the first time it is read, so
+# importing flaggers.flagger for the Flags enum does not load them.
+def import_flaggers():
+  # Finds all *.py files in current directory except specified.
+  # Note that this also includes flagger.py
+  modules = glob(join(dirname(__file__), '*.py'))
+  modules = ['.' + basename(f)[:-3] for f in modules
+             if not list(filter(f.endswith, _dont_import))]
+  # Import them. Order doesn't matter.
+  for m in modules:
+    importlib.import_module(m, 'flaggers')
@@ -0,0 +1,132 @@
+from collections import namedtuple
+from datetime import datetime
+import numpy
+import pandas
+from pandas.api.types import is_numeric_dtype
+
+from .flagger import Flagger, Flags, flaggers
+
+
+# A column's bounds compiled for numpy comparisons. low and high are float64
+# or datetime64[ns], None when the column is not bounded in that direction.
+Bound = namedtuple("Bound", ["column", "is_date", "low", "high", "min_flag", "max_flag"])
+
+
+def compile_bounds(parsed_bounds):
+    """
+    Compiles the bounds of the config "columns" section, as parsed by
+    ConfigSnapshot.get_parsed_bounds(), into a list of Bound. The bounds are
+    the ones check_bounds() compares against, converted for numpy. Columns
+    without a MIN/MAX flag pair cannot be reported and are skipped, as are
+    string bounds that are not dates.
+
+    Args:
+        parsed_bounds (dict): column name: (min, max)
+
+    Returns:
+        list: a Bound per bounded column.
+    """
+    bounds = []
+    for column, (low, high) in parsed_bounds.items():
+        min_flag = Flags.__members__.get(column.upper() + "_MIN")
+        max_flag = Flags.__members__.get(column.upper() + "_MAX")
+        if min_flag is None or max_flag is None:
+            continue
+
+        low = _numpy_bound(low)
+        high = _numpy_bound(high)
+        if low is None and high is None:
+            continue
+
+        is_date = isinstance(low, numpy.datetime64) or isinstance(high, numpy.datetime64)
+        bounds.append(Bound(column, is_date, low, high, min_flag, max_flag))
+
+    return bounds
+
+
+def _numpy_bound(value):
+    if value is None or isinstance(value, str):
+        return None
+    if isinstance(value, datetime):
+        return numpy.datetime64(pandas.Timestamp(value).to_datetime64(), "ns")
+    return numpy.float64(value)
+
+
+# Class implements the column bounds check
+class Bounds(Flagger):
+    name = 'Bounds'
+
+    def __init__(self):
+        # The config snapshot the bounds were compiled from. A snapshot is
+        # frozen, so they are only compiled again for a new one.
+        self._snapshot = None
+        self._bounds = []
+
+    def flag(self, data, config):
+        """
+        Checks each value of a row against the bounds of its column in the
+        config "columns" section. Nulls are left to the Null flagger.
+
+        Args:
+            data (Object): data row from full dataset fetched from the db
+            config (Config): holds the "columns" section
+
+        Returns:
+            list: the <COLUMN>_MIN and <COLUMN>_MAX Flags of the columns out of
+                bounds
+        """
+
+        frame = pandas.DataFrame([dict(data)])
+        return [flag for flag, mask in self.flag_frame(frame, config).items() if mask[0]]
+
+    def flag_frame(self, data, config):
+        """
+        Vectorized version of flag(): each bounded column is compared to its
+        compiled bounds in one pass.
+
+        Args:
+            data (pandas.DataFrame): full dataset fetched from the db
+            config (Config): holds the "columns" section
+
+        Returns:
+            dict: the raised Flags mapped to boolean masks of the rows of data
+        """
+
+        masks = {}
+        for bound in self._compiled(config):
+            if bound.column not in data.columns:
+                continue
+
+            values = _column_values(data[bound.column], bound.is_date)
+            if bound.low is not None:
+                mask = values < bound.low
+                if mask.any():
+                    masks[bound.min_flag] = mask
+            if bound.high is not None:
+                mask = values > bound.high
+                if mask.any():
+                    masks[bound.max_flag] = mask
+
+        return masks
+
+    def _compiled(self, config):
+        # A Config is compiled from its current snapshot.
+        snapshot = config.snapshot() if hasattr(config, "snapshot") else config
+        if not hasattr(snapshot, "get_parsed_bounds"):
+            return []
+        if snapshot is not self._snapshot:
+            self._bounds = compile_bounds(snapshot.get_parsed_bounds())
+            self._snapshot = snapshot
+        return self._bounds
+
+
+def _column_values(column, is_date):
+    # Nulls become NaN/NaT, which compare False to any bound.
+    if is_date:
+        return pandas.to_datetime(column, errors="coerce").to_numpy(dtype="datetime64[ns]")
+    if not is_numeric_dtype(column):
+        column = pandas.to_numeric(column, errors="coerce")
+    return column.to_numpy(dtype="float64", na_value=numpy.nan)
+
+
+flaggers.append(Bounds())
@@ -1,5 +1,92 @@
+import numpy
+import pandas
+from pandas.api.types import infer_dtype, is_numeric_dtype
+
 from .flagger import Flagger, Flags, flaggers
 
+
+_numeric_kinds = ("integer", "floating", "mixed-integer-float", "decimal", "empty")
+_date_kinds = ("date", "datetime", "datetime64")
+
+
+def row_hashes(data):
+    """
+    64-bit content hash of every row of data, ignoring the index (row_id).
+
+    Each column is hashed by its inferred type rather than its dtype, so the
+    same content hashes the same whatever dtype pandas picked for the batch:
+    an integer column holding a null comes back as float64, object or Int32. Numbers
+    are hashed as float64, dates as datetime64 and everything else as its
+    string form, nulls as "None" as when Table._query_table returned them as
+    None, so hashes stored by earlier runs still match.
+
+    Args:
+        data (Pandas.DataFrame): The rows to hash.
+
+    Returns:
+        numpy.ndarray: uint64 hashes, in the order of data's rows.
+    """
+    columns = {}
+    for name in data.columns:
+        column = data[name]
+        kind = infer_dtype(column, skipna=True)
+        if kind in _numeric_kinds:
+            if not is_numeric_dtype(column):
+                column = pandas.to_numeric(column, errors="coerce")
+            columns[name] = column.to_numpy(dtype="float64", na_value=numpy.nan)
+        elif kind in _date_kinds:
+            columns[name] = pandas.to_datetime(column).to_numpy(dtype="datetime64[ns]").view("int64")
+        else:
+            column = column.astype(object)
+            columns[name] = column.where(column.notna(), None).astype(str).to_numpy()
+
+    frame = pandas.DataFrame(columns, index=data.index)
+    return pandas.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+class Seen_Rows():
+    """
+    Hash of every distinct row of the last service_date seen by
+    Duplicate.find, with the row_id of its first row, carried between the
+    chunks of a streamed run. Identical rows share a service_date and chunks
+    are ordered by service_date, so rows of earlier service_dates are dropped.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, service_date=None):
+        self.service_date = service_date
+        # Sorted, for numpy.searchsorted.
+        self.hashes = numpy.empty(0, dtype=numpy.uint64)
+        self.row_ids = numpy.empty(0, dtype=numpy.int64)
+        # Whether the first row was already reported as a duplicate.
+        self.reported = numpy.empty(0, dtype=bool)
+
+    def match(self, hashes):
+        # Returns the position in self.hashes of each of hashes, and whether
+        # it was found there.
+        positions = numpy.searchsorted(self.hashes, hashes)
+        found = positions < len(self.hashes)
+        found[found] = self.hashes[positions[found]] == hashes[found]
+        return positions, found
+
+    def update(self, hashes, row_ids, service_dates, duplicate, found):
+        # Add the rows of the last service_date of a chunk that are not
+        # already carried.
+        last_date = service_dates[-1]
+        if self.service_date is None or not self.service_date == last_date:
+            self.reset(last_date)
+
+        new = (service_dates == last_date) & ~found
+        _, first = numpy.unique(hashes[new], return_index=True)
+        hashes = numpy.concatenate([self.hashes, hashes[new][first]])
+        order = numpy.argsort(hashes, kind="stable")
+        self.hashes = hashes[order]
+        self.row_ids = numpy.concatenate([self.row_ids, row_ids[new][first]])[order]
+        self.reported = numpy.concatenate([self.reported, duplicate[new][first]])[order]
+
+
 # Class implements duplicate check
 class Duplicate(Flagger):
     name = 'Duplicate'
@@ -23,11 +110,58 @@ class Duplicate(Flagger):
             ValueError: When the input pandas.DataFrame lacks a 'service_date' field.
         """
 
-        duplicates = data[data.duplicated(keep=False)]
-        try:
-            duplicates = duplicates['service_date'].to_frame()
-        except KeyError:
-            raise ValueError('Duplicate.flag() received a pandas.DataFrame without a "service_date" field.')
-        return duplicates
+        row_ids, service_dates = self.find(data)
+        return pandas.DataFrame({'service_date': service_dates},
+                                index=pandas.Index(row_ids, name=data.index.name))
+
+    def find(self, data, seen=None, hashes=None):
+        """
+        Finds the rows of data identical to another row, comparing the 64-bit
+        hashes of row_hashes() instead of the rows themselves. At 100 million
+        rows, the odds of any two distinct rows colliding are about 1 in 3700.
+
+        Args:
+            data (Pandas.DataFrame): The dataset to find duplicates in, indexed
+                    by row_id. This must have a 'service_date' field, otherwise
+                    an ValueError is thrown.
+            seen (Seen_Rows): Rows carried from the previous chunks of the
+                    same run, updated with this chunk's. The earlier rows
+                    matching a row of data are reported too, once.
+            hashes (numpy.ndarray): row_hashes(data), if already computed.
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray): The row_ids and service_dates of
+                    the duplicate rows.
+
+        Raises:
+            ValueError: When the input pandas.DataFrame lacks a 'service_date' field.
+        """
+
+        if 'service_date' not in data:
+            raise ValueError('Duplicate.find() received a pandas.DataFrame without a "service_date" field.')
+
+        row_ids = data.index.to_numpy()
+        service_dates = data['service_date'].to_numpy()
+        if len(row_ids) == 0:
+            return row_ids, service_dates
+        if hashes is None:
+            hashes = row_hashes(data)
+
+        _, inverse, counts = numpy.unique(hashes, return_inverse=True, return_counts=True)
+        duplicate = counts[inverse] > 1
+        if seen is None:
+            return row_ids[duplicate], service_dates[duplicate]
+
+        positions, found = seen.match(hashes)
+        duplicate |= found
+        earlier = numpy.unique(positions[found])
+        earlier = earlier[~seen.reported[earlier]]
+        seen.reported[earlier] = True
+        earlier_ids = seen.row_ids[earlier]
+        earlier_dates = numpy.full(len(earlier), seen.service_date, dtype=service_dates.dtype)
+
+        seen.update(hashes, row_ids, service_dates, duplicate, found)
+        return (numpy.concatenate([earlier_ids, row_ids[duplicate]]),
+                numpy.concatenate([earlier_dates, service_dates[duplicate]]))
 
 flaggers.append(Duplicate())
@@ -1,5 +1,7 @@
 import abc
+import threading
 from enum import IntEnum, auto
+import numpy as np
 
 class Flags(IntEnum):
   ###################################################
@@ -44,6 +46,36 @@ class Flags(IntEnum):
   #Duplicate flag
   DUPLICATE = auto()
 
+  #Bounds flags, raised when a column is outside its bounds in the config
+  SERVICE_DATE_MIN = auto()
+  SERVICE_DATE_MAX = auto()
+  VEHICLE_NUMBER_MIN = auto()
+  VEHICLE_NUMBER_MAX = auto()
+  LEAVE_TIME_MIN = auto()
+  LEAVE_TIME_MAX = auto()
+  STOP_TIME_MIN = auto()
+  STOP_TIME_MAX = auto()
+  ARRIVE_TIME_MIN = auto()
+  ARRIVE_TIME_MAX = auto()
+  DWELL_MIN = auto()
+  DWELL_MAX = auto()
+  DOOR_MIN = auto()
+  DOOR_MAX = auto()
+  ONS_MIN = auto()
+  ONS_MAX = auto()
+  OFFS_MIN = auto()
+  OFFS_MAX = auto()
+  ESTIMATED_LOAD_MIN = auto()
+  ESTIMATED_LOAD_MAX = auto()
+  MAXIMUM_SPEED_MIN = auto()
+  MAXIMUM_SPEED_MAX = auto()
+  LOCATION_DISTANCE_MIN = auto()
+  LOCATION_DISTANCE_MAX = auto()
+  X_COORDINATE_MIN = auto()
+  X_COORDINATE_MAX = auto()
+  Y_COORDINATE_MIN = auto()
+  Y_COORDINATE_MAX = auto()
+
 class Flagger(abc.ABC):
   # Name must be overwritten
   @property
@@ -55,6 +87,25 @@ class Flagger(abc.ABC):
     # Child classes must return a lit of flags.
     pass
 
+  def flag_frame(self, data, config):
+    """
+    Flags a whole DataFrame at once. Returns a dict mapping each raised Flags
+    member to a boolean numpy array aligned with the rows of data.
+
+    This default implementation is an adapter over the per-row flag() so that
+    flaggers which have not been vectorized still work with the frame engine.
+    Child classes should override this with column operations when possible;
+    both paths must produce the same flags.
+    """
+    masks = {}
+    for position, (_, row) in enumerate(data.iterrows()):
+      for flag in self.flag(row, config):
+        if flag not in masks:
+          masks[flag] = np.zeros(len(data.index), dtype=bool)
+        masks[flag][position] = True
+
+    return masks
+
 
 class FlagInfo:
     def __init__(self, name="", desc=""):
@@ -93,6 +144,78 @@ flag_descriptions = {
   Flags.UNOBSERVED_STOP: FlagInfo("unobserved-stop", "UNOBSERVED_STOP"),
   Flags.UNOPENED_DOOR: FlagInfo("unopened-door", "UNOPENED_DOOR"),
   Flags.DUPLICATE: FlagInfo("duplicate", "DUPLICATE"),
+  Flags.SERVICE_DATE_MIN: FlagInfo("service-date-below-min", "SERVICE_DATE_MIN"),
+  Flags.SERVICE_DATE_MAX: FlagInfo("service-date-above-max", "SERVICE_DATE_MAX"),
+  Flags.VEHICLE_NUMBER_MIN: FlagInfo("vehicle-number-below-min", "VEHICLE_NUMBER_MIN"),
+  Flags.VEHICLE_NUMBER_MAX: FlagInfo("vehicle-number-above-max", "VEHICLE_NUMBER_MAX"),
+  Flags.LEAVE_TIME_MIN: FlagInfo("leave-time-below-min", "LEAVE_TIME_MIN"),
+  Flags.LEAVE_TIME_MAX: FlagInfo("leave-time-above-max", "LEAVE_TIME_MAX"),
+  Flags.STOP_TIME_MIN: FlagInfo("stop-time-below-min", "STOP_TIME_MIN"),
+  Flags.STOP_TIME_MAX: FlagInfo("stop-time-above-max", "STOP_TIME_MAX"),
+  Flags.ARRIVE_TIME_MIN: FlagInfo("arrive-time-below-min", "ARRIVE_TIME_MIN"),
+  Flags.ARRIVE_TIME_MAX: FlagInfo("arrive-time-above-max", "ARRIVE_TIME_MAX"),
+  Flags.DWELL_MIN: FlagInfo("dwell-below-min", "DWELL_MIN"),
+  Flags.DWELL_MAX: FlagInfo("dwell-above-max", "DWELL_MAX"),
+  Flags.DOOR_MIN: FlagInfo("door-below-min", "DOOR_MIN"),
+  Flags.DOOR_MAX: FlagInfo("door-above-max", "DOOR_MAX"),
+  Flags.ONS_MIN: FlagInfo("ons-below-min", "ONS_MIN"),
+  Flags.ONS_MAX: FlagInfo("ons-above-max", "ONS_MAX"),
+  Flags.OFFS_MIN: FlagInfo("offs-below-min", "OFFS_MIN"),
+  Flags.OFFS_MAX: FlagInfo("offs-above-max", "OFFS_MAX"),
+  Flags.ESTIMATED_LOAD_MIN: FlagInfo("estimated-load-below-min", "ESTIMATED_LOAD_MIN"),
+  Flags.ESTIMATED_LOAD_MAX: FlagInfo("estimated-load-above-max", "ESTIMATED_LOAD_MAX"),
+  Flags.MAXIMUM_SPEED_MIN: FlagInfo("maximum-speed-below-min", "MAXIMUM_SPEED_MIN"),
+  Flags.MAXIMUM_SPEED_MAX: FlagInfo("maximum-speed-above-max", "MAXIMUM_SPEED_MAX"),
+  Flags.LOCATION_DISTANCE_MIN: FlagInfo("location-distance-below-min", "LOCATION_DISTANCE_MIN"),
+  Flags.LOCATION_DISTANCE_MAX: FlagInfo("location-distance-above-max", "LOCATION_DISTANCE_MAX"),
+  Flags.X_COORDINATE_MIN: FlagInfo("x-coordinate-below-min", "X_COORDINATE_MIN"),
+  Flags.X_COORDINATE_MAX: FlagInfo("x-coordinate-above-max", "X_COORDINATE_MAX"),
+  Flags.Y_COORDINATE_MIN: FlagInfo("y-coordinate-below-min", "Y_COORDINATE_MIN"),
+  Flags.Y_COORDINATE_MAX: FlagInfo("y-coordinate-above-max", "Y_COORDINATE_MAX"),
 }
 
-flaggers = []
+
+class _Flaggers(list):
+  """
+  The registered Flagger instances. Each flagger module appends its own
+  when imported, and the modules are only imported the first time the list
+  is read, so code that only needs the Flags enum does not load them.
+  """
+
+  def __init__(self):
+    super().__init__()
+    self._loaded = False
+    # Reentrant: a flagger module reading the list while it is imported.
+    self._lock = threading.RLock()
+
+  def _load(self):
+    if self._loaded:
+      return
+    with self._lock:
+      if not self._loaded:
+        from . import import_flaggers
+        import_flaggers()
+        self._loaded = True
+
+  def __iter__(self):
+    self._load()
+    return super().__iter__()
+
+  def __reversed__(self):
+    self._load()
+    return super().__reversed__()
+
+  def __len__(self):
+    self._load()
+    return super().__len__()
+
+  def __getitem__(self, index):
+    self._load()
+    return super().__getitem__(index)
+
+  def __contains__(self, flagger):
+    self._load()
+    return super().__contains__(flagger)
+
+
+flaggers = _Flaggers()
@@ -38,9 +38,21 @@ class Null(Flagger):
     #all null flags will be appended to the list
     null_flags = []
     for col in self.columns_flag_dict:
-      if (col in data) and ((data[col] is None) or data[col] is pd.NaT):
+      if (col in data) and pd.isna(data[col]):
         null_flags.append(self.columns_flag_dict[col])
 
     return null_flags
+
+  def flag_frame(self, data, config):
+    # Vectorized version of flag(). isna() treats None, NaN, NaT and the <NA>
+    # of the nullable dtypes of Table._query_table as null, like flag().
+    masks = {}
+    for col in self.columns_flag_dict:
+      if col in data.columns:
+        mask = data[col].isna().to_numpy()
+        if mask.any():
+          masks[self.columns_flag_dict[col]] = mask
+
+    return masks
      
 flaggers.append(Null())
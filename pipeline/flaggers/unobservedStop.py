@@ -1,4 +1,5 @@
 from .flagger import Flagger, Flags, flaggers
+import pandas as pd
 
 #Class that implements unobserved stop check:
 #That is is bus stops at a certain distance away from the stop, we mark it as an unobserved stop.
@@ -29,9 +30,38 @@ class UnobservedStop(Flagger):
 
 		flag = []
 
-		if ('location_distance' in data) and (data['location_distance'] != None) and (data['location_distance'] > max_distance):
+		if ('location_distance' in data) and pd.notna(data['location_distance']) and (data['location_distance'] > max_distance):
 			flag.append(Flags.UNOBSERVED_STOP);
 
 		return flag
 
+	def flag_frame(self, data, config):
+		"""
+		Vectorized version of flag(): compares the whole location_distance
+		column against the configured distance at once.
+
+		Args:
+			data (pandas.DataFrame): full dataset fetched from the db
+			config (Object): contains config vars
+
+		Returns:
+			dict: UNOBSERVED_STOP mapped to a boolean mask of the rows of data,
+				or empty if no row is flagged
+
+		"""
+
+		max_distance = config.get_value("unobserved_stop_distance")
+		if max_distance == None: max_distance = 50
+
+		if 'location_distance' not in data.columns:
+			return {}
+
+		# None becomes NaN; nulls are masked out rather than compared.
+		distance = pd.to_numeric(data['location_distance'], errors='coerce')
+		mask = (distance.notna() & (distance > max_distance)).to_numpy(dtype=bool)
+		if not mask.any():
+			return {}
+
+		return {Flags.UNOBSERVED_STOP: mask}
+
 flaggers.append(UnobservedStop())
\ No newline at end of file
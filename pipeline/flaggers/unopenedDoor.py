@@ -1,4 +1,5 @@
 from .flagger import Flagger, Flags, flaggers
+import pandas as pd
 
 #Class that implements unopened door check:
 #That is if the bus stopped but door hasn't been opened
@@ -20,9 +21,33 @@ class UnopenedDoor(Flagger):
 
 		flag = []
 
-		if('door' in data) and (data['door'] == 0):
+		# A null door (None, NaN or <NA>) is the Null flagger's, not an unopened door.
+		if('door' in data) and pd.notna(data['door']) and (data['door'] == 0):
 			flag.append(Flags.UNOPENED_DOOR)
 
 		return flag
 
+	def flag_frame(self, data, config):
+		"""
+		Vectorized version of flag(): checks the whole door column at once.
+
+		Args:
+			data (pandas.DataFrame): full dataset fetched from the db
+
+		Returns:
+			dict: UNOPENED_DOOR mapped to a boolean mask of the rows of data,
+				or empty if no row is flagged
+		"""
+
+		if 'door' not in data.columns:
+			return {}
+
+		# Nulls compare as <NA> in nullable columns, the notna() mask makes them False.
+		door = data['door']
+		mask = (door.notna() & (door == 0)).to_numpy(dtype=bool)
+		if not mask.any():
+			return {}
+
+		return {Flags.UNOPENED_DOOR: mask}
+
 flaggers.append(UnopenedDoor())
@@ -1,7 +1,13 @@
 # NOTE: to easily play with the data, use the below and access client_instance
 # $ python3 -i main.py
-from src import _Client
+import sys
 
 if __name__ == "__main__":
-	client_instance = _Client()
-	client_instance.main()
+	if len(sys.argv) > 1:
+		# The arguments are checked before the client is imported and created.
+		from src.interface import ArgInterface
+		client_instance = ArgInterface().main(sys.argv[1:])
+	else:
+		from src import _Client
+		client_instance = _Client()
+		client_instance.main()
@@ -1 +1,7 @@
-from src.client import _Client
+# The client imports pandas and SQLAlchemy, so it is only imported when it is
+# used: parsing the command line or reading the config does not need it.
+def __getattr__(name):
+    if name == "_Client":
+        from src.client import _Client
+        return _Client
+    raise AttributeError("module 'src' has no attribute " + repr(name))
@@ -1,22 +1,37 @@
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from collections import namedtuple
 from datetime import datetime
 from datetime import timedelta
-from sqlalchemy import create_engine
+import numpy
+import pandas
 from sqlalchemy.exc import SQLAlchemyError
-from progress.bar import Bar
 
 from src.ios import ios
+from src.ios import Progress
 from src.tables import CTran_Data
 from src.tables import Flagged_Data
+from src.tables import Flagged_Bitmask
 from src.tables import Flags
 from src.tables import Service_Periods
+from src.tables import Watermarks
+from src.tables import Row_Hashes
+from src.tables import engines
 from src.config import config
 from src.restarter import restarter
 from src.interface import ArgInterface
+from src.report import RunReport
 from flaggers.flagger import flaggers, FlagInfo
 from flaggers.flagger import Flags as flag_enums
+# The flagger modules, ParallelFlagger, Profiler, CTran_Cache and Row_History
+# are imported by the methods using them, so queries that do not process
+# data (e.g. --select) do not load them.
+
+
+# Marks a member built on first use that was not built yet.
+_NOT_BUILT = object()
 
 
 class _Option():
@@ -46,16 +61,47 @@ class _Client():
         self._flag_lookup = None
         self.config = config
         self.config.load(read_env_data=read_env_data)
+        try:
+            self._ios.configure(fsync=config.get_value("log_fsync"),
+                                fsync_interval_ms=config.get_value("log_fsync_interval_ms"),
+                                max_bytes=config.get_value("log_max_bytes"),
+                                backups=config.get_value("log_backups"),
+                                compress=config.get_value("log_compress"))
+        except ValueError as err:
+            self._ios.log_and_print("", self._ios.Severity.WARNING, err)
+        # Must happen before the tables are created, they share these pools.
+        engines.configure(pool_size=config.get_value("pool_size"),
+                          max_overflow=config.get_value("max_overflow"),
+                          pool_pre_ping=config.get_value("pool_pre_ping"),
+                          pool_recycle=config.get_value("pool_recycle"))
 
         self._output_path = config.get_value("output_path")
         self._output_type = config.get_value("output_type")
+        self._upsert = config.get_value("write_mode") == "upsert"
+        self._profiling = False
+        self._profiler = None
+        # Whether every flag was written to the flags table, which
+        # flagged_data references, since the client started.
+        self._flags_written = False
+        # ParallelFlagger of the current run, if it flags in worker processes.
+        self._parallel_flagger = None
+        # Values read during runs, taken again at the start of each run.
+        self._settings_snapshot = None
 
         portal_user = config.get_value("portal_user")
         portal_passwd = config.get_value("portal_passwd")
         portal_hostname = config.get_value("portal_hostname")
         portal_db_name = config.get_value("portal_db_name")
         portal_schema = config.get_value("portal_schema")
-        if portal_user and portal_passwd and portal_hostname and portal_db_name :
+        # A database URL (e.g. sqlite:///output/portal.db) replaces the
+        # credentials, see "Dialects" in db_ops.md.
+        portal_url = config.get_value("portal_url")
+        if portal_url:
+            if portal_schema:
+                self.ctran = CTran_Data(schema=portal_schema, engine=portal_url)
+            else:
+                self.ctran = CTran_Data(engine=portal_url)
+        elif portal_user and portal_passwd and portal_hostname and portal_db_name :
             if portal_schema:
                 self.ctran = CTran_Data(portal_user, portal_passwd, portal_hostname, portal_db_name, portal_schema)
             else:
@@ -63,33 +109,222 @@ class _Client():
         else:
             print("Please enter credentials for Portals database with the C-Tran table.")
             self.ctran = CTran_Data()
-        self._portal_engine = self.ctran.get_engine()
+        # Set by _set_ctran_cache() on first use.
+        self._ctran_cache_set = False
         pipe_user = config.get_value("pipeline_user")
         pipe_passwd = config.get_value("pipeline_passwd")
         pipe_hostname = config.get_value("pipeline_hostname")
         pipe_db_name = config.get_value("pipeline_db_name")
         pipe_schema = config.get_value("pipeline_schema")
-        if pipe_user and pipe_passwd and pipe_hostname and pipe_db_name:
+        # Flags can be stored as one row per flag or one bitmask per row.
+        if config.get_value("flagged_storage") == "bitmask":
+            flagged_table = Flagged_Bitmask
+        else:
+            flagged_table = Flagged_Data
+        pipe_url = config.get_value("pipeline_url")
+        if pipe_url:
+            if pipe_schema:
+                self.flagged = flagged_table(schema=pipe_schema, engine=pipe_url)
+            else:
+                self.flagged = flagged_table(engine=pipe_url)
+        elif pipe_user and pipe_passwd and pipe_hostname and pipe_db_name:
             if pipe_schema:
-                self.flagged = Flagged_Data(pipe_user, pipe_passwd, pipe_hostname, pipe_db_name, pipe_schema)
-                self._hive_engine = self.flagged.get_engine()
-                engine_url = self._hive_engine.url
-                self.flags = Flags(schema=pipe_schema, engine=engine_url)
-                self.service_periods = Service_Periods(schema=pipe_schema, engine=engine_url)
-                self._ios.log_and_print("The client has finished initializing.")
-                return
+                self.flagged = flagged_table(pipe_user, pipe_passwd, pipe_hostname, pipe_db_name, pipe_schema)
             else:
-                self.flagged = Flagged_Data(pipe_user, pipe_passwd, pipe_hostname, pipe_db_name)
+                self.flagged = flagged_table(pipe_user, pipe_passwd, pipe_hostname, pipe_db_name)
         else:
             print("Please enter credentials for Hive's Database.")
-            self.flagged = Flagged_Data()
-
-        self._hive_engine = self.flagged.get_engine()
-        engine_url = self._hive_engine.url
-        self.flags = Flags(engine=engine_url)
-        self.service_periods = Service_Periods(engine=engine_url)
+            self.flagged = flagged_table()
+
+        # The other pipeline tables share the flagged table's engine and
+        # schema. Engines are created when the tables are first used.
+        engine_url = self.flagged.get_url()
+        schema = self.flagged.get_schema()
+        self.flags = Flags(schema=schema, engine=engine_url)
+        self.service_periods = Service_Periods(schema=schema, engine=engine_url)
+        self.watermarks = Watermarks(schema=schema, engine=engine_url)
+        self.row_hashes = Row_Hashes(schema=schema, engine=engine_url)
+        # Built by _get_row_history() on first use.
+        self._row_history = _NOT_BUILT
+        self._set_write_chunksize()
         self._ios.log_and_print("The client has finished initializing.")
 
+    @property
+    def _portal_engine(self):
+        return self.ctran.get_engine()
+
+    @property
+    def _hive_engine(self):
+        return self.flagged.get_engine()
+
+    # Values read during runs, from the snapshot taken by _snapshot_config().
+    # Taken on first use if no run started yet.
+    @property
+    def _settings(self):
+        if self._settings_snapshot is None:
+            self._settings_snapshot = config.snapshot()
+        return self._settings_snapshot
+
+    @_settings.setter
+    def _settings(self, settings):
+        self._settings_snapshot = settings
+
+    def _set_ctran_cache(self):
+        # ctran_cache_path enables the local cache of ctran_data, limited to
+        # ctran_cache_size megabytes. Only done once, on first use.
+        if self._ctran_cache_set:
+            return
+        self._ctran_cache_set = True
+        cache_path = config.get_value("ctran_cache_path")
+        if not cache_path:
+            return
+
+        from src.tables import CTran_Cache
+        cache = CTran_Cache(cache_path, (config.get_value("ctran_cache_size") or 1024) * 1024 * 1024)
+        if not cache.is_available():
+            self._ios.log_and_print(
+                "pyarrow is required for the ctran_data cache, it is disabled.",
+                self._ios.Severity.WARNING)
+            return
+        self.ctran.set_cache(cache)
+
+    # Returns the Row_History, built on first use, or None if it is not
+    # enabled.
+    def _get_row_history(self):
+        if self._row_history is _NOT_BUILT:
+            self._set_row_history()
+        return self._row_history
+
+    def _set_row_history(self):
+        # duplicate_history_path enables the duplicate check against rows
+        # processed in earlier runs.
+        self._row_history = None
+        history_path = config.get_value("duplicate_history_path")
+        if not history_path:
+            return
+
+        from src.tables import Row_History
+        self._row_history = Row_History(history_path,
+                                        config.get_value("duplicate_history_capacity") or 10000000,
+                                        config.get_value("duplicate_history_periods") or 2,
+                                        self.row_hashes, self.ctran, self.service_periods)
+
+    # Take the snapshot of the config a run reads its values from, reloading
+    # the config file first if it was edited (e.g. from the UI) since. Edits
+    # made during a run are only seen by the next one.
+    # The ctran_data cache and the row history are built here by the first
+    # run, before any backfill thread uses them.
+    def _snapshot_config(self):
+        if config.reload_if_changed():
+            self._ios.log_and_print("The config file was modified, it has been reloaded.")
+        try:
+            self._settings = config.snapshot()
+        except ValueError as err:
+            self._ios.log_and_print(str(err) + " The previous values are used.",
+                                    self._ios.Severity.ERROR)
+        self._set_ctran_cache()
+        self._get_row_history()
+        return self._settings
+
+    # Progress of a run, reported every progress_interval seconds on a
+    # terminal, every progress_log_interval seconds to the log otherwise.
+    def _new_progress(self, total=None, unit="rows"):
+        return Progress(total, unit,
+                        interval=self._settings.progress_interval,
+                        log_interval=self._settings.progress_log_interval)
+
+    # Write report as a JSON run report in report_path, and as a Prometheus
+    # textfile to prometheus_textfile. Either is skipped when set to "".
+    def _write_report(self, report):
+        report_path = self._settings.report_path
+        if report_path:
+            full_path = report.write_json(report_path)
+            if full_path is None:
+                self._ios.log_and_print("Could not write the run report.",
+                                        self._ios.Severity.WARNING)
+            else:
+                self._ios.log_and_print("Run report written to " + full_path + ".")
+
+        textfile = self._settings.prometheus_textfile
+        if textfile and not report.write_prometheus(textfile):
+            self._ios.log_and_print("Could not write the Prometheus textfile " + textfile + ".",
+                                    self._ios.Severity.WARNING)
+
+    # Start stage name of a run on its progress, its report and the
+    # profiler, if profiling.
+    def _stage(self, name, progress, report, rows=None):
+        progress.stage(name)
+        report.stage(name, rows)
+        if self._profiler is not None:
+            self._profiler.stage(name)
+
+    # Returns the ParallelFlagger the run flags with, kept by the client until
+    # _stop_parallel_flagger(parallel_flagger) so every chunk and backfill
+    # day reuses its worker processes. None if parallel_workers is 1 or a run
+    # already has one.
+    def _start_parallel_flagger(self):
+        workers = self._settings.parallel_workers
+        if not workers or workers < 2 or self._parallel_flagger is not None:
+            return None
+        self._ios.log_and_print(
+            "Flagging with up to {} worker processes.".format(workers))
+        from src.parallel import ParallelFlagger
+        self._parallel_flagger = ParallelFlagger(
+            workers, self._settings.parallel_min_partition_rows)
+        return self._parallel_flagger
+
+    # Shut the worker processes of parallel_flagger down.
+    def _stop_parallel_flagger(self, parallel_flagger):
+        if parallel_flagger is None:
+            return
+        self._parallel_flagger = None
+        parallel_flagger.close()
+
+    # Returns a started Profiler if profiling is on and no run is being
+    # profiled yet, else None. It profiles every stage until
+    # _stop_profiler(profiler).
+    def _start_profiler(self, run):
+        if not self._profiling or self._profiler is not None:
+            return None
+        from src.report import Profiler
+        self._profiler = Profiler(run)
+        self._profiler.start()
+        return self._profiler
+
+    # Stop profiler and write its reports next to the run reports.
+    def _stop_profiler(self, profiler):
+        if profiler is None:
+            return
+        profiler.stop()
+        self._profiler = None
+        full_path = profiler.write(self._settings.report_path or "output/")
+        if full_path is None:
+            self._ios.log_and_print("Could not write the profile.", self._ios.Severity.WARNING)
+        else:
+            self._ios.log_and_print("Profile written to " + full_path + ".")
+
+    def _set_write_chunksize(self):
+        write_chunksize = config.get_value("write_chunksize")
+        if write_chunksize:
+            for table in [self.flagged, self.flags, self.service_periods, self.row_hashes]:
+                table.set_write_chunksize(write_chunksize)
+
+    #######################################################
+
+    # Number of processes used to run the flaggers. 1 or None flags in this
+    # process. Overrides the parallel_workers config value, from the next run
+    # on.
+    def set_parallel_workers(self, workers):
+        config.set_value("parallel_workers", workers)
+
+    # Profile every stage of the following runs, see docs/report.md.
+    def set_profiling(self, enabled):
+        self._profiling = enabled
+
+    def _toggle_profiling(self):
+        self.set_profiling(not self._profiling)
+        self._ios.print("Profiling is " + ("on." if self._profiling else "off."))
+
     #######################################################
 
     def main(self, read_env_data=False):
@@ -111,12 +346,16 @@ class _Client():
                         self.process_next_day),
             _Option("Process the all following unproccessed service dates from Portal (Which currently is Aperture)",
                         self.process_since_checkpoint),
+            _Option("Backfill the following unproccessed service dates, several days at a time",
+                        self.backfill),
             _Option("Reprocess service date(s)",
                         self.reprocess),
             _Option("Delete flagged rows in date range",
                         self.delete_flagged_range),
             _Option("Create all views",
                         self.create_all_views),
+            _Option("Turn profiling of the following runs on or off",
+                        self._toggle_profiling),
             _Option("Sub-menu: DB Operations",
                         self._db_menu),
         ]
@@ -129,6 +368,8 @@ class _Client():
         self.flags.create_table()
         self.service_periods.create_table()
         self.flagged.create_table()
+        self.watermarks.create_table()
+        self.row_hashes.create_table()
 
     ###########################################################
 
@@ -138,95 +379,272 @@ class _Client():
     def process_data(self, start_date=None, end_date=None, restart=False):
         self._ios.log_and_print("Starting data processing pipeline.")
         start_date, end_date = self._get_date_range(start_date, end_date)
-        ctran_df = self.ctran.query_date_range(start_date, end_date)
+        processed = self._process_data(start_date, end_date, restart) is not None
+        self.log_pool_stats()
+        return processed
+
+    ###########################################################
+
+    # Does the work of process_data once the dates are known. Returns the
+    # number of CTran rows processed, or None if nothing could be processed.
+    # If replace is True, the flags saved for the range are replaced in place
+    # by this run's flags (not supported while streaming).
+    # If after_row_id is given, the dates are ignored and every CTran row
+    # added after that row_id is processed instead.
+    # If allow_empty is True, dates without CTran rows are not an error and
+    # 0 is returned for them.
+    # progress is the Progress to report to, a new one by default.
+    # report is the RunReport to record to. By default a new one is written
+    # once the run is done, failed or not.
+    def _process_data(self, start_date, end_date, restart=False, replace=False, after_row_id=None,
+                      progress=None, report=None, allow_empty=False):
+        if report is None:
+            self._snapshot_config()
+            report = RunReport()
+            profiler = self._start_profiler(report.run)
+            parallel_flagger = self._start_parallel_flagger()
+            rows = None
+            try:
+                rows = self._process_data(start_date, end_date, restart, replace,
+                                          after_row_id, progress, report, allow_empty)
+            finally:
+                self._stop_parallel_flagger(parallel_flagger)
+                report.finish(rows is not None)
+                self._stop_profiler(profiler)
+                self._write_report(report)
+            return rows
+
+        if progress is None:
+            unit = "rows" if self._settings.stream_chunksize else "row passes"
+            with self._new_progress(unit=unit) as progress:
+                return self._process_data(start_date, end_date, restart, replace,
+                                          after_row_id, progress, report, allow_empty)
+
+        if self._settings.stream_chunksize:
+            return self._process_data_stream(start_date, end_date, restart, after_row_id,
+                                             progress, report, allow_empty)
+
+        self._stage("extract", progress, report)
+        if after_row_id is None:
+            ctran_df = self.ctran.query_date_range(start_date, end_date)
+        else:
+            ctran_df = self.ctran.query_new_rows(after_row_id)
+            if ctran_df is not None and ctran_df.empty:
+                self._ios.log_and_print("There are no new CTran rows to process.")
+                return 0
+
+        if allow_empty and ctran_df is not None and ctran_df.empty:
+            self._ios.log_and_print("There are no CTran rows for the supplied dates.")
+            self._record_empty_days(start_date, end_date)
+            return 0
+
         if ctran_df is None or ctran_df.empty:
             self._ios.log_and_print(
                 "The supplied dates were unable to be gathered from CTran data.",
                 self._ios.Severity.ERROR)
-            return False
-
-        flagged_rows = []
-        skipped_rows = 0
+            return None
 
-        csv_service_keys = []
+        csv_service_keys = ctran_df["service_date"].drop_duplicates().tolist()
+        # The whole range is one batch, so each row counts once read, once
+        # flagged and once written, and the rate and ETA move between stages.
+        progress.add_total(3 * len(ctran_df.index))
+        progress.advance(len(ctran_df.index))
+        report.count("rows", len(ctran_df.index))
 
-        duplicate = None
         self._ios.log_and_print("Processing the queried data.")
-        progress_bar = Bar(
-            "",
-            max=len(ctran_df.index))
-        for row_id, row in ctran_df.iterrows():
-
-            if self._output_type == "csv" or self._output_type == "both":
-                if not row.service_date in csv_service_keys:
-                    csv_service_keys.append(row.service_date)
-
-            service_key = self.service_periods.query_or_insert(row.service_date)
-
-            if restart:
-                if config.get_value("max_skipped_rows"):
-                    if skipped_rows > config.get_value("max_skipped_rows"):
-                        msg = self._ios.log_and_print(
-                            "Exceeded maximum number of skipped service rows.",
-                            self._ios.Severity.DEBUG)
-                        restarter.critical_error(msg)
-
-            # If this fails, it's very likely a sqlalchemy error.
-            # e.g. not able to connect to db.
-            if not service_key:
-                self._ios.log_and_print(
-                    "Cannot find or create new service_key, skipping.",
-                    self._ios.Severity.WARNING)
-                skipped_rows +=1
-                continue
+        flagged_rows, duplicate, skipped_rows = self._flag_rows(ctran_df, progress, report)
+        report.count("skipped_rows", skipped_rows)
+        self._check_skipped_rows(skipped_rows, restart)
 
-            flags = set()
-            for flagger in flaggers:
-                try:
-                    # Duplicate flagger requires a special call later on,
-                    # independent of this loop.
-                    if flagger.name == "Duplicate":
-                        duplicate = flagger
-                    else:
-                        flags.update(flagger.flag(row, config))
-                except Exception as e:
-                    self._ios.log_and_print(
-                        "Error in flagger {}. Skipping.\n{}".format(flagger.name, e),
-                        self._ios.Severity.WARNING)
-
-            date = row["service_date"]
-            date = "".join([str(date.year), "/", str(date.month), "/", str(date.day)])
-            for flag in flags:
-                flagged_rows.append([
-                    row_id,
-                    service_key,
-                    int(flag),
-                    date
-                ])
-            progress_bar.next()
-
-        progress_bar.finish()
         # Duplicate flagger requires a special call later on, independent of
-        # the primary loop.
+        # the other flaggers.
         if duplicate is not None:
             self._ios.log_and_print("Checking for duplicates.")
-            flagged_rows.extend(self._flag_duplicates(ctran_df, duplicate))
+            self._stage("dedupe", progress, report, len(ctran_df.index))
+            from flaggers.duplicate import row_hashes
+            hashes = row_hashes(ctran_df)
+            duplicate_rows = self._flag_duplicates(ctran_df, duplicate, hashes=hashes)
+            duplicate_rows.extend(self._flag_history_duplicates(ctran_df, duplicate_rows, hashes))
+            report.count("duplicates", len(duplicate_rows))
+            flagged_rows.extend(duplicate_rows)
         else:
             self._ios.log_and_print(
                 "This run is not checking for duplicates.",
                 self._ios.Severity.WARNING)
+        progress.advance(len(ctran_df.index))
+
+        self._stage("write", progress, report, len(flagged_rows))
+        report.count("flags", len(flagged_rows))
+        replace_range = (start_date, end_date) if replace else None
+        # Late rows are added to the days already saved, like the upserts.
+        merge = not replace and (after_row_id is not None or self._upsert)
+        if not self._save_output(flagged_rows, csv_service_keys, replace_range=replace_range,
+                                 merge=merge):
+            self._ios.log_and_print(
+                "The flags could not be saved, no watermark is recorded.",
+                self._ios.Severity.ERROR)
+            return None
+        self.watermarks.record(ctran_df)
+        progress.advance(len(ctran_df.index))
 
-        self._save_output(flagged_rows, csv_service_keys)
+        self._ios.log_and_print("Done executing the pipeline.")
+
+        return len(ctran_df.index)
+
+    ###########################################################
+
+    # Streaming version of _process_data, used when stream_chunksize is set.
+    # CTran data is read through a server-side cursor stream_chunksize rows at
+    # a time, and each chunk is flagged and saved before the next is read, so
+    # memory use does not grow with the date range. Each chunk is written in
+    # its own transaction; if a later chunk fails, earlier chunks stay saved.
+    # Watermarks are only recorded once every chunk is saved: chunks are
+    # ordered by service_date, not row_id, so a partial run could otherwise
+    # move the watermark past rows that were never processed.
+    # The number of rows is not known up front, so progress only reports the
+    # rows done and the throughput.
+    # Parquet output is staged chunk by chunk in the run's own staging
+    # directory and only published, a whole day at a time, once every chunk
+    # is saved. A failed or interrupted run leaves the published days as they
+    # were.
+    def _process_data_stream(self, start_date, end_date, restart=False, after_row_id=None,
+                             progress=None, report=None, allow_empty=False, staging=None):
+        if self._output_type == "parquet" and staging is None:
+            staging = self.flagged.parquet_staging(self._output_path)
+            try:
+                return self._process_data_stream(start_date, end_date, restart, after_row_id,
+                                                 progress, report, allow_empty, staging)
+            finally:
+                self.flagged.discard_parquet_staging(staging)
+
+        chunksize = self._settings.stream_chunksize
+        self._ios.log_and_print(
+            "Streaming CTran data in chunks of {} rows.".format(chunksize))
+        if progress is None:
+            progress = Progress(enabled=False)
+        if report is None:
+            report = RunReport()
+        self._stage("extract", progress, report)
+
+        if after_row_id is None:
+            chunks = self.ctran.query_date_range_chunks(start_date, end_date, chunksize)
+        else:
+            chunks = self.ctran.query_new_rows_chunks(after_row_id, chunksize)
+
+        csv_service_keys = []
+        skipped_rows = 0
+        chunk_count = 0
+        row_count = 0
+        saved = False
+        all_saved = True
+        watermarks = {}
+        # Late rows are added to the days already saved.
+        merge = after_row_id is not None or self._upsert
+        carry = None
+        for ctran_df in chunks:
+            chunk_count += 1
+            row_count += len(ctran_df.index)
+            self._ios.log_and_print(
+                "Processing chunk {} ({} rows).".format(chunk_count, len(ctran_df.index)))
+
+            for date in ctran_df["service_date"].drop_duplicates():
+                if not date in csv_service_keys:
+                    csv_service_keys.append(date)
+
+            report.count("rows", len(ctran_df.index))
+            flagged_rows, duplicate, skipped = self._flag_rows(ctran_df, progress, report)
+            skipped_rows += skipped
+            report.count("skipped_rows", skipped)
+            self._check_skipped_rows(skipped_rows, restart)
+
+            if duplicate is not None:
+                self._stage("dedupe", progress, report, len(ctran_df.index))
+                from flaggers.duplicate import row_hashes
+                hashes = row_hashes(ctran_df)
+                duplicate_rows, carry = self._flag_duplicates_stream(ctran_df, duplicate, carry, hashes)
+                duplicate_rows.extend(self._flag_history_duplicates(ctran_df, duplicate_rows, hashes))
+                report.count("duplicates", len(duplicate_rows))
+                flagged_rows.extend(duplicate_rows)
+
+            self._stage("write", progress, report, len(flagged_rows))
+            report.count("flags", len(flagged_rows))
+            if flagged_rows:
+                all_saved = self._save_output(flagged_rows, csv_service_keys, append=saved,
+                                              merge=merge, staging=staging) and all_saved
+                saved = True
+            progress.advance(len(ctran_df.index))
+            self._stage("extract", progress, report)
+            for service_date, row_id in self.watermarks.max_row_ids(ctran_df).items():
+                watermarks[service_date] = max(row_id, watermarks.get(service_date, row_id))
+
+        if chunk_count == 0 and after_row_id is not None:
+            self._ios.log_and_print("There are no new CTran rows to process.")
+            return 0
+
+        if chunk_count == 0 and allow_empty:
+            self._ios.log_and_print("There are no CTran rows for the supplied dates.")
+            self._record_empty_days(start_date, end_date)
+            return 0
+
+        if chunk_count == 0:
+            self._ios.log_and_print(
+                "The supplied dates were unable to be gathered from CTran data.",
+                self._ios.Severity.ERROR)
+            return None
+
+        if carry is None:
+            self._ios.log_and_print(
+                "This run is not checking for duplicates.",
+                self._ios.Severity.WARNING)
+
+        if not saved:
+            all_saved = self._save_output([], csv_service_keys, merge=merge)
+        elif staging is not None and all_saved:
+            # Days without flags in their chunks still replace their files.
+            all_saved = self.flagged.publish_parquet(
+                self._output_path, csv_service_keys, staging, merge)
+        elif staging is not None:
+            self._ios.log_and_print(
+                "Some chunks could not be saved, the parquet files are left as they were.",
+                self._ios.Severity.ERROR)
+
+        if not all_saved:
+            self._ios.log_and_print(
+                "Some flags could not be saved, no watermark is recorded.",
+                self._ios.Severity.ERROR)
+            return None
+        self.watermarks.write_table(list(map(list, watermarks.items())))
 
         self._ios.log_and_print("Done executing the pipeline.")
 
-        return True
+        return row_count
+
+    # Record a watermark of 0 for every day between start_date and end_date
+    # found without CTran rows, so backfill knows they were processed. Rows
+    # arriving later still have a higher row_id. Today may still receive
+    # rows, so it is left without a watermark.
+    def _record_empty_days(self, start_date, end_date):
+        if start_date is None or end_date is None:
+            return
+        start_date = pandas.Timestamp(start_date).date()
+        end_date = min(pandas.Timestamp(end_date).date(),
+                       datetime.now().date() - timedelta(days=1))
+        if end_date < start_date:
+            return
+        self.watermarks.write_table([[start_date + timedelta(days=i), 0]
+                                     for i in range((end_date - start_date).days + 1)])
 
     ###########################################################
 
     # This method will process all days since the latest processed day.
+    # Once a watermark is recorded, it processes every CTran row added since
+    # the last run instead, including late rows of days already processed.
     def process_since_checkpoint(self):
-        start_date = self.flagged.get_latest_day()
+        watermark = self.watermarks.get_watermark()
+        if watermark is not None:
+            return self._process_new_rows(watermark)
+
+        start_date = self._get_latest_day()
         if start_date is None:
             self._ios.log_and_print(
                 "No prior date processed; cannot continue from the last processed day.",
@@ -241,10 +659,123 @@ class _Client():
         return self.process_data(start_date, end_date)
 
     ###########################################################
+
+    # Like process_since_checkpoint, but every service day is processed
+    # separately, up to workers days at a time (defaults to the
+    # backfill_workers config value). Each day is committed on its own, so a
+    # failed day does not stop the others. Returns True iff every day
+    # succeeded.
+    # Every day since the first watermark that has none is processed, so a
+    # day that failed is retried by the next backfill even if later days
+    # succeeded. Without any watermark, the days after the latest processed
+    # day are.
+    def backfill(self, workers=None):
+        self._snapshot_config()
+        days = self._backfill_days()
+        if days is None:
+            self._ios.log_and_print(
+                "No prior date processed; cannot continue from the last processed day.",
+                self._ios.Severity.ERROR)
+            return False
+
+        if not workers:
+            workers = self._settings.backfill_workers or 1
+
+        if not days:
+            self._ios.log_and_print("There are no days to backfill.")
+            return True
+
+        self._ios.log_and_print("Backfilling {} days from {} until {} with {} workers.".format(
+            len(days), days[0], days[-1], workers))
+
+        # Resolve the service periods up front: concurrent days falling in a
+        # new service period would otherwise race to insert it.
+        self.service_periods.resolve(days)
+
+        results = {}
+        report = RunReport("backfill")
+        profiler = self._start_profiler(report.run)
+        parallel_flagger = self._start_parallel_flagger()
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor, \
+                    self._new_progress(total=len(days), unit="days") as progress:
+                progress.stage("backfill")
+                futures = {executor.submit(self._backfill_day, day, report): day for day in days}
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+                    progress.advance()
+        finally:
+            self._stop_parallel_flagger(parallel_flagger)
+            report.finish(len(results) == len(days) and
+                          all(rows is not None for rows, _ in results.values()))
+            self._stop_profiler(profiler)
+            self._write_report(report)
+
+        self._ios.log_and_print("Backfill summary:")
+        for day in days:
+            rows, seconds = results[day]
+            if rows is None:
+                self._ios.log_and_print(
+                    "{}: failed after {:.1f}s.".format(day, seconds),
+                    self._ios.Severity.WARNING)
+            else:
+                self._ios.log_and_print("{}: {} rows in {:.1f}s ({:.0f} rows/sec).".format(
+                    day, rows, seconds, rows / seconds if seconds else 0))
+        self.log_pool_stats()
+
+        return all(rows is not None for rows, _ in results.values())
+
+    # Return the days backfill processes until today, None if no day was
+    # processed yet or on failure.
+    def _backfill_days(self):
+        end_date = datetime.now().date()
+        done = self.watermarks.get_days()
+        if done:
+            start_date = done[0]
+        else:
+            start_date = self._get_latest_day()
+            if start_date is None:
+                return None
+            self._ios.log_and_print("Last processed day: " + str(start_date))
+            start_date = start_date + timedelta(days=1)
+
+        done = set(done or [])
+        days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        return [day for day in days if day not in done]
+
+    # Process a single day for backfill. Returns the number of rows processed
+    # (0 for a day without CTran rows yet, None on failure) and the seconds
+    # it took. The day's timings and counters are added to report.
+    def _backfill_day(self, day, report):
+        started = time.time()
+        day_report = RunReport(str(day))
+        try:
+            # Days run concurrently, only the whole backfill reports progress.
+            rows = self._process_data(day, day, progress=Progress(enabled=False),
+                                      report=day_report, allow_empty=True)
+        except Exception as err:
+            self._ios.log_and_print(
+                "Error while processing {}: ".format(day), self._ios.Severity.ERROR, err)
+            rows = None
+        if self._profiler is not None:
+            # End the day's last stage on this thread.
+            self._profiler.stage(None)
+        day_report.finish(rows is not None)
+        report.merge(day_report)
+
+        return rows, time.time() - started
+
+    ###########################################################
     
     # This method will process the next day after the latest processed day.
+    # Once a watermark is recorded, it processes every CTran row added since
+    # the last run instead, like process_since_checkpoint.
     def process_next_day(self, restart=False):
-        start_date = self.flagged.get_latest_day()
+        watermark = self.watermarks.get_watermark()
+        if watermark is not None:
+            return self._process_new_rows(watermark, restart)
+
+        start_date = self._get_latest_day()
         if start_date is None:
             msg = "".join([
                 "An error occured while attempting to find the last processed day. ",
@@ -265,6 +796,49 @@ class _Client():
 
     ###########################################################
 
+    # Process every CTran row with a row_id above watermark.
+    def _process_new_rows(self, watermark, restart=False):
+        self._ios.log_and_print("Processing CTran rows after row_id " + str(watermark) + ".")
+        processed = self._process_data(None, None, restart, after_row_id=watermark) is not None
+        self.log_pool_stats()
+        return processed
+
+    # Return the latest processed day. The watermarks table is much smaller
+    # than flagged_data, which is only used before any watermark is recorded.
+    def _get_latest_day(self):
+        latest_day = self.watermarks.get_latest_day()
+        if latest_day is None:
+            latest_day = self.flagged.get_latest_day()
+        return latest_day
+
+    ###########################################################
+
+    # Remove the cached ctran_data of the service dates between start_date and
+    # end_date, inclusive, so they are read from Portal again. Either date can
+    # be None for no bound; with no dates, the user is prompted for them.
+    def invalidate_cache(self, start_date=None, end_date=None, prompt=True):
+        self._set_ctran_cache()
+        cache = self.ctran.get_cache()
+        if cache is None:
+            self._ios.log_and_print("The ctran_data cache is not enabled.", self._ios.Severity.WARNING)
+            return False
+
+        if prompt and start_date is None and end_date is None:
+            self._ios.print(
+                "Please input a date range. If either or both fields are empty,"\
+                " it will be treated as the beginning or time, or the end of"\
+                " time, respectively. Note that dates are INCLUSIVE.")
+            start_date, end_date = self._get_date_range(None, allow_empty=True)
+        if start_date is not None:
+            start_date = pandas.Timestamp(start_date).date()
+        if end_date is not None:
+            end_date = pandas.Timestamp(end_date).date()
+
+        cache.invalidate(start_date, end_date)
+        return True
+
+    ###########################################################
+
     def delete_flagged_range(self):
         self.print(
             "Please input a date range. If either or both fields are empty,"\
@@ -279,8 +853,15 @@ class _Client():
 
     ###########################################################
 
+    # With write_mode "upsert" the range is overwritten in place; otherwise its
+    # flags are deleted and the range is processed again.
     def reprocess(self, start_date=None, end_date=None):
+        self._snapshot_config()
         start_date, end_date = self._get_date_range(start_date, end_date)
+        if self._upsert and not self._settings.stream_chunksize:
+            self._ios.log_and_print("Reprocessing in place.")
+            return self._process_data(start_date, end_date, replace=True) is not None
+
         if not self.flagged.delete_date_range(start_date, end_date):
             msg = "".join([
                 "An error occured while attempting to delete the data in the ",
@@ -318,6 +899,20 @@ class _Client():
             for flag in self._flag_lookup.keys():
                 ios.print(flag)
 
+    # Upsert every flag into the flags table once per client, before the
+    # first flagged_data write: flagged_data.flag_id references it, and flags
+    # added since the hive was created (e.g. the Bounds flags) are otherwise
+    # missing, which fails the whole write.
+    def _write_flags(self):
+        if self._flags_written:
+            return
+        if self.flags.write_flags():
+            self._flags_written = True
+        else:
+            self._ios.log_and_print(
+                "Could not write the flags table, new flags cannot be saved.",
+                self._ios.Severity.WARNING)
+
     ###########################################################
 
     # Query the database for all present flag-types. This information is made available
@@ -343,39 +938,198 @@ class _Client():
 
     #######################################################
 
-    def _flag_duplicates(self, df, duplicate_instance):
-        """ Order of fields.
-            index:  row_id
-            field0: service_key
-            field1: date
-            field2: flag
-        """
-        dup_df = None
+    # Resolve the service keys of ctran_df and run the flaggers over every row
+    # that has one. Returns the flagged rows, the Duplicate flagger (or None),
+    # and the number of rows skipped for lack of a service_key.
+    def _flag_rows(self, ctran_df, progress=None, report=None):
+        if progress is None:
+            progress = Progress(enabled=False)
+        if report is None:
+            report = RunReport()
+        self._stage("service-key", progress, report, len(ctran_df.index))
+        service_keys = self._get_service_keys(ctran_df)
+
+        # If this fails, it's very likely a sqlalchemy error.
+        # e.g. not able to connect to db.
+        skipped = service_keys.isna().to_numpy()
+        skipped_rows = int(skipped.sum())
+        if skipped_rows:
+            self._ios.log_and_print(
+                "Cannot find or create new service_key for {} rows, skipping.".format(skipped_rows),
+                self._ios.Severity.WARNING)
+
+        self._stage("flag", progress, report, len(ctran_df.index) - skipped_rows)
+        flagged_rows, duplicate = self._flag_frame(ctran_df[~skipped], service_keys[~skipped],
+                                                   report)
+        return flagged_rows, duplicate, skipped_rows
+
+    #######################################################
+
+    def _check_skipped_rows(self, skipped_rows, restart):
+        if restart:
+            if self._settings.max_skipped_rows:
+                if skipped_rows > self._settings.max_skipped_rows:
+                    msg = self._ios.log_and_print(
+                        "Exceeded maximum number of skipped service rows.",
+                        self._ios.Severity.DEBUG)
+                    restarter.critical_error(msg)
+
+    #######################################################
+
+    # Resolve the service_key of every row of df in one call. Returns a Series
+    # aligned with df; rows whose service_key could not be found or created
+    # are NaN.
+    def _get_service_keys(self, df):
+        return self.service_periods.resolve(df["service_date"])
+
+    #######################################################
+
+    # Run every flagger except Duplicate over the whole frame and return the
+    # flagged rows, ordered by row then flag_id, along with the Duplicate
+    # flagger if it is registered.
+    # Flags raised by more than one flagger for the same row are only
+    # reported once. The time and flags of each flagger are added to report,
+    # if given.
+    def _flag_frame(self, df, service_keys, report=None):
+        duplicate = None
+        for flagger in flaggers:
+            if flagger.name == "Duplicate":
+                duplicate = flagger
+
+        timings = {}
+        if self._parallel_flagger is not None:
+            masks, errors = self._parallel_flagger.flag_frame(df, self._settings, timings)
+        else:
+            from src.parallel import collect_masks
+            masks, errors = collect_masks(flaggers, df, self._settings, timings)
+        if report is not None:
+            report.add_flaggers(timings)
+
+        for name, err in errors:
+            self._ios.log_and_print(
+                "Error in flagger {}. Skipping.\n{}".format(name, err),
+                self._ios.Severity.WARNING)
+
+        if not masks:
+            return [], duplicate
+
+        positions = []
+        flag_ids = []
+        for flag, mask in masks.items():
+            hits = numpy.flatnonzero(mask)
+            positions.append(hits)
+            flag_ids.append(numpy.full(len(hits), int(flag)))
+        positions = numpy.concatenate(positions)
+        flag_ids = numpy.concatenate(flag_ids)
+
+        order = numpy.lexsort((flag_ids, positions))
+        positions = positions[order]
+        flag_ids = flag_ids[order]
+
+        row_ids = df.index.to_numpy()[positions].tolist()
+        keys = service_keys.to_numpy()[positions].tolist()
+        dates = df["service_date"].map(self._format_date).to_numpy()[positions].tolist()
+
+        flagged_rows = [
+            [row_id, int(key), flag_id, date]
+            for row_id, key, flag_id, date
+            in zip(row_ids, keys, flag_ids.tolist(), dates)]
+
+        return flagged_rows, duplicate
+
+    #######################################################
+
+    def _format_date(self, date):
+        return "".join([str(date.year), "/", str(date.month), "/", str(date.day)])
+
+    #######################################################
+
+    # Returns the flagged rows of the duplicates found by duplicate_instance
+    # in df. seen and hashes are passed on to Duplicate.find.
+    def _flag_duplicates(self, df, duplicate_instance, seen=None, hashes=None):
         try:
-            dup_df = duplicate_instance.flag(df, config)
+            row_ids, service_dates = duplicate_instance.find(df, seen, hashes)
         except ValueError as err:
             self._ios.log_and_print("", self._ios.Severity.ERROR, err)
             return []
 
-        dup_df.insert(0, "service_key", 0)
-        dup_df["service_key"] = dup_df["service_date"].apply(
-            lambda date: self.service_periods.query_or_insert(date))
+        return self._duplicate_rows(row_ids, service_dates)
+
+    #######################################################
+
+    # Turn arrays of row_ids and service_dates into flagged rows, skipping
+    # the rows without a service_key.
+    def _duplicate_rows(self, row_ids, service_dates):
+        dup_df = pandas.DataFrame({"service_date": service_dates}, index=row_ids)
+        service_keys = self._get_service_keys(dup_df)
+        valid = service_keys.notna().to_numpy()
+        if not valid.any():
+            return []
+
+        dates = dup_df["service_date"][valid]
+        formatted = {date: self._format_date(date) for date in dates.drop_duplicates()}
+        return [[row_id, service_key, flag_enums.DUPLICATE, formatted[date]]
+                for row_id, service_key, date in zip(
+                    dup_df.index[valid].tolist(),
+                    service_keys[valid].astype("int64").tolist(),
+                    dates)]
+
+    #######################################################
+
+    # Duplicate check for one chunk of a streamed run. carry is None on the
+    # first chunk, then whatever the previous call returned: the Seen_Rows of
+    # the last service_date, so duplicates split across chunks are found.
+    # Returns the new duplicate rows and the carry for the next chunk.
+    def _flag_duplicates_stream(self, df, duplicate_instance, carry=None, hashes=None):
+        if carry is None:
+            from flaggers.duplicate import Seen_Rows
+            carry = Seen_Rows()
+
+        return self._flag_duplicates(df, duplicate_instance, carry, hashes), carry
+
+    #######################################################
+
+    # Duplicate check against the rows processed in earlier runs, when the
+    # row history is enabled. Flags both the rows of df and the earlier rows
+    # they duplicate. Rows already in duplicate_rows are not flagged again.
+    def _flag_history_duplicates(self, df, duplicate_rows, hashes=None):
+        row_history = self._get_row_history()
+        if row_history is None:
+            return []
+
+        reported = set(row[0] for row in duplicate_rows)
+        matches = row_history.check(df, self._get_service_keys(df), reported, hashes)
 
-        dup_df.insert(1, "flag_id", 1)
-        dup_df["flag_id"] = flag_enums.DUPLICATE
+        history_rows = []
+        flagged = set(reported)
+        for row_id, first_row_id, service_key, service_date in matches:
+            service_date = self._format_date(service_date)
+            for flagged_id in (row_id, first_row_id):
+                if flagged_id not in flagged:
+                    flagged.add(flagged_id)
+                    history_rows.append([flagged_id, service_key, flag_enums.DUPLICATE, service_date])
 
-        dup_df["service_date"] = dup_df["service_date"].apply(
-            lambda date: "".join([str(date.year), "/", str(date.month), "/", str(date.day)]))
+        if history_rows:
+            self._ios.log_and_print(
+                "{} rows duplicate rows of earlier runs.".format(len(matches)))
+        return history_rows
 
-        indices = dup_df.index.tolist()
-        values = dup_df.values.tolist()
-        dup_list = []
-        for i in range(len(indices)):
-            temp = [indices[i]]
-            temp.extend(values[i])
-            dup_list.append(temp)
+    ###########################################################
 
-        return dup_list
+    # Log the state of every connection pool.
+    def log_pool_stats(self):
+        for stats in engines.stats():
+            if stats["size"] is None:
+                self._ios.log_and_print("".join([
+                    "Connection pool ", stats["url"], ": ", stats["pool"],
+                    ", no connection counts."]))
+                continue
+            self._ios.log_and_print("".join([
+                "Connection pool ", stats["url"], ": ",
+                str(stats["checked_out"]), " in use, ",
+                str(stats["checked_in"]), " idle, ",
+                str(stats["overflow"]), " overflow (pool size ",
+                str(stats["size"]), ")."]))
 
     ###########################################################
 
@@ -390,6 +1144,7 @@ class _Client():
         options = [
             _Option("(or ctrl-d) Exit.", lambda: "Exit"),
             _Option("Print engine.", lambda: print(self.flagged.get_engine())),
+            _Option("Print connection pool stats.", self.log_pool_stats),
             _Option("[dev tool] Create aperture schema [dev tool].", self.ctran.create_schema),
             _Option("[dev tool] Delete aperture schema [dev tool].", self.ctran.delete_schema),
             _Option("[dev tool] Create mock ctran_data table [dev tool].", self.ctran.create_table),
@@ -399,9 +1154,12 @@ class _Client():
             _Option("Create flagged_data table.", self.flagged.create_table),
             _Option("Create flags table.", self.flags.create_table),
             _Option("Create service_periods table.", self.service_periods.create_table),
+            _Option("Create watermarks table.", self.watermarks.create_table),
+            _Option("Create row_hashes table.", self.row_hashes.create_table),
             _Option("Delete flagged_data table.", self.flagged.delete_table),
             _Option("Delete service_periods table.", self.flags.delete_table),
-            _Option("Query ctran_data and print ctran_data.info().", ctran_info)
+            _Option("Query ctran_data and print ctran_data.info().", ctran_info),
+            _Option("Invalidate cached ctran_data in date range.", self.invalidate_cache)
         ]
 
         return self._menu("This is the Database Operations sub-menu.", options)
@@ -518,22 +1276,49 @@ class _Client():
             self._output_type = "both"
             print("Output will be saved to aperture AND csv's")
 
+        def change_to_parquet():
+            self._output_type = "parquet"
+            print("Output will be saved to parquet files")
+
         options = [
            _Option("(or ctrl-d) Exit.", lambda: "Exit"),
            _Option("Check current output type.", lambda: print("Current output type: " + self._output_type)),
            _Option("Check current output path.", lambda: print("Current output path: " + self._output_path)),
            _Option("Change output to Aperture.", change_to_aperture),
            _Option("Change output to CSV's.", change_to_csv),
-           _Option("Change output to Aperture AND CSV's.", change_to_both)
+           _Option("Change output to Aperture AND CSV's.", change_to_both),
+           _Option("Change output to Parquet files.", change_to_parquet)
         ]
 
         return self._menu("This is output type sub-menu.", options)
 
-    def _save_output(self, flagged_rows, csv_service_keys):
+    # If append is True, flagged_rows are added to the flagged_data csv
+    # written by an earlier call of the same run.
+    # If replace_range is a (start_date, end_date) tuple, flagged_rows replace
+    # the flags stored for that range.
+    # If merge is True, flagged_rows are added to the parquet files of their
+    # days instead of replacing them.
+    # staging is the parquet staging directory of a streamed run, see
+    # Flagged_Data.write_parquet.
+    # Returns True if every output was saved.
+    def _save_output(self, flagged_rows, csv_service_keys, append=False, replace_range=None,
+                     merge=False, staging=None):
+        saved = True
         if self._output_type == "aperture" or self._output_type == "both":
-            self.flagged.write_table(flagged_rows)
+            self._write_flags()
+            if replace_range is not None:
+                saved = self.flagged.replace_date_range(flagged_rows, *replace_range)
+            else:
+                # Nothing to write is not a failure.
+                saved = self.flagged.write_table(flagged_rows, upsert=self._upsert) or not flagged_rows
 
         if self._output_type == "csv" or self._output_type == "both":
             self.flags.write_csv(self._output_path)
-            self.flagged.write_csv(self._output_path, flagged_rows)
-            self.service_periods.write_csv(self._output_path, csv_service_keys)
\ No newline at end of file
+            saved = self.flagged.write_csv(self._output_path, flagged_rows, append) and saved
+            self.service_periods.write_csv(self._output_path, csv_service_keys)
+
+        if self._output_type == "parquet":
+            saved = self.flagged.write_parquet(
+                self._output_path, flagged_rows, csv_service_keys, merge, staging)
+
+        return saved
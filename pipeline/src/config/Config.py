@@ -15,20 +15,51 @@ class BoundsResult(Enum):
 class Config:
     def __init__(self):
         self._data = {}
+        self._filename = None
+        self._read_env_data = False
+        self._mtime = None
+        self._snapshot = None
+
     def load(self, filename=CONFIG_FILENAME, read_env_data=False, debug=False):
         self._filename = filename
+        self._read_env_data = read_env_data
 
         try:
+            mtime = os.path.getmtime(self._filename)
             with open(self._filename) as f:
                 self._data = json.load(f)
-        except (FileNotFoundError, ValueError):
+        except (OSError, ValueError):
             return False
 
         if read_env_data:
             self._ingest_env()
 
+        self._mtime = mtime
+        self._snapshot = None
         return True
 
+    def reload_if_changed(self):
+        # Load the file again if it was modified since it was loaded, e.g.
+        # from the UI. Values changed with set_value() are then lost.
+        # Returns True if it was reloaded.
+        if self._filename is None:
+            return False
+        try:
+            mtime = os.path.getmtime(self._filename)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        return self.load(self._filename, self._read_env_data)
+
+    def snapshot(self):
+        # Frozen, typed copy of the current values, see ConfigSnapshot. The
+        # same copy is returned until the values change.
+        from .ConfigSnapshot import ConfigSnapshot
+        if self._snapshot is None:
+            self._snapshot = ConfigSnapshot(self._data)
+        return self._snapshot
+
     def _ingest_env(self):
         if "PORTAL_USER" in os.environ:
             self._data["portal_user"] = os.environ["PORTAL_USER"]
@@ -79,6 +110,7 @@ class Config:
     def set_value(self, name, val):
         if not name == 'columns':
             self._data[name] = val
+            self._snapshot = None
 
     def get_value(self, name):
         if not name == 'columns':
@@ -87,46 +119,26 @@ class Config:
             else: 
                 return None
 
+    def get_values(self):
+        # A copy of every top level value.
+        return dict(self._data)
+
     def set_bounds(self, column_name, min, max):
         self._data['columns'][column_name] = {'min' : min, 'max' : max}
+        self._snapshot = None
+
+    def get_columns(self):
+        # Returns a copy of the whole "columns" section.
+        return {name: dict(bounds) for name, bounds in self._data.get('columns', {}).items()}
 
     def get_bounds(self, column_name):
         if column_name in self._data['columns']:
             return self._data['columns'][column_name]
 
     def check_bounds(self, column_name, val):
-        if column_name in self._data["columns"]:
-            col = self._data["columns"][column_name]
-
-            col_max = None
-            col_min = None
-
-            if self._is_date(val):
-                val = parse(val)
-                if 'max' in col:
-                    if not self._is_na(col['max']):
-                        col_max = parse(col['max'])
-                if 'min' in col:
-                    if not self._is_na(col['min']):
-                        col_min = parse(col['min'])
-            else:
-                if 'max' in col:
-                    if not self._is_na(col['max']):
-                        col_max = col['max']
-                if 'min' in col:
-                    if not self._is_na(col['min']):
-                        col_min = col['min']
-                        
-            if 'max' in col:
-                if not self._is_na(col['max']):
-                    if val > col_max:
-                        return BoundsResult.MAX_ERROR
-            if 'min' in col:
-                if not self._is_na(col['min']):
-                    if val < col_min:
-                        return BoundsResult.MIN_ERROR
-
-        return BoundsResult.VALID
+        # Bounds are parsed once per snapshot rather than on every call.
+        return self.snapshot().check_bounds(column_name, val)
+
     def save(self, new_filename=""):
         if not new_filename:
             new_filename = self._filename
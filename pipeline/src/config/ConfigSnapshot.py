@@ -0,0 +1,120 @@
+import copy
+from dateutil.parser import parse, ParserError
+
+from .Config import BoundsResult
+
+
+# Type and default of the values read while a run is going on. A value missing
+# from the config, or null, gets the default.
+RUN_VALUES = {
+    "max_skipped_rows": (int, None),
+    "unobserved_stop_distance": (float, 50.0),
+    "parallel_workers": (int, 1),
+    "parallel_min_partition_rows": (int, 10000),
+    "stream_chunksize": (int, 0),
+    "backfill_workers": (int, 1),
+    "progress_interval": (float, 1.0),
+    "progress_log_interval": (float, 60.0),
+    "report_path": (str, "output/"),
+    "prometheus_textfile": (str, ""),
+}
+
+
+class ConfigSnapshot:
+    """
+    Frozen copy of a Config, taken by Config.snapshot() at the start of a run
+    so the run sees the same values from start to end, whatever happens to
+    the file meanwhile.
+
+    The RUN_VALUES are attributes converted to their type, with their default
+    applied, e.g. snapshot.unobserved_stop_distance. The bounds of the
+    "columns" section are parsed once, dates included. get_value(),
+    get_columns() and check_bounds() work as Config's do, so a snapshot can be
+    given to the flaggers in place of the Config.
+    """
+
+    # Flaggers may cache what they derive from a frozen config by identity.
+    frozen = True
+
+    def __init__(self, data):
+        data = copy.deepcopy(data)
+        values = {}
+        for name, (kind, default) in RUN_VALUES.items():
+            value = data.get(name)
+            if value is None:
+                values[name] = default
+                continue
+            try:
+                values[name] = kind(value)
+            except (TypeError, ValueError):
+                raise ValueError("Invalid {} in the config: {!r}, {} expected.".format(
+                    name, value, kind.__name__))
+
+        columns = data.get("columns") or {}
+        bounds = {column: (_parse_bound(limits.get("min")), _parse_bound(limits.get("max")))
+                  for column, limits in columns.items()}
+
+        object.__setattr__(self, "_data", data)
+        object.__setattr__(self, "_values", values)
+        object.__setattr__(self, "_columns", columns)
+        object.__setattr__(self, "_bounds", bounds)
+
+    def __getattr__(self, name):
+        # Only called for names that are not regular attributes.
+        values = self.__dict__.get("_values", {})
+        if name in values:
+            return values[name]
+        raise AttributeError("ConfigSnapshot has no value " + repr(name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ConfigSnapshot is frozen, set values on the Config instead.")
+
+    def get_value(self, name):
+        if name == "columns":
+            return None
+        if name in self._values:
+            return self._values[name]
+        return copy.deepcopy(self._data.get(name))
+
+    def get_columns(self):
+        # Returns a copy of the whole "columns" section.
+        return {name: dict(bounds) for name, bounds in self._columns.items()}
+
+    def get_bounds(self, column_name):
+        if column_name in self._columns:
+            return dict(self._columns[column_name])
+
+    def get_parsed_bounds(self):
+        # Returns a dict of column name: (min, max) of the "columns" section,
+        # parsed like check_bounds() compares them: None when not bounded that
+        # way, a datetime for dates.
+        return dict(self._bounds)
+
+    def check_bounds(self, column_name, val):
+        # Same results as Config.check_bounds, with the bounds parsed once.
+        if column_name not in self._bounds:
+            return BoundsResult.VALID
+
+        col_min, col_max = self._bounds[column_name]
+        if isinstance(val, str):
+            try:
+                val = parse(val)
+            except ParserError:
+                pass
+        if col_max is not None and val > col_max:
+            return BoundsResult.MAX_ERROR
+        if col_min is not None and val < col_min:
+            return BoundsResult.MIN_ERROR
+        return BoundsResult.VALID
+
+
+def _parse_bound(value):
+    # None when the column is not bounded that way, a datetime for dates.
+    if value is None or str(value).lower() in ("na", "n/a", ""):
+        return None
+    if isinstance(value, str):
+        try:
+            return parse(value)
+        except ParserError:
+            return value
+    return value
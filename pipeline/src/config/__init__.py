@@ -1,5 +1,6 @@
 
 from .Config import BoundsResult
 from .Config import Config
+from .ConfigSnapshot import ConfigSnapshot
 
 config = Config()
@@ -1,4 +1,5 @@
 import sys
+import json
 import argparse
 from datetime import datetime
 from ..ios import ios
@@ -6,11 +7,36 @@ from ..ios import ios
 
 class ArgInterface:
 
+    def main(self, args):
+        # Parse args before creating the client, so --help, invalid arguments
+        # and --show-config return without importing pandas or SQLAlchemy.
+        # Returns the client, or None if none was created.
+        try:
+            parsed = self._parse_cl_args(args)
+        except ValueError:
+            raise SystemExit(2)
+
+        if parsed.show_config:
+            self._show_config()
+            return None
+
+        from ..client import _Client
+        client = _Client()
+        self.query_with_args(client, parsed)
+        return client
+
     def query_with_args(self, client, args):
-        ctran = client.ctran
+        # args: the command line arguments, or the Namespace parsed from them.
         flagged = client.flagged
         try:
-            args = self._parse_cl_args(args)
+            if not isinstance(args, argparse.Namespace):
+                args = self._parse_cl_args(args)
+
+            if args.workers:
+                client.set_parallel_workers(args.workers)
+
+            if args.profile:
+                client.set_profiling(True)
 
             if args.flag:
                 query = args.flag
@@ -29,11 +55,20 @@ class ArgInterface:
 
             if args.select:
                 df = self._handle_flag_query(flagged, args)
+            elif args.show_config:
+                self._show_config()
+                return None
+            elif args.invalidate_cache:
+                client.invalidate_cache(args.date_start, args.date_end, prompt=False)
+                return None
             elif args.date_start:
                 df = self._handle_range_query(client, args)
             elif args.daily:
                 client.process_next_day(restart=True)
                 return None
+            elif args.backfill is not None:
+                client.backfill(args.backfill)
+                return None
             else:
                 ios.print("Insufficient arguments.")
                 return None
@@ -41,6 +76,18 @@ class ArgInterface:
             raise SystemExit(2)
         return df
 
+    def _show_config(self):
+        # Print the config the client would load, passwords hidden.
+        from ..config import config
+        if not config.load(read_env_data=True):
+            ios.log_and_print("The config could not be read.", ios.Severity.ERROR)
+            return
+        values = config.get_values()
+        for name in values:
+            if "passwd" in name and values[name]:
+                values[name] = "***"
+        ios.print(json.dumps(values, indent=2, sort_keys=True, default=str))
+
     def _parse_cl_args(self, args):
         parser = self._create_parser(args)
         return parser.parse_args(args)
@@ -102,6 +149,18 @@ class ArgInterface:
             ios.log_and_print(err_msg, ios.Severity.ERROR)
             raise argparse.ArgumentTypeError(err_msg)
 
+    def _workers(self, arg):
+        try:
+            workers = int(arg)
+            if workers > 0:
+                return workers
+            else:
+                raise ValueError
+        except ValueError:
+            err_msg = "Invalid number of workers: {0}, value must be at least 1.".format(arg)
+            ios.log_and_print(err_msg, ios.Severity.ERROR)
+            raise argparse.ArgumentTypeError(err_msg)
+
     def _create_parser(self, args):
         if args is None:
             raise SystemExit(2)
@@ -115,6 +174,11 @@ class ArgInterface:
                             help="Process data of the next unprocessed day. No arguments. This will restart on failure.",
                             required=self._is_present(args, None, "--daily") and len(args) == 1,
                             action="store_true")
+        parser.add_argument("--backfill",
+                            help="Process every unprocessed day since the last processed day, BACKFILL days at a time (default=backfill_workers in the config).",
+                            nargs="?",
+                            const=0,
+                            type=self._workers)
         parser.add_argument("--date-start",
                             help="Format: --date-start=YYYY-MM-DD (ex. 2020-01-01)",
                             required=not daily and not query and self._is_present(args, None, "--date-end"),
@@ -152,6 +216,20 @@ class ArgInterface:
                             help="Specify the service period of the row you wish to query flags for.",
                             required=not daily and query and row and not flag,
                             type=self._service_period)
+        parser.add_argument("--invalidate-cache",
+                            help="Remove the cached ctran_data of the days between --date-start and --date-end, or of every day without them.",
+                            action="store_true")
+        parser.add_argument("-w",
+                            "--workers",
+                            help="Number of processes used to flag data (default=parallel_workers in the config, or 1).",
+                            required=False,
+                            type=self._workers)
+        parser.add_argument("--show-config",
+                            help="Print the configuration, passwords hidden, without connecting to any database.",
+                            action="store_true")
+        parser.add_argument("--profile",
+                            help="Profile each stage of the run, and write the reports to the output directory.",
+                            action="store_true")
         return parser
 
     def _is_present(self, args, short, long):
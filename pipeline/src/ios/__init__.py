@@ -1,3 +1,5 @@
 from .ios import IOs
 
 ios = IOs()
+
+from .progress import Progress
@@ -1,5 +1,12 @@
+import atexit
 import datetime
+import gzip
 import os
+import queue
+import shutil
+import sys
+import threading
+import time
 from enum import Enum
 from datetime import date
 
@@ -11,12 +18,71 @@ class Severity(Enum):
     ERROR = 4
 
 
+# When the log file is fsync'd:
+#   always:   after every batch of lines written.
+#   error:    after a batch holding an ERROR line.
+#   interval: at most every fsync_interval_ms, and after ERROR lines.
+#   never:    left to the OS.
+FSYNC_POLICIES = ("always", "error", "interval", "never")
+
+# Lines written by the writer thread per write call, at most.
+_BATCH_SIZE = 1000
+
+
 class Logger:
+    # Lines are handed to a background thread through a queue and written in
+    # batches, so logging does not wait on the disk. The file is opened with
+    # O_APPEND and each batch is one write() of whole lines, so processes
+    # sharing the file do not interleave lines. Processes other than the one
+    # that started the logger (e.g. forked workers) write their lines
+    # directly, as they may exit without running atexit, and so do lines
+    # logged after the writer is stopped.
+
     def __init__(self):
         self.Severity = Severity
+        self._fd = None
+        self._path = None
+        self._owner = None
+        self._queue = None
+        self._writer = None
+        self._lock = threading.Lock()
+        self._fsync = "error"
+        self._fsync_interval = 1.0
+        self._max_bytes = 0
+        self._backups = 5
+        self._compress = True
+        atexit.register(self._close)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def configure(self, fsync=None, fsync_interval_ms=None, max_bytes=None, backups=None, compress=None):
+        # Change the durability and rotation of the log. Options given as
+        # None are left as they are.
+        #   fsync:             one of FSYNC_POLICIES.
+        #   fsync_interval_ms: time between fsyncs under "interval".
+        #   max_bytes:         size from which the file is rotated, 0 never.
+        #   backups:           rotated files kept, <file>.1 being the newest.
+        #   compress:          gzip rotated files.
+        if fsync is not None:
+            if fsync not in FSYNC_POLICIES:
+                raise ValueError("fsync must be one of " + ", ".join(FSYNC_POLICIES))
+            self._fsync = fsync
+        if fsync_interval_ms is not None:
+            self._fsync_interval = fsync_interval_ms / 1000
+        if max_bytes is not None:
+            self._max_bytes = max_bytes
+        if backups is not None:
+            self._backups = backups
+        if compress is not None:
+            self._compress = compress
 
     def start(self, filename='output/' + date.today().strftime('%Y-%m-%d') + '.txt'):
-        self._f = open(filename,'a+')
+        self._path = filename
+        self._owner = os.getpid()
+        self._fd = self._open()
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="log-writer", daemon=True)
+        self._writer.start()
 
     def log(self, message, severity=Severity.INFO):
         timestamp = datetime.datetime.now()
@@ -31,15 +97,150 @@ class Logger:
         elif severity == Severity.DEBUG:
             tag = '[DEBUG]'
 
-        self._f.write('{} ({}):   {}\n'.format(tag, timestamp, message))
-        self._f.flush()
-        os.fsync(self._f)
+        line = '{} ({}):   {}\n'.format(tag, timestamp, message)
+        if self._writer is not None and self._owner == os.getpid():
+            self._queue.put((line, severity))
+        else:
+            with self._lock:
+                self._write([line], severity == Severity.ERROR)
 
         if severity == Severity.INFO:
             return message
         else:
             return '{}: {}'.format(tag, message)
 
+    def flush(self):
+        # Block until every line logged so far is written and fsync'd.
+        if self._owner != os.getpid() or self._writer is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
+
     def stop(self):
         self.log('The logger is shutting down.', self.Severity.INFO)
-        self._f.close()
+        self._close()
+
+    ###########################################################################
+    # Private Methods
+
+    def _close(self):
+        # Write what is queued, then close the file. Also runs at exit.
+        if self._writer is not None and self._owner == os.getpid():
+            self._queue.put(None)
+            self._writer.join()
+        self._writer = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _after_fork(self):
+        # The writer thread does not survive a fork, and the queue may hold
+        # lines the parent will still write.
+        self._lock = threading.Lock()
+        self._queue = None
+        self._writer = None
+
+    def _write_loop(self):
+        last_sync = time.monotonic()
+        unsynced = False
+        while True:
+            try:
+                timeout = self._fsync_interval if unsynced and self._fsync == "interval" else None
+                batch = [self._queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            while len(batch) < _BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            waiting = []
+            error = False
+            stop = False
+            for item in batch:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiting.append(item)
+                else:
+                    lines.append(item[0])
+                    error = error or item[1] == Severity.ERROR
+
+            # A failed write loses its batch but not the writer: the thread
+            # keeps draining the queue, so flush() and stop() still return.
+            with self._lock:
+                try:
+                    if lines:
+                        unsynced = not self._write(lines, error)
+                    now = time.monotonic()
+                    due = self._fsync == "interval" and now - last_sync >= self._fsync_interval
+                    if unsynced and (waiting or stop or due):
+                        os.fsync(self._fd)
+                        unsynced = False
+                    if not unsynced:
+                        last_sync = now
+                except OSError as failure:
+                    unsynced = False
+                    sys.stderr.write("Logger: could not write {} lines to {}: {}\n".format(
+                        len(lines), self._path, failure))
+
+            for done in waiting:
+                done.set()
+            if stop:
+                return
+
+    def _write(self, lines, error):
+        # Append lines in one write() call, then rotate if needed. Returns
+        # True if the file was fsync'd. Must be called with the lock held.
+        if self._fd is None or self._replaced():
+            if self._fd is not None:
+                os.close(self._fd)
+            self._fd = self._open()
+
+        os.write(self._fd, "".join(lines).encode())
+        synced = self._fsync == "always" or (error and self._fsync != "never")
+        if synced:
+            os.fsync(self._fd)
+
+        if self._max_bytes and self._owner == os.getpid():
+            if os.fstat(self._fd).st_size >= self._max_bytes:
+                self._rotate()
+                synced = True
+        return synced
+
+    def _open(self):
+        return os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _replaced(self):
+        # True if the file was rotated by another process.
+        try:
+            return os.stat(self._path).st_ino != os.fstat(self._fd).st_ino
+        except OSError:
+            return True
+
+    def _rotate(self):
+        # <file> becomes <file>.1, <file>.1 becomes <file>.2 and so on, up to
+        # backups files.
+        os.fsync(self._fd)
+        os.close(self._fd)
+        # Reopened by the next write if the rotation fails.
+        self._fd = None
+        suffix = ".gz" if self._compress else ""
+        for index in range(self._backups - 1, 0, -1):
+            source = "".join([self._path, ".", str(index), suffix])
+            if os.path.exists(source):
+                os.replace(source, "".join([self._path, ".", str(index + 1), suffix]))
+
+        if self._backups > 0:
+            rotated = self._path + ".1"
+            os.replace(self._path, rotated)
+            if self._compress:
+                with open(rotated, "rb") as source, gzip.open(rotated + ".gz", "wb") as target:
+                    shutil.copyfileobj(source, target)
+                os.remove(rotated)
+        else:
+            os.remove(self._path)
+        self._fd = self._open()
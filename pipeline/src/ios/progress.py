@@ -0,0 +1,116 @@
+import sys
+import time
+import threading
+from datetime import timedelta
+
+from . import ios
+
+
+""" Progress
+Reports how far a run is: the current stage, units done out of the total,
+throughput and ETA. A background thread reports every interval seconds,
+whatever the run is doing, so the cost does not depend on how often
+advance() is called. On a terminal the line is redrawn in place, otherwise
+(cron, docker) it is logged.
+For more, see docs/ios.md
+"""
+class Progress():
+
+    # Stages of a pipeline run, in order.
+    STAGES = ("extract", "service-key", "flag", "dedupe", "write")
+
+    def __init__(self, total=None, unit="rows", interval=None, log_interval=None,
+                 stream=None, tty=None, enabled=True):
+        self._ios = ios
+        self._stream = stream if stream is not None else sys.stdout
+        if tty is None:
+            tty = hasattr(self._stream, "isatty") and self._stream.isatty()
+        self._tty = tty
+        if self._tty:
+            self._interval = interval or 1.0
+        else:
+            self._interval = log_interval or 60.0
+        self._enabled = enabled
+        self._unit = unit
+        self._total = total
+        self._done = 0
+        self._stage = None
+        self._started = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._ticker = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.finish()
+
+    #######################################################
+
+    def start(self):
+        self._started = time.monotonic()
+        if self._enabled:
+            self._ticker = threading.Thread(target=self._tick, name="progress", daemon=True)
+            self._ticker.start()
+
+    def stage(self, name):
+        with self._lock:
+            self._stage = name
+
+    def add_total(self, units):
+        # Grow the total, for runs that only learn it as they go.
+        with self._lock:
+            self._total = (self._total or 0) + units
+
+    def advance(self, units=1):
+        with self._lock:
+            self._done += units
+
+    def finish(self):
+        # Stop reporting, then report the final state once.
+        if self._ticker is None:
+            return
+        self._stopped.set()
+        self._ticker.join()
+        self._ticker = None
+        self._report(final=True)
+
+    #######################################################
+
+    def line(self):
+        # Returns the report, e.g.
+        # "[flag] 120000/350000 rows (34%), 52000 rows/s, ETA 0:00:04"
+        with self._lock:
+            stage, done, total = self._stage, self._done, self._total
+        elapsed = time.monotonic() - self._started if self._started else 0
+        rate = done / elapsed if elapsed > 0 else 0
+
+        parts = ["[", stage or "start", "] ", str(done)]
+        if total:
+            parts.extend(["/", str(total), " ", self._unit,
+                          " (", str(min(100, int(100 * done / total))), "%)"])
+        else:
+            parts.extend([" ", self._unit])
+        parts.extend([", {:.0f} ".format(rate), self._unit, "/s"])
+        if total and rate > 0 and done < total:
+            parts.extend([", ETA ", str(timedelta(seconds=int((total - done) / rate)))])
+        elif not total or done >= total:
+            parts.extend([", elapsed ", str(timedelta(seconds=int(elapsed)))])
+        return "".join(parts)
+
+    #######################################################
+
+    def _tick(self):
+        while not self._stopped.wait(self._interval):
+            self._report()
+
+    def _report(self, final=False):
+        line = self.line()
+        if self._tty:
+            # Clear what is left of a longer previous line.
+            self._stream.write("\r" + line + "\x1b[K" + ("\n" if final else ""))
+            self._stream.flush()
+        else:
+            self._ios.log_and_print(line)
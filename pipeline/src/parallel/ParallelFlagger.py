@@ -0,0 +1,261 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import threading
+import time
+import numpy
+import pandas
+from pandas.api.types import is_integer_dtype
+
+from flaggers.flagger import flaggers as registered_flaggers
+
+try:
+    # multiprocessing.shared_memory only exists on Python 3.8+. Without it,
+    # partitions are pickled to the workers instead.
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+def collect_masks(flaggers, df, config, timings=None):
+    """
+    Runs every flagger except Duplicate over df and merges their masks.
+
+    Args:
+        flaggers (list): Flagger instances to run.
+        df (pandas.DataFrame): the rows to flag.
+        config (Config): passed through to the flaggers.
+        timings (dict): if given, flagger name is mapped to
+            [seconds, flags raised], added to what it already holds.
+
+    Returns:
+        dict: Flags member mapped to a boolean numpy mask over the rows of df.
+            Flags raised by more than one flagger are OR'ed together.
+        list: (flagger name, error message) of every flagger that failed.
+    """
+    masks = {}
+    errors = []
+    for flagger in flaggers:
+        # Duplicate flagger needs to see the whole frame, so it is handled by
+        # the caller.
+        if flagger.name == "Duplicate":
+            continue
+        start = time.perf_counter()
+        raised = 0
+        try:
+            for flag, mask in flagger.flag_frame(df, config).items():
+                mask = numpy.asarray(mask, dtype=bool)
+                raised += int(mask.sum())
+                if flag in masks:
+                    masks[flag] = masks[flag] | mask
+                else:
+                    masks[flag] = mask
+        except Exception as e:
+            errors.append((flagger.name, str(e)))
+        if timings is not None:
+            timing = timings.setdefault(flagger.name, [0.0, 0])
+            timing[0] += time.perf_counter() - start
+            timing[1] += raised
+
+    return masks, errors
+
+
+class ParallelFlagger:
+    """
+    Flags a DataFrame with a process pool. The frame is split into contiguous
+    row partitions, one per worker. Numeric columns are copied once into shared
+    memory blocks which every worker maps, the remaining columns are pickled
+    with their partition.
+
+    The process pool is started on the first frame worth splitting and reused
+    by every later frame (e.g. the chunks of a streamed run, or the days of a
+    backfill, from any thread) until close(). It can be used as a context
+    manager.
+    """
+
+    def __init__(self, workers, min_partition_rows=10000):
+        self.workers = workers
+        self.min_partition_rows = min_partition_rows
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Shuts the process pool down, waiting for the running partitions.
+        The next frame starts a new pool.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def flag_frame(self, df, config, timings=None):
+        """
+        Same contract as collect_masks(), run with the registered flaggers.
+        Frames too small to be worth splitting are flagged in this process.
+        Flagger timings are summed over the workers.
+        """
+        partitions = self._partition(len(df.index))
+        if len(partitions) < 2:
+            return collect_masks(registered_flaggers, df, config, timings)
+
+        executor = self._get_executor()
+        blocks = []
+        futures = []
+        try:
+            if shared_memory is None:
+                futures = [
+                    executor.submit(_flag_partition, df.iloc[start:stop], start, config)
+                    for start, stop in partitions]
+            else:
+                specs, objects = self._share_columns(df, blocks)
+                futures = [
+                    executor.submit(_flag_shared_partition, specs,
+                        {name: values[start:stop] for name, values in objects.items()},
+                        list(df.columns), start, stop, config)
+                    for start, stop in partitions]
+            results = [future.result() for future in futures]
+        except BrokenProcessPool:
+            # A worker died, the next frame starts a new pool.
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            raise
+        finally:
+            # The pool outlives this frame, so its partitions must be done
+            # before their blocks are unlinked.
+            for future in futures:
+                future.cancel()
+            for future in futures:
+                if not future.cancelled():
+                    future.exception()
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+        return self._merge(results, len(df.index), timings)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _partition(self, rows):
+        # Returns a list of (start, stop) row positions.
+        count = min(self.workers, rows // self.min_partition_rows)
+        if count < 2:
+            return [(0, rows)]
+
+        bounds = numpy.linspace(0, rows, count + 1).astype(int)
+        return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+    def _share_columns(self, df, blocks):
+        # Copies every numeric column of df into its own shared memory block.
+        # Nullable integer columns (Int32, as returned by Table._query_table)
+        # and object columns holding only numbers and None are shared as
+        # floats, nulls as NaN, and given back their dtype by the worker.
+        # Returns the specs needed to map the blocks and a dict of the
+        # columns that could not be shared, as pandas arrays so categoricals
+        # keep their dtype.
+        specs = []
+        objects = {}
+        for name in df.columns:
+            values, restore = self._numeric_values(df[name])
+            if values is None:
+                objects[name] = df[name].array
+                continue
+
+            block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+            blocks.append(block)
+            shared = numpy.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)
+            shared[:] = values
+            specs.append((name, block.name, values.dtype.str, len(values), restore))
+
+        return specs, objects
+
+    def _numeric_values(self, column):
+        # Returns (numpy array, dtype to restore in the worker or None), or
+        # (None, None) when the column cannot be shared.
+        if isinstance(column.dtype, numpy.dtype) and column.dtype.kind in "biufM":
+            return column.to_numpy(), None
+
+        if is_integer_dtype(column.dtype):
+            return column.to_numpy(dtype="float64", na_value=numpy.nan), str(column.dtype)
+
+        if column.dtype == object:
+            try:
+                values = pandas.to_numeric(column, errors="raise")
+            except (ValueError, TypeError):
+                return None, None
+            if isinstance(values.dtype, numpy.dtype) and values.dtype.kind in "biuf":
+                return values.to_numpy(dtype="float64"), "object"
+
+        return None, None
+
+    def _merge(self, results, rows, timings=None):
+        # Results are (masks as row positions, errors, timings) per
+        # partition, in partition order, so the merged flag set does not
+        # depend on which worker finished first.
+        positions = {}
+        errors = []
+        for partition_positions, partition_errors, partition_timings in results:
+            for flag, hits in partition_positions.items():
+                positions.setdefault(flag, []).append(hits)
+            errors.extend(partition_errors)
+            if timings is not None:
+                for name, (seconds, raised) in partition_timings.items():
+                    timing = timings.setdefault(name, [0.0, 0])
+                    timing[0] += seconds
+                    timing[1] += raised
+
+        masks = {}
+        for flag in sorted(positions):
+            mask = numpy.zeros(rows, dtype=bool)
+            mask[numpy.concatenate(positions[flag])] = True
+            masks[flag] = mask
+
+        return masks, errors
+
+
+###############################################################################
+# Worker functions. These run in the pool's processes so they must be
+# importable at module level.
+
+def _flag_partition(df, start, config):
+    timings = {}
+    masks, errors = collect_masks(registered_flaggers, df, config, timings)
+    positions = {flag: numpy.flatnonzero(mask) + start
+                 for flag, mask in masks.items()}
+    return positions, errors, timings
+
+
+def _flag_shared_partition(specs, objects, columns, start, stop, config):
+    index = pandas.RangeIndex(start, stop)
+    data = {}
+    for name, block_name, dtype, length, restore in specs:
+        block = shared_memory.SharedMemory(name=block_name)
+        try:
+            values = numpy.ndarray((length,), dtype=dtype, buffer=block.buf)
+            # Copy the partition out so the block can be closed.
+            column = pandas.Series(values[start:stop].copy(), index=index)
+        finally:
+            block.close()
+
+        if restore == "object":
+            column = column.astype(object).where(column.notna(), None)
+        elif restore is not None:
+            column = column.astype(restore)
+        data[name] = column
+
+    for name, values in objects.items():
+        data[name] = pandas.Series(values, index=index)
+
+    df = pandas.DataFrame(data, index=index, columns=columns)
+    return _flag_partition(df, start, config)
@@ -0,0 +1,2 @@
+from .ParallelFlagger import ParallelFlagger
+from .ParallelFlagger import collect_masks
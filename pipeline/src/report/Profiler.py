@@ -0,0 +1,141 @@
+import io
+import os
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from datetime import datetime
+
+
+class Profiler:
+    """
+    cProfile stats and tracemalloc top allocators per stage of a pipeline
+    run. Stages follow each other like RunReport stages. Each thread has its
+    own cProfile profiler per stage, so concurrent runs (backfill days) can be
+    profiled; their stats are added up per stage. tracemalloc is process-wide,
+    so with concurrent runs a stage's allocations include the other threads'.
+
+    Only created when profiling is asked for, so runs without it pay nothing.
+    """
+
+    def __init__(self, run="process_data", top=30, frames=1):
+        self.run = run
+        self.started = datetime.now()
+        # Lines of each report section.
+        self._top = top
+        self._frames = frames
+        self._profiles = {}
+        self._allocations = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self._frames)
+            self._tracing = True
+
+    def stage(self, name):
+        # End the calling thread's current stage and start stage name. None
+        # only ends the current stage. Must be called from the thread that runs
+        # the stage.
+        current = getattr(self._local, "profile", None)
+        if current is not None:
+            current.disable()
+            self._end_allocations(self._local.stage)
+        self._local.profile = None
+        self._local.stage = None
+        if name is None:
+            return
+
+        with self._lock:
+            profile = self._profiles.setdefault((threading.get_ident(), name), cProfile.Profile())
+        self._local.stage = name
+        self._local.snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ allows one active profiler per process, a
+            # concurrent stage is then left out.
+            return
+        self._local.profile = profile
+
+    def stop(self):
+        # Ends the calling thread's stage. Other threads must have ended
+        # theirs with stage(None).
+        self.stage(None)
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    #######################################################
+
+    def write(self, path):
+        # Write the sorted report as <path>profile_<started>.txt, and the raw
+        # stats of each stage as <path>profile_<started>_<stage>.prof for
+        # pstats or snakeviz. Returns the report's file name, None on failure.
+        prefix = "".join([path, "profile_", self.started.strftime("%Y-%m-%d_%H%M%S")])
+        try:
+            if path:
+                os.makedirs(path, exist_ok=True)
+            stats = self._stats()
+            for name, stage_stats in stats.items():
+                stage_stats.dump_stats("".join([prefix, "_", name, ".prof"]))
+            with open(prefix + ".txt", "w") as report_file:
+                report_file.write(self.text(stats))
+        except OSError:
+            return None
+        return prefix + ".txt"
+
+    def text(self, stats=None):
+        if stats is None:
+            stats = self._stats()
+        lines = ["Profile of {} started {}".format(self.run, self.started.isoformat()), ""]
+        for name, stage_stats in stats.items():
+            stream = io.StringIO()
+            stage_stats.stream = stream
+            stage_stats.sort_stats("cumulative").print_stats(self._top)
+            lines.append("=" * 79)
+            lines.append("Stage {}, by cumulative time".format(name))
+            lines.append(stream.getvalue().strip("\n"))
+            lines.append("")
+
+        with self._lock:
+            allocations = dict(self._allocations)
+        for name, (growth, statistics) in allocations.items():
+            lines.append("=" * 79)
+            lines.append("Stage {}, top allocators (+{:.1f} KiB held at the end of the stage)"
+                         .format(name, growth / 1024))
+            lines.extend(str(statistic) for statistic in statistics)
+            lines.append("")
+        return "\n".join(lines) + "\n"
+
+    #######################################################
+
+    def _stats(self):
+        # pstats.Stats of each stage, adding up every thread's profiler, in
+        # the order the stages were first entered.
+        with self._lock:
+            profiles = list(self._profiles.items())
+        stats = {}
+        for (_, name), profile in profiles:
+            if name in stats:
+                stats[name].add(profile)
+            else:
+                try:
+                    stats[name] = pstats.Stats(profile)
+                except TypeError:
+                    # Never enabled long enough to record a call.
+                    continue
+        return stats
+
+    def _end_allocations(self, name):
+        # Keep the allocators of the stage's largest growth so far.
+        snapshot = self._local.snapshot
+        if snapshot is None or not tracemalloc.is_tracing():
+            return
+        statistics = tracemalloc.take_snapshot().compare_to(snapshot, "lineno")
+        growth = sum(statistic.size_diff for statistic in statistics)
+        with self._lock:
+            if name not in self._allocations or growth > self._allocations[name][0]:
+                self._allocations[name] = (growth, statistics[:self._top])
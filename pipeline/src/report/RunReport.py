@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import threading
+from datetime import datetime
+
+try:
+    # Not available on Windows, peak RSS is then not reported.
+    import resource
+except ImportError:
+    resource = None
+
+
+# Prefix of every metric in the Prometheus textfile.
+METRIC_PREFIX = "stopspot_pipeline_"
+
+
+class RunReport:
+    """
+    Timings and counters of one pipeline run: wall time, rows and peak RSS of
+    each stage, wall time and flags of each flagger, and the rows, flags and
+    skipped rows of the run. Stages follow each other like Progress stages:
+    starting one ends the previous one. Runs done side by side (backfill days)
+    are reported separately and merged, their stage times then add up.
+
+    Written as JSON with write_json() and as a Prometheus textfile with
+    write_prometheus().
+    """
+
+    def __init__(self, run="process_data"):
+        self.run = run
+        self.started = datetime.now()
+        self.success = None
+        self._start = time.perf_counter()
+        self._seconds = None
+        self._stage = None
+        self._stage_start = None
+        self._stages = {}
+        self._flaggers = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name, rows=None):
+        # End the current stage and start stage name, adding rows to its rows.
+        with self._lock:
+            self._end_stage()
+            self._stage = name
+            self._stage_start = time.perf_counter()
+            stage = self._stage_entry(name)
+            stage["calls"] += 1
+            if rows:
+                stage["rows"] += rows
+
+    def add_flaggers(self, timings):
+        # timings as filled in by collect_masks(): flagger name mapped to
+        # [seconds, flags raised].
+        with self._lock:
+            for name, (seconds, raised) in timings.items():
+                flagger = self._flaggers.setdefault(name, {"seconds": 0.0, "flags": 0})
+                flagger["seconds"] += seconds
+                flagger["flags"] += raised
+
+    def count(self, name, value=1):
+        # Add value to the run counter name, e.g. rows or flags.
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def merge(self, other):
+        # Add the stages, flaggers and counters of a finished run.
+        report = other.to_dict()
+        with self._lock:
+            for name, other_stage in report["stages"].items():
+                stage = self._stage_entry(name)
+                stage["seconds"] += other_stage["seconds"]
+                stage["calls"] += other_stage["calls"]
+                stage["rows"] += other_stage["rows"]
+                stage["peak_rss_bytes"] = _max(stage["peak_rss_bytes"],
+                                               other_stage["peak_rss_bytes"])
+            for name, value in report["counters"].items():
+                self._counters[name] = self._counters.get(name, 0) + value
+        self.add_flaggers({name: (flagger["seconds"], flagger["flags"])
+                           for name, flagger in report["flaggers"].items()})
+
+    def finish(self, success):
+        with self._lock:
+            self._end_stage()
+            self._stage = None
+            self.success = success
+            self._seconds = time.perf_counter() - self._start
+
+    #######################################################
+
+    def _stage_entry(self, name):
+        return self._stages.setdefault(
+            name, {"seconds": 0.0, "calls": 0, "rows": 0, "peak_rss_bytes": None})
+
+    def _end_stage(self):
+        # Must be called with the lock held. Peak RSS only grows, so a stage's
+        # value is the peak of the process by the end of that stage.
+        if self._stage is None:
+            return
+        stage = self._stages[self._stage]
+        stage["seconds"] += time.perf_counter() - self._stage_start
+        stage["peak_rss_bytes"] = _max(stage["peak_rss_bytes"], peak_rss())
+
+    #######################################################
+
+    def to_dict(self):
+        with self._lock:
+            seconds = self._seconds
+            if seconds is None:
+                seconds = time.perf_counter() - self._start
+            return {
+                "run": self.run,
+                "host": socket.gethostname(),
+                "started": self.started.isoformat(),
+                "seconds": round(seconds, 6),
+                "success": self.success,
+                "peak_rss_bytes": peak_rss(),
+                "peak_rss_children_bytes": peak_rss(children=True),
+                "counters": dict(self._counters),
+                "stages": {name: dict(stage) for name, stage in self._stages.items()},
+                "flaggers": {name: dict(flagger) for name, flagger in self._flaggers.items()},
+            }
+
+    def write_json(self, path):
+        # Write the report as <path>run_<started>.json. Returns the file
+        # name, None on failure.
+        full_path = "".join([path, "run_", self.started.strftime("%Y-%m-%d_%H%M%S"), ".json"])
+        if not _write_atomic(full_path, json.dumps(self.to_dict(), indent=2, sort_keys=True) + "\n"):
+            return None
+        return full_path
+
+    def write_prometheus(self, full_path):
+        # Write the report in the Prometheus text format, for node exporter's
+        # textfile collector. The file is replaced as a whole so the collector
+        # never reads a partial file. Returns True on success.
+        report = self.to_dict()
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append("# HELP {}{} {}".format(METRIC_PREFIX, name, help_text))
+            lines.append("# TYPE {}{} gauge".format(METRIC_PREFIX, name))
+            for labels, value in samples:
+                label_text = ",".join('{}="{}"'.format(key, _escape(label))
+                                      for key, label in labels)
+                if label_text:
+                    label_text = "{" + label_text + "}"
+                lines.append("{}{}{} {}".format(METRIC_PREFIX, name, label_text, _number(value)))
+
+        run = [("run", report["run"])]
+        metric("last_run_timestamp_seconds", "Start of the last run.",
+               [(run, self.started.timestamp())])
+        metric("last_run_seconds", "Wall time of the last run.", [(run, report["seconds"])])
+        metric("last_run_success", "1 if the last run succeeded.",
+               [(run, 1 if report["success"] else 0)])
+        metric("last_run_peak_rss_bytes", "Peak resident set size of the last run.",
+               [(run, report["peak_rss_bytes"] or 0)])
+        metric("last_run_total", "Counters of the last run.",
+               [(run + [("counter", name)], value)
+                for name, value in sorted(report["counters"].items())])
+        metric("stage_seconds", "Wall time of each stage in the last run.",
+               [(run + [("stage", name)], stage["seconds"])
+                for name, stage in sorted(report["stages"].items())])
+        metric("stage_rows", "Rows through each stage in the last run.",
+               [(run + [("stage", name)], stage["rows"])
+                for name, stage in sorted(report["stages"].items())])
+        metric("stage_peak_rss_bytes", "Peak resident set size by the end of each stage.",
+               [(run + [("stage", name)], stage["peak_rss_bytes"] or 0)
+                for name, stage in sorted(report["stages"].items())])
+        metric("flagger_seconds", "Wall time of each flagger in the last run.",
+               [(run + [("flagger", name)], flagger["seconds"])
+                for name, flagger in sorted(report["flaggers"].items())])
+        metric("flagger_flags", "Flags raised by each flagger in the last run.",
+               [(run + [("flagger", name)], flagger["flags"])
+                for name, flagger in sorted(report["flaggers"].items())])
+
+        return _write_atomic(full_path, "\n".join(lines) + "\n")
+
+
+def peak_rss(children=False):
+    # Peak resident set size in bytes of this process, or of its finished
+    # child processes (flagger workers). None where unsupported.
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # Kilobytes on Linux, bytes on macOS.
+    if sys.platform == "darwin":
+        return usage.ru_maxrss
+    return usage.ru_maxrss * 1024
+
+
+def _write_atomic(full_path, text):
+    directory = os.path.dirname(full_path)
+    temp_path = os.path.join(directory, "." + uuid.uuid4().hex + ".tmp")
+    try:
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(temp_path, "w") as temp_file:
+            temp_file.write(text)
+        os.replace(temp_path, full_path)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+    return True
+
+
+def _max(left, right):
+    if left is None:
+        return right
+    if right is None:
+        return left
+    return max(left, right)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
@@ -0,0 +1,9 @@
+from .RunReport import RunReport
+
+
+def __getattr__(name):
+    # Profiler loads cProfile and tracemalloc, only needed with --profile.
+    if name == "Profiler":
+        from .Profiler import Profiler
+        return Profiler
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
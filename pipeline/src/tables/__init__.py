@@ -1,5 +1,22 @@
 from .table import Table
 from .ctran_data import CTran_Data
 from .flagged_data import Flagged_Data
+from .flagged_bitmask import Flagged_Bitmask
 from .flags import Flags
 from .service_periods import Service_Periods
+from .watermarks import Watermarks
+from .row_hashes import Row_Hashes
+from .engines import engines
+
+
+def __getattr__(name):
+    # CTran_Cache and Row_History are only needed once their config values
+    # enable them, so their modules (and the flaggers) are imported on first
+    # use.
+    if name == "CTran_Cache":
+        from .ctran_cache import CTran_Cache
+        return CTran_Cache
+    if name == "Row_History":
+        from .row_history import Row_History
+        return Row_History
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -0,0 +1,136 @@
+import os
+import uuid
+import threading
+import datetime
+import pandas
+
+from ..ios import ios
+from .table import _load_pyarrow
+
+
+""" CTran_Cache
+On-disk cache of ctran_data, one parquet file per service date, used by
+CTran_Data.query_date_range so days already pulled from Portal are read
+locally. When the cache grows over max_bytes, the least recently used days
+are evicted. Days that changed in Portal must be invalidated explicitly.
+For more, see docs/db_ops.md
+"""
+class CTran_Cache():
+
+    def __init__(self, path, max_bytes):
+        self._ios = ios
+        self._path = path
+        self._max_bytes = max_bytes
+        # Serializes writes, eviction and invalidation. Reads are not
+        # locked; a day evicted while being read is a cache miss.
+        self._lock = threading.Lock()
+
+    def is_available(self):
+        return _load_pyarrow() is not None
+
+    #######################################################
+
+    def get(self, day):
+        # Returns the cached DataFrame of day (a date), or None on a miss.
+        pyarrow = _load_pyarrow()
+        if pyarrow is None:
+            return None
+
+        full_path = self._day_path(day)
+        try:
+            df = pandas.read_parquet(full_path, engine="pyarrow")
+            # Reading a day makes it the most recently used.
+            os.utime(full_path)
+        except (OSError, pyarrow.ArrowException):
+            return None
+
+        #Converts NaN to None, like Table._query_table
+        return df.where(df.notnull(), None)
+
+    #######################################################
+
+    def put(self, day, df):
+        # Cache df as the data of day (a date), then evict the least recently
+        # used days if the cache is too large. Returns True on success.
+        pyarrow = _load_pyarrow()
+        if pyarrow is None:
+            return False
+
+        full_path = self._day_path(day)
+        temp_path = "".join([self._path, ".", uuid.uuid4().hex, ".tmp"])
+        with self._lock:
+            try:
+                os.makedirs(self._path, exist_ok=True)
+                df.to_parquet(temp_path, engine="pyarrow")
+                os.replace(temp_path, full_path)
+            except (OSError, ValueError, pyarrow.ArrowException) as error:
+                self._ios.log_and_print(
+                    "Could not cache " + str(day) + ": " + str(error),
+                    self._ios.Severity.WARNING)
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                return False
+
+            self._evict()
+        return True
+
+    #######################################################
+
+    def invalidate(self, start_date=None, end_date=None):
+        # Remove the cached days between start_date and end_date, inclusive.
+        # Either can be None for no bound. Returns the number of days removed.
+        count = 0
+        with self._lock:
+            for day, full_path, _, _ in self._entries():
+                if start_date is not None and day < start_date:
+                    continue
+                if end_date is not None and day > end_date:
+                    continue
+                try:
+                    os.remove(full_path)
+                    count += 1
+                except OSError:
+                    pass
+
+        self._ios.log_and_print("Invalidated " + str(count) + " cached days.")
+        return count
+
+    #######################################################
+
+    def _evict(self):
+        # Remove the least recently used days until the cache fits in
+        # max_bytes. Must be called with the lock held.
+        entries = self._entries()
+        total = sum(size for _, _, size, _ in entries)
+        for day, full_path, size, _ in sorted(entries, key=lambda entry: entry[3]):
+            if total <= self._max_bytes:
+                break
+            try:
+                os.remove(full_path)
+                total -= size
+                self._ios.log_and_print("Evicted " + str(day) + " from the cache.")
+            except OSError:
+                pass
+
+    def _entries(self):
+        # Returns (day, path, size, last use) of every cached day.
+        entries = []
+        try:
+            names = os.listdir(self._path)
+        except OSError:
+            return entries
+
+        for name in names:
+            if not name.endswith(".parquet"):
+                continue
+            full_path = self._path + name
+            try:
+                day = datetime.datetime.strptime(name[:-len(".parquet")], "%Y-%m-%d").date()
+                stat = os.stat(full_path)
+            except (ValueError, OSError):
+                continue
+            entries.append((day, full_path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _day_path(self, day):
+        return "".join([self._path, day.strftime("%Y-%m-%d"), ".parquet"])
@@ -1,4 +1,5 @@
 import sys
+import datetime
 import pandas
 from .table import Table
 from sqlalchemy.exc import SQLAlchemyError
@@ -12,6 +13,7 @@ class CTran_Data(Table):
     def __init__(self, user=None, passwd=None, hostname=None, db_name=None, schema="aperture", engine=None):
         super().__init__(user, passwd, hostname, db_name, schema, engine)
         self._table_name = "ctran_data"
+        self._cache = None
         self._index_col = "row_id"
         self._expected_cols = [
             "service_date",
@@ -41,6 +43,37 @@ class CTran_Data(Table):
             "schedule_status",
             "trip_id"
         ]
+        # Dtypes of the columns of _creation_sql. Nulls stay masked (<NA>)
+        # instead of turning the column into Python objects. FLOAT columns
+        # stay float64: float32 would change the values row_hashes() stores.
+        # service_date stays datetime.date, as the service periods expect.
+        self._dtypes = {
+            "vehicle_number": "Int32",
+            "leave_time": "Int32",
+            "train": "Int32",
+            "route_number": "Int32",
+            "direction": "Int16",
+            "service_key": "category",
+            "trip_number": "Int32",
+            "stop_time": "Int32",
+            "arrive_time": "Int32",
+            "dwell": "Int32",
+            "location_id": "Int32",
+            "door": "Int32",
+            "lift": "Int32",
+            "ons": "Int32",
+            "offs": "Int32",
+            "estimated_load": "Int32",
+            "maximum_speed": "Int32",
+            "train_mileage": "float64",
+            "pattern_distance": "float64",
+            "location_distance": "float64",
+            "x_coordinate": "float64",
+            "y_coordinate": "float64",
+            "data_source": "Int32",
+            "schedule_status": "Int32",
+            "trip_id": "Int32"
+        }
 
         self._creation_sql = "".join(["""
             CREATE TABLE IF NOT EXISTS """, self._schema, ".", self._table_name, """
@@ -114,7 +147,62 @@ class CTran_Data(Table):
 
     # Query all data between date_from and date_to, dates
     # NOTE: if there is no ctran_data table, this will not work, obviously.
+    # With a cache set, cached days are read locally and only the other days
+    # are queried, in one query per run of consecutive missing days.
     def query_date_range(self, date_from, date_to):
+        if self._cache is None:
+            return self._query_date_range(date_from, date_to)
+
+        date_from = pandas.Timestamp(date_from).date()
+        date_to = pandas.Timestamp(date_to).date()
+        days = [date_from + datetime.timedelta(days=i)
+                for i in range((date_to - date_from).days + 1)]
+        frames = []
+        missing = []
+        for day in days:
+            df = self._cache.get(day)
+            if df is None:
+                missing.append(day)
+            else:
+                # Days cached before the dtypes were set get them here.
+                frames.append(self._apply_dtypes(df))
+
+        self._ios.log_and_print("{} of {} days read from the cache.".format(
+            len(days) - len(missing), len(days)))
+
+        for first, last in self._consecutive_runs(missing):
+            df = self._query_date_range(first, last)
+            if df is None:
+                return None
+            frames.append(df)
+
+            # The current day may still be receiving data, so it is not cached.
+            for day, day_df in df.groupby("service_date", sort=False):
+                day = pandas.Timestamp(day).date()
+                if day < datetime.date.today():
+                    self._cache.put(day, day_df)
+
+        if len(frames) == 1:
+            return frames[0]
+        # Categories differing between the frames make the column object.
+        return self._apply_dtypes(pandas.concat(frames))
+
+    #######################################################
+
+    # Read days from Portal through cache from now on, None to stop caching.
+    def set_cache(self, cache):
+        self._cache = cache
+
+    def get_cache(self):
+        return self._cache
+
+    #######################################################
+
+    # Same as query_date_range, but yields the data in DataFrames of at most
+    # chunksize rows so the whole range is never held in memory. Rows are
+    # ordered by service_date, so once a chunk starts a new service_date every
+    # earlier service_date is complete.
+    def query_date_range_chunks(self, date_from, date_to, chunksize):
         sql = "".join(["SELECT * FROM ",
                        self._schema,
                        ".",
@@ -123,16 +211,92 @@ class CTran_Data(Table):
                        date_from.strftime("%Y-%m-%d"),
                        "' AND '",
                        date_to.strftime("%Y-%m-%d"),
-                       "';"])
+                       "' ORDER BY service_date, ",
+                       self._index_col,
+                       ";"])
+
+        return self._query_table_chunks(sql, chunksize)
+
+    #######################################################
+
+    # Query every row added after row_id, whatever its service_date. row_id
+    # is the primary key, so this only reads the new rows.
+    def query_new_rows(self, row_id):
+        sql = "".join(["SELECT * FROM ",
+                       self._schema,
+                       ".",
+                       self._table_name,
+                       " WHERE ",
+                       self._index_col,
+                       " > ",
+                       str(int(row_id)),
+                       ";"])
+
+        return self._query_table(sql)
+
+    #######################################################
+
+    # Chunked version of query_new_rows, ordered like query_date_range_chunks.
+    def query_new_rows_chunks(self, row_id, chunksize):
+        sql = "".join(["SELECT * FROM ",
+                       self._schema,
+                       ".",
+                       self._table_name,
+                       " WHERE ",
+                       self._index_col,
+                       " > ",
+                       str(int(row_id)),
+                       " ORDER BY service_date, ",
+                       self._index_col,
+                       ";"])
+
+        return self._query_table_chunks(sql, chunksize)
+
+    #######################################################
+
+    # Query the rows with the given row_ids.
+    def query_row_ids(self, row_ids):
+        sql = "".join(["SELECT * FROM ",
+                       self._schema,
+                       ".",
+                       self._table_name,
+                       " WHERE ",
+                       self._index_col,
+                       " IN (",
+                       ", ".join([str(int(row_id)) for row_id in row_ids]),
+                       ");"])
 
         return self._query_table(sql)
 
     ###########################################################################
     # Private Methods
 
+    def _query_date_range(self, date_from, date_to):
+        sql = "".join(["SELECT * FROM ",
+                       self._schema,
+                       ".",
+                       self._table_name,
+                       " WHERE service_date BETWEEN '",
+                       date_from.strftime("%Y-%m-%d"),
+                       "' AND '",
+                       date_to.strftime("%Y-%m-%d"),
+                       "';"])
+
+        return self._query_table(sql)
+
+    def _consecutive_runs(self, days):
+        # Split a sorted list of dates into (first, last) runs of consecutive
+        # days.
+        runs = []
+        for day in days:
+            if runs and runs[-1][1] + datetime.timedelta(days=1) == day:
+                runs[-1] = (runs[-1][0], day)
+            else:
+                runs.append((day, day))
+        return runs
+
     def _create_table_helper(self, sample_data, exists_action="append"):
         try:
-            conn = self._engine.connect()
             self._ios.log_and_print("Initializing table.")
             if not super().create_table():
                 self._ios.log_and_print(
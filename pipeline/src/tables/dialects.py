@@ -0,0 +1,205 @@
+import os
+import re
+import sqlite3
+import datetime
+import threading
+import pandas
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool, StaticPool
+from sqlalchemy.engine.url import make_url
+
+
+""" Dialects
+The SQL of the tables is written for PostgreSQL. A Dialect adapts the few
+statements that differ to another database, so the same tables can run on an
+embedded file database (SQLite) for benchmarks, offline reprocessing and
+tests. Each Table gets the Dialect of its engine from get_dialect().
+For more, see docs/db_ops.md
+"""
+class Dialect():
+    # PostgreSQL: every statement is used as written.
+
+    name = "postgresql"
+    # Placeholder of a bound parameter.
+    placeholder = "%s"
+    # True if _write_table sends rows as bound parameters (executemany)
+    # rather than as literals in the SQL.
+    binds_rows = False
+
+    def engine_options(self, url, pool_options):
+        # Keyword arguments of create_engine for url.
+        return dict(pool_options)
+
+    def attach_schema(self, engine, schema):
+        # Make schema usable on every connection of engine.
+        return
+
+    def create_schema_sql(self, schema):
+        # None if schemas need no creating.
+        return "".join(["CREATE SCHEMA IF NOT EXISTS ", schema, ";"])
+
+    def drop_schema_sql(self, conn, schema):
+        # Returns the statements dropping schema and everything in it.
+        return ["".join(["DROP SCHEMA IF EXISTS ", schema, " CASCADE;"])]
+
+    def ddl(self, sql):
+        # Returns the statements to run for the creation SQL of a table.
+        return [sql]
+
+    def distinct_sql(self, current, updated):
+        # Condition true when the lists of expressions current and updated
+        # differ, NULLs being equal.
+        return "".join(["(", ", ".join(current), ") IS DISTINCT FROM (",
+                        ", ".join(updated), ")"])
+
+    def greatest_sql(self, *values):
+        return "".join(["GREATEST(", ", ".join(values), ")"])
+
+    def rows(self, conn, schema, table, df):
+        # Returns the rows of df as bound parameters.
+        return df.astype(object).where(df.notna(), None).values.tolist()
+
+    def date_value(self, value):
+        # A date read back from an aggregate (e.g. MAX(service_date)).
+        return value
+
+
+class SQLite_Dialect(Dialect):
+    # SQLite 3.35 or later (UPSERT, RETURNING). Schemas are separate database
+    # files, <database>.<schema>.db next to the main one, attached to every
+    # connection under the schema's name, so "schema.table" still works.
+    # DATE columns are stored as YYYY-MM-DD text and read back as dates.
+    # sqlite3 converters and adapters are process-wide, so the columns are
+    # declared with a type of their own, _DATE_TYPE, whose converter no other
+    # sqlite3 user sees, and rows() binds the dates as text itself.
+
+    name = "sqlite"
+    placeholder = "?"
+    binds_rows = True
+
+    def __init__(self):
+        self._schemas = {}
+        self._lock = threading.Lock()
+
+    def engine_options(self, url, pool_options):
+        # Connections are shared between threads by the pool, and wait up to
+        # 30s for a writer in another connection (backfill) to finish.
+        options = {"connect_args": {"check_same_thread": False,
+                                    "detect_types": sqlite3.PARSE_DECLTYPES,
+                                    "timeout": 30}}
+        if _database(url) == ":memory:":
+            # Every connection would get its own empty database.
+            options["poolclass"] = StaticPool
+        else:
+            options["poolclass"] = QueuePool
+            options.update(pool_options)
+        return options
+
+    def attach_schema(self, engine, schema):
+        if schema in ("main", "temp"):
+            return
+        with self._lock:
+            schemas = self._schemas.get(engine)
+            if schemas is None:
+                schemas = self._schemas[engine] = set()
+                database = _database(engine.url)
+
+                def attach(dbapi_connection, connection_record, connection_proxy):
+                    self._attach(dbapi_connection, connection_record, database, schemas)
+                event.listen(engine, "checkout", attach)
+            schemas.add(schema)
+
+    def create_schema_sql(self, schema):
+        # Attaching the file creates it.
+        return None
+
+    def drop_schema_sql(self, conn, schema):
+        rows = conn.execute("".join(["SELECT type, name FROM ", schema, ".sqlite_master",
+                                     " WHERE type IN ('table', 'view');"])).fetchall()
+        return ["".join(["DROP ", kind.upper(), " IF EXISTS ", schema, ".", name, ";"])
+                for kind, name in rows]
+
+    def ddl(self, sql):
+        sql = sql.replace("BIGSERIAL PRIMARY KEY", "INTEGER PRIMARY KEY")
+        sql = re.sub(r"\bDATE\b", _DATE_TYPE, sql)
+        sql = re.sub(r"(\w+)::(\w+)", r"CAST(\1 AS \2)", sql)
+        # Foreign keys and indexes refer to tables of their own schema, the
+        # index itself is qualified instead.
+        sql = re.sub(r"REFERENCES \w+\.", "REFERENCES ", sql)
+        sql = re.sub(r"CREATE INDEX IF NOT EXISTS (\w+)(\s+)ON (\w+)\.",
+                     r"CREATE INDEX IF NOT EXISTS \3.\1\2ON ", sql)
+        sql = re.sub(r"CREATE OR REPLACE VIEW ([\w.]+)",
+                     r"DROP VIEW IF EXISTS \1; CREATE VIEW \1", sql)
+        # One statement per execute.
+        return [statement.strip() + ";" for statement in sql.split(";") if statement.strip()]
+
+    def distinct_sql(self, current, updated):
+        # Row values only support IS DISTINCT FROM since SQLite 3.39.
+        return "".join(["NOT (", " AND ".join(["".join([left, " IS ", right])
+                                               for left, right in zip(current, updated)]), ")"])
+
+    def greatest_sql(self, *values):
+        # max() with several arguments is the scalar max.
+        return "".join(["MAX(", ", ".join(values), ")"])
+
+    def rows(self, conn, schema, table, df):
+        # Values of DATE columns are bound as YYYY-MM-DD text whatever their
+        # type in df (str, date, datetime), so they compare as Postgres dates
+        # do. Other datetimes are bound as ISO text. Tables created before
+        # _DATE_TYPE still declare DATE.
+        declared = {row[1]: (row[2] or "").upper() for row in conn.execute(
+            "".join(["PRAGMA ", schema, ".table_info(", table, ");"])).fetchall()}
+        df = df.copy()
+        for column in df.columns:
+            if declared.get(column) in (_DATE_TYPE, "DATE"):
+                dates = pandas.to_datetime(df[column])
+                df[column] = dates.dt.strftime("%Y-%m-%d").where(dates.notna(), None)
+            elif pandas.api.types.is_datetime64_any_dtype(df[column]):
+                df[column] = df[column].map(lambda value: value.isoformat(" "), na_action="ignore")
+        return super().rows(conn, schema, table, df)
+
+    def date_value(self, value):
+        if isinstance(value, str):
+            return datetime.date.fromisoformat(value[:10])
+        return value
+
+    def _attach(self, dbapi_connection, connection_record, database, schemas):
+        # Attach the schemas the connection checked out does not have yet.
+        attached = connection_record.info.setdefault("attached_schemas", set())
+        with self._lock:
+            missing = schemas - attached
+        for schema in sorted(missing):
+            dbapi_connection.execute("".join([
+                "ATTACH DATABASE '", self._schema_file(database, schema), "' AS ", schema, ";"]))
+            attached.add(schema)
+
+    def _schema_file(self, database, schema):
+        if database == ":memory:":
+            return database
+        root, extension = os.path.splitext(database)
+        return "".join([root, ".", schema, extension or ".db"])
+
+
+# Declared type of DATE columns on SQLite, read back as dates through
+# PARSE_DECLTYPES. The converter is lenient: values written by pandas.to_sql
+# carry a time.
+_DATE_TYPE = "PIPELINE_DATE"
+sqlite3.register_converter(_DATE_TYPE, lambda value: datetime.date.fromisoformat(value.decode()[:10]))
+
+
+def _database(url):
+    return make_url(url).database or ":memory:"
+
+
+_dialects = {
+    "postgresql": Dialect(),
+    "sqlite": SQLite_Dialect(),
+}
+
+
+def get_dialect(url):
+    # Returns the Dialect of an engine or URL, PostgreSQL's if it is unknown.
+    url = getattr(url, "url", url)
+    return _dialects.get(make_url(url).get_backend_name(), _dialects["postgresql"])
+
+
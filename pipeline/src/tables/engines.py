@@ -0,0 +1,93 @@
+import threading
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+from .dialects import get_dialect
+
+
+""" Engine registry
+Every Table connecting to the same database shares one Engine, and so one
+connection pool, instead of building its own. Engines are keyed by URL.
+For more, see docs/db_ops.md
+"""
+class Engines():
+
+    def __init__(self):
+        self._engines = {}
+        self._lock = threading.Lock()
+        # Passed to create_engine for every new engine.
+        #   pool_size:     connections kept open in the pool.
+        #   max_overflow:  extra connections opened when the pool is empty,
+        #                  closed when they are returned.
+        #   pool_pre_ping: test a connection before handing it out, so a
+        #                  connection dropped by the server is replaced
+        #                  instead of failing the query.
+        #   pool_recycle:  seconds before a connection is reopened, to stay
+        #                  under server and firewall idle timeouts.
+        self._pool_options = {
+            "pool_size": 5,
+            "max_overflow": 10,
+            "pool_pre_ping": True,
+            "pool_recycle": 1800,
+        }
+
+    def configure(self, **pool_options):
+        # Override the pool options of engines created from now on. Options
+        # given as None are ignored.
+        with self._lock:
+            for key, value in pool_options.items():
+                if value is not None:
+                    self._pool_options[key] = value
+
+    def get(self, url):
+        # Returns the Engine for url (a str or sqlalchemy URL), creating it
+        # on first use.
+        url = make_url(url)
+        with self._lock:
+            engine = self._engines.get(url)
+            if engine is None:
+                engine = create_engine(
+                    url, **get_dialect(url).engine_options(url, self._pool_options))
+                self._engines[url] = engine
+            return engine
+
+    def stats(self):
+        # Returns a list of dicts, one per engine, describing its pool:
+        #   url:         the engine's URL, without the password.
+        #   pool:        the class name of the pool.
+        #   size:        connections the pool keeps open.
+        #   checked_in:  idle connections in the pool.
+        #   checked_out: connections currently in use.
+        #   overflow:    connections opened beyond size.
+        # Only a QueuePool keeps the counts; they are None for other pools
+        # (e.g. the StaticPool of an in-memory SQLite database).
+        with self._lock:
+            engines = list(self._engines.values())
+
+        stats = []
+        for engine in engines:
+            pool = engine.pool
+            if isinstance(pool, QueuePool):
+                counts = {
+                    "size": pool.size(),
+                    "checked_in": pool.checkedin(),
+                    "checked_out": pool.checkedout(),
+                    "overflow": pool.overflow(),
+                }
+            else:
+                counts = dict.fromkeys(["size", "checked_in", "checked_out", "overflow"])
+            stats.append(dict(url=repr(engine.url), pool=type(pool).__name__, **counts))
+        return stats
+
+    def dispose(self):
+        # Close every pooled connection and forget every engine.
+        with self._lock:
+            engines = list(self._engines.values())
+            self._engines = {}
+
+        for engine in engines:
+            engine.dispose()
+
+
+engines = Engines()
@@ -0,0 +1,222 @@
+import numpy
+import pandas
+from sqlalchemy.exc import SQLAlchemyError
+
+from .table import Table
+from .flagged_data import Flagged_Data
+import flaggers.flagger as flagger
+
+
+# Bits available in a BIGINT flags column. The sign bit is left alone so
+# masks stay positive.
+MAX_FLAG_ID = 62
+
+
+class Flagged_Bitmask(Flagged_Data):
+    # Alternative storage layout for Flagged_Data: one row per flagged row_id,
+    # with every flag raised on the row OR'ed into a BIGINT. Flag f is bit
+    # (1 << f). Takes and returns the same data as Flagged_Data, so it can be
+    # used in its place.
+
+    def __init__(self, user=None, passwd=None, hostname=None, db_name=None, schema="hive", engine=None):
+        super().__init__(user, passwd, hostname, db_name, schema, engine)
+        self._table_name = "flagged_bitmask"
+        self._view_name = "flagged_bitmask_rows"
+        # Shape of the data given to the writers and returned by
+        # query_by_flag_id, the same as Flagged_Data.
+        self._row_cols = self._expected_cols
+        self._expected_cols = [
+            "row_id",
+            "service_key",
+            "flags",
+            "service_date"
+        ]
+        table = "".join([self._schema, ".", self._table_name])
+
+        # A b-tree cannot index a bitwise predicate, so every flag gets a
+        # partial index instead. Single-flag lookups use their flag's index,
+        # multi-flag lookups combine them with a BitmapOr/BitmapAnd.
+        # The view expands the masks back into one row per flag.
+        self._creation_sql = "".join(["""
+            CREATE TABLE IF NOT EXISTS """, table, """
+            (
+                row_id INTEGER,
+                service_key INTEGER REFERENCES """, self._schema, """.service_periods(service_key),
+                flags BIGINT NOT NULL,
+                service_date DATE NOT NULL,
+                PRIMARY KEY (service_key, row_id)
+            );
+            CREATE INDEX IF NOT EXISTS """, self._table_name, """_service_date
+                ON """, table, """ (service_date);"""] +
+            ["".join(["""
+            CREATE INDEX IF NOT EXISTS """, self._table_name, "_flag_", str(flag.value), """
+                ON """, table, " (row_id) WHERE ", self._flag_predicate(flag), ";"])
+             for flag in flagger.Flags] +
+            ["""
+            CREATE OR REPLACE VIEW """, self._schema, ".", self._view_name, """ AS
+                SELECT fb.row_id, fb.service_key, f.flag_id, fb.service_date
+                FROM """, table, """ AS fb
+                JOIN """, self._schema, """.flags AS f
+                ON (fb.flags & (1::BIGINT << f.flag_id)) <> 0;"""])
+
+    #######################################################
+
+    def write_table(self, data, upsert=False):
+        # data is list of [row_id, service_key, flag_id, service_date].
+        # Flags are added to the mask already stored for a row. If upsert is
+        # True, the stored mask is replaced instead.
+        if data == []:
+            self._ios.log_and_print(
+                "write_table recieved no data to write, cancelling.",
+                self._ios.Severity.ERROR)
+            return False
+
+        df = self._to_masks(data)
+        if df is None:
+            return False
+
+        if upsert:
+            update_columns = ["flags", "service_date"]
+        else:
+            update_columns = {"flags": self._table_name + ".flags | EXCLUDED.flags"}
+        return self._write_table(df,
+                 conflict_columns=["service_key", "row_id"],
+                 update_columns=update_columns)
+
+    #######################################################
+
+    # Same as Flagged_Data.replace_date_range: the masks stored for the range
+    # are replaced by the masks built from data.
+    def replace_date_range(self, data, start_date, end_date=None):
+        start_date, end_date = self._process_dates(start_date, end_date)
+        if start_date is None:
+            self._ios.log_and_print(
+                "Could not determine the date(s).", self._ios.Severity.ERROR)
+            return False
+
+        if data == []:
+            return self.delete_date_range(start_date, end_date)
+
+        df = self._to_masks(data)
+        if df is None:
+            return False
+
+        replace_where = "".join([
+            self._table_name, ".service_date BETWEEN ",
+            start_date.strftime("'%Y-%m-%d'"), " AND ",
+            end_date.strftime("'%Y-%m-%d'")])
+        return self._write_table(df,
+                 conflict_columns=["service_key", "row_id"],
+                 update_columns=["flags", "service_date"],
+                 replace_where=replace_where)
+
+    #######################################################
+
+    # Returns up to limit rows raising flag_id, in Flagged_Data's shape.
+    def query_by_flag_id(self, flag_id, limit):
+        flag_id = int(flag_id)
+        sql = "".join(["SELECT row_id, service_key, ", str(flag_id),
+                       " AS flag_id, service_date FROM ",
+                       self._schema, ".", self._table_name,
+                       " WHERE ", self._flag_predicate(flag_id),
+                       " LIMIT '", str(limit), "';"])
+
+        return self._query_table(sql, self._row_cols)
+
+    #######################################################
+
+    # Returns the stored masks of the rows raising any of flag_ids, or all of
+    # them if match_all is True. limit of None returns every matching row.
+    def query_by_flags(self, flag_ids, match_all=False, limit=None):
+        # One predicate per flag so each can use its partial index.
+        joiner = " AND " if match_all else " OR "
+        sql = "".join(["SELECT * FROM ", self._schema, ".", self._table_name,
+                       " WHERE ", joiner.join([self._flag_predicate(flag_id)
+                                               for flag_id in flag_ids])])
+        if limit is not None:
+            sql += "".join([" LIMIT '", str(limit), "'"])
+
+        return self._query_table(sql + ";")
+
+    #######################################################
+
+    def create_view_for_flag(self, flag):
+        # flag is one of flagger's Flags enum. The view has the same name and
+        # columns as Flagged_Data's.
+        view_name = "view_" + flagger.flag_descriptions[flag].desc
+        sql = "".join([
+            "CREATE VIEW ", self._schema, ".", view_name, " AS\n",
+            "SELECT row_id, service_key, ", str(flag.value),
+            " AS flag_id, service_date FROM ",
+            self._schema, ".", self._table_name,
+            " WHERE ", self._flag_predicate(flag), ";"
+        ])
+
+        try:
+            self._ios.log_and_print(sql)
+            with self._connect() as con:
+                con.execute(sql)
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: "+ str(error), self._ios.Severity.ERROR)
+            return False
+        return True
+
+    #######################################################
+
+    def write_csv(self, path, data, append=False):
+        # data is list of [row_id, service_key, flag_id, service_date], saved
+        # as masks like the table.
+        df = self._to_masks(data)
+        if df is None:
+            return False
+
+        return Table.write_csv(self, df, path, append)
+
+    #######################################################
+
+    def _parquet_frame(self, data):
+        # Parquet files hold the masks, like the table.
+        df = self._to_masks(data)
+        if df is None:
+            return None
+
+        df["service_date"] = pandas.to_datetime(df["service_date"], format="%Y/%m/%d")
+        return df.astype({"row_id": "int64", "service_key": "int32", "flags": "int64"})
+
+    def _merge_parquet(self, existing, part):
+        # One mask per row, like the table: the masks of a row are OR'd.
+        df = pandas.concat([existing, part], ignore_index=True)
+        repeated = df.duplicated(["row_id", "service_key"], keep=False).to_numpy()
+        if not repeated.any():
+            return df
+
+        merged = df[repeated].groupby(["row_id", "service_key"], sort=False)["flags"] \
+            .agg(lambda flags: numpy.bitwise_or.reduce(flags.to_numpy())).reset_index()
+        return pandas.concat([df[~repeated], merged[list(df.columns)]], ignore_index=True) \
+            .astype(df.dtypes.to_dict())
+
+    #######################################################
+
+    def _flag_predicate(self, flag_id):
+        # Must match the partial indexes' predicates exactly for the planner
+        # to use them.
+        return "".join(["(flags & ", str(1 << int(flag_id)), ") <> 0"])
+
+    def _to_masks(self, data):
+        # Turns a list of [row_id, service_key, flag_id, service_date] into a
+        # DataFrame of one mask per row_id. Returns None if a flag_id does not
+        # fit in the mask.
+        df = pandas.DataFrame(data, columns=self._row_cols)
+        if (df["flag_id"] > MAX_FLAG_ID).any():
+            self._ios.log_and_print(
+                "flag_id above " + str(MAX_FLAG_ID) + " cannot be stored in a bitmask.",
+                self._ios.Severity.ERROR)
+            return None
+
+        df = df.drop_duplicates(["row_id", "service_key", "flag_id"])
+        df["flags"] = numpy.left_shift(numpy.int64(1), df["flag_id"].to_numpy(dtype="int64"))
+        # Bits are unique per row once duplicates are dropped, so the sum is
+        # the OR of the bits.
+        df = df.groupby(["row_id", "service_key", "service_date"], sort=False)["flags"].sum()
+        return df.reset_index()[self._expected_cols]
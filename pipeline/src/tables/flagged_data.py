@@ -33,22 +33,47 @@ class Flagged_Data(Table):
 
     #######################################################
 
-    def write_table(self, data):
-        # data is list of [row_id, flag_id, service_key].
+    def write_table(self, data, upsert=False):
+        # data is list of [row_id, service_key, flag_id, service_date].
+        # If upsert is True, rows that already exist are updated in place
+        # instead of being skipped.
         if data == []:
             self._ios.log_and_print(
                 "write_table recieved no data to write, cancelling.",
                 self._ios.Severity.ERROR)
             return False
             
-        df = pandas.DataFrame(data, columns=[
-            "row_id",
-            "service_key",
-            "flag_id",
-            "service_date",
-            ])
+        df = pandas.DataFrame(data, columns=self._expected_cols)
         return self._write_table(df, 
-                 conflict_columns=["row_id", "flag_id", "service_key"])
+                 conflict_columns=["row_id", "flag_id", "service_key"],
+                 update_columns=["service_date"] if upsert else None)
+
+    #######################################################
+
+    # Replace the flags stored for service dates between start_date and
+    # end_date (inclusive) with data, in one transaction: rows in data are
+    # upserted and stored rows in the range missing from data are deleted.
+    # This lets a reprocess overwrite in place instead of deleting the range
+    # and inserting it again.
+    def replace_date_range(self, data, start_date, end_date=None):
+        start_date, end_date = self._process_dates(start_date, end_date)
+        if start_date is None:
+            self._ios.log_and_print(
+                "Could not determine the date(s).", self._ios.Severity.ERROR)
+            return False
+
+        if data == []:
+            return self.delete_date_range(start_date, end_date)
+
+        df = pandas.DataFrame(data, columns=self._expected_cols)
+        replace_where = "".join([
+            self._table_name, ".service_date BETWEEN ",
+            start_date.strftime("'%Y-%m-%d'"), " AND ",
+            end_date.strftime("'%Y-%m-%d'")])
+        return self._write_table(df,
+                 conflict_columns=["row_id", "flag_id", "service_key"],
+                 update_columns=["service_date"],
+                 replace_where=replace_where)
 
     #######################################################
 
@@ -121,15 +146,17 @@ class Flagged_Data(Table):
                        ";"])
         try:
             self._ios.log_and_print(sql)
-            conn = self._engine.connect()
-            value = conn.execute(sql)
+            with self._connect() as conn:
+                result = conn.execute(sql)
+                if result is not None:
+                    value = result.first()
         except SQLAlchemyError as error:
             self._ios.log_and_print(
                 "SQLAlchemyError: "+ str(error), self._ios.Severity.ERROR)
             return None
         
         if value is not None:
-            return value.first()[0]
+            return self._dialect.date_value(value[0])
         else:
             return None
 
@@ -156,8 +183,8 @@ class Flagged_Data(Table):
         self._ios._print(sql)
         try:
             self._ios.log_and_print(sql)
-            conn = self._engine.connect()
-            conn.execute(sql)
+            with self._connect() as conn:
+                conn.execute(sql)
         except SQLAlchemyError as error:
             self._ios.log_and_print(
                 "SQLAlchemyError: "+ str(error), self._ios.Severity.ERROR)
@@ -209,7 +236,7 @@ class Flagged_Data(Table):
 
         try:
             self._ios.log_and_print(sql)
-            with self._engine.connect() as con:
+            with self._connect() as con:
                 con.execute(sql)
         except SQLAlchemyError as error:
             self._ios.log_and_print(
@@ -226,23 +253,72 @@ class Flagged_Data(Table):
                 status = False
         return status
 
-    def write_csv(self, path, data):
+    def write_csv(self, path, data, append=False):
         """
         Function that saves flagged data to csv: actual saving is done by parent class (Table)
 
         Args: 
             path    (String): relative path to where csv will be saved. 
             data    (Array) : list of flagged rows (flagged data)
+            append  (Boolean): add the rows to an existing csv instead of overwriting it
 
         Returns: 
             Boolean representing state of the operation (successfull write: True, error during process: False)
         """
 
         #Append expected cols to beginning of the list to create header row in the csv
-        data.insert(0, self._expected_cols)
+        if not append:
+            data.insert(0, self._expected_cols)
 
         #Create dataframe that will be saved to csv
         df = pandas.DataFrame(data)
 
         #Call parent function that does actual saving
-        return super().write_csv(df, path)
+        return super().write_csv(df, path, append)
+
+    def write_parquet(self, path, data, days, merge=False, staging=None):
+        """
+        Function that saves flagged data as parquet files partitioned by service_date: actual saving is done by
+        parent class (Table), see Table._write_parquet.
+
+        Args:
+            path    (String) : relative path to where the files will be saved.
+            data    (Array)  : list of flagged rows (flagged data)
+            days    (List)   : every service date processed, including the ones without flagged rows
+            merge   (Boolean): add data to the flags already saved for its days instead of replacing them
+            staging (String) : staging directory of the run (see parquet_staging), published by publish_parquet
+
+        Returns:
+            Boolean representing state of the operation (successfull write: True, error during process: False)
+        """
+
+        df = self._parquet_frame(data)
+        if df is None:
+            return False
+
+        return self._write_parquet(df, path, days, merge, staging)
+
+    def publish_parquet(self, path, days, staging, merge=False):
+        """
+        Function that publishes the flagged data staged by write_parquet at the end of a run, see
+        Table._publish_parquet.
+
+        Args:
+            path    (String) : relative path to where the files are saved.
+            days    (List)   : every service date processed, including the ones without flagged rows
+            staging (String) : staging directory of the run
+            merge   (Boolean): see write_parquet
+
+        Returns:
+            Boolean representing state of the operation (successfull write: True, error during process: False)
+        """
+
+        empty = self._parquet_frame([]).drop(columns="service_date")
+        return self._publish_parquet(path, days, staging, empty, merge)
+
+    def _parquet_frame(self, data):
+        # Typed DataFrame of data, as stored in the parquet files.
+        df = pandas.DataFrame(data, columns=self._expected_cols)
+        df["service_date"] = pandas.to_datetime(df["service_date"], format="%Y/%m/%d")
+        return df.astype({"row_id": "int64", "service_key": "int32", "flag_id": "int16"})
+
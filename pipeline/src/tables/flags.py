@@ -28,23 +28,31 @@ class Flags(Table):
 
 
     def write_table(self, flags):
-        # flags is a list of [flag_id, flag_name]
+        # flags is a list of [flag_id, description, name]
+        # Existing flags are updated, so renamed flags are picked up without
+        # dropping the table.
         df = pandas.DataFrame(flags, columns=self._expected_cols)
-        return self._write_table(df, conflict_columns=["flag_id"])
+        return self._write_table(df, conflict_columns=["flag_id"],
+                                 update_columns=["description", "name"])
 
 
-    def create_table(self):
-        # Flags are written into the database on creation.
-        if not super().create_table():
-            return False
-
+    def write_flags(self):
+        # Upsert every flag of flagger.Flags, so flagged data referencing a
+        # flag added since the table was created can be written.
         flags = []
         for flag in flagger.Flags:
             fd = flagger.flag_descriptions[flag]
             flags.append([flag.value, fd.desc, fd.name])
 
-        self.write_table(flags)
-        return 
+        return self.write_table(flags)
+
+
+    def create_table(self):
+        # Flags are written into the database on creation.
+        if not super().create_table():
+            return False
+
+        return self.write_flags()
 
     def write_csv(self, path):
         """
@@ -0,0 +1,93 @@
+import pandas
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from .table import Table
+
+
+class Row_Hashes(Table):
+    # Content hash of every processed CTran row, with the row_id of the first
+    # row seen with that content, per service period. Backs the exact check
+    # of Row_History, and like its Bloom filters only holds the service
+    # periods it keeps (see retain_service_keys).
+
+    def __init__(self, user=None, passwd=None, hostname=None, db_name=None, schema="hive", engine=None):
+        super().__init__(user, passwd, hostname, db_name, schema, engine)
+        self._table_name = "row_hashes"
+        self._index_col = None
+        self._expected_cols = [
+            "service_key",
+            "row_hash",
+            "row_id"
+        ]
+        self._creation_sql = "".join(["""
+            CREATE TABLE IF NOT EXISTS """, self._schema, ".", self._table_name, """
+            (
+                service_key INTEGER,
+                row_hash BIGINT,
+                row_id BIGINT NOT NULL,
+                PRIMARY KEY (service_key, row_hash)
+            );"""])
+
+    #######################################################
+
+    def write_table(self, data):
+        # data is list of [service_key, row_hash, row_id], row_hash signed.
+        # The first row_id stored for a hash is kept.
+        if data == []:
+            return True
+
+        df = pandas.DataFrame(data, columns=self._expected_cols)
+        return self._write_table(df, conflict_columns=["service_key", "row_hash"])
+
+    #######################################################
+
+    # Return a DataFrame of the stored row_hash and row_id of the given
+    # hashes of service_key, None on failure.
+    def query_hashes(self, service_key, hashes):
+        sql = "".join(["SELECT * FROM ", self._schema, ".", self._table_name,
+                       " WHERE service_key = ", str(int(service_key)),
+                       " AND row_hash IN (",
+                       ", ".join([str(int(row_hash)) for row_hash in hashes]),
+                       ");"])
+        return self._query_table(sql)
+
+    #######################################################
+
+    # Delete the hashes of the given service_keys. Returns True on success.
+    def delete_service_keys(self, service_keys):
+        if not service_keys:
+            return True
+        return self._delete_where("service_key IN", service_keys)
+
+    #######################################################
+
+    # Delete the hashes of every service_key but the given ones, so the table
+    # only spans the retention window of Row_History. Returns True on
+    # success. An empty service_keys deletes nothing.
+    def retain_service_keys(self, service_keys):
+        if not service_keys:
+            return True
+        return self._delete_where("service_key NOT IN", service_keys)
+
+    ###########################################################################
+    # Private Methods
+
+    def _delete_where(self, condition, service_keys):
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return False
+
+        sql = "".join(["DELETE FROM ", self._schema, ".", self._table_name,
+                       " WHERE ", condition, " (",
+                       ", ".join([str(int(key)) for key in service_keys]),
+                       ");"])
+        try:
+            self._ios.log_and_print(sql)
+            with self._connect() as con:
+                con.execute(sql)
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return False
+        return True
@@ -0,0 +1,303 @@
+import os
+import math
+import uuid
+import threading
+import numpy
+import pandas
+
+from ..ios import ios
+from flaggers.duplicate import row_hashes
+
+
+""" Row_History
+Content hashes of every processed CTran row, so duplicates of rows processed
+in an earlier run (a day boundary, or a day re-ingested by Portal) can be
+found without reading those runs again. Each service period has a Bloom
+filter memory-mapped from <path><service_key>.bloom, which clears most rows
+without touching the database. Rows it cannot clear are checked against the
+row_hashes table, then compared column by column with the earlier row read
+back from Portal. Only the latest service periods are kept.
+For more, see docs/db_ops.md
+"""
+class Row_History():
+
+    def __init__(self, path, capacity, periods, row_hashes_table, ctran, service_periods,
+                 error_rate=0.01):
+        self._ios = ios
+        self._path = path
+        # Rows per service period the filters are sized for.
+        self._capacity = capacity
+        self._periods = periods
+        self._error_rate = error_rate
+        self._row_hashes = row_hashes_table
+        self._ctran = ctran
+        self._service_periods = service_periods
+        self._filters = {}
+        # Whether the history was rotated since it was opened. The first
+        # check rotates, which prunes what earlier runs left behind.
+        self._rotated = False
+        # Filters are updated in place, so concurrent checks (backfill) take
+        # turns. Not safe across processes.
+        self._lock = threading.Lock()
+        # Max values per IN list sent to the database.
+        self._query_chunksize = 10000
+
+    #######################################################
+
+    def check(self, df, service_keys, exclude=(), hashes=None):
+        # df is CTran data indexed by row_id, service_keys a Series aligned
+        # with df (rows with NaN are skipped). Returns a list of
+        # (row_id, first_row_id, service_key, service_date), one per row of df
+        # with the same content as an earlier row not in df, then adds df's
+        # rows to the history. Rows whose row_id is in exclude are not
+        # returned. hashes is row_hashes(df), if already computed.
+        if hashes is None:
+            hashes = row_hashes(df)
+        keys = service_keys.to_numpy(dtype="float64")
+        row_ids = df.index.to_numpy()
+        batch_ids = set(row_ids.tolist())
+
+        candidates = []
+        created = False
+        with self._lock:
+            for key in pandas.unique(keys[~numpy.isnan(keys)]):
+                key = int(key)
+                selected = keys == key
+                key_hashes = hashes[selected]
+                key_row_ids = row_ids[selected]
+
+                if key not in self._filters:
+                    created = created or not os.path.exists(self._filter_path(key))
+                bloom = self._filter(key)
+                if bloom is None:
+                    continue
+
+                maybe = bloom.contains(key_hashes)
+                if maybe.any():
+                    candidates.extend(self._lookup(key, key_hashes[maybe], key_row_ids[maybe],
+                                                   batch_ids))
+                self._record(key, bloom, key_hashes, key_row_ids)
+
+            if created or not self._rotated:
+                self._rotate()
+
+        candidates = [candidate for candidate in candidates if candidate[0] not in exclude]
+        return self._verify(df, candidates)
+
+    #######################################################
+
+    def close(self):
+        with self._lock:
+            for bloom in self._filters.values():
+                bloom.close()
+            self._filters = {}
+
+    #######################################################
+
+    def _lookup(self, service_key, hashes, row_ids, batch_ids):
+        # Returns (row_id, first_row_id, service_key) of the rows whose hash
+        # is stored for another row. Rows first seen in this batch are left to
+        # the Duplicate flagger.
+        signed = hashes.view("int64")
+        unique = numpy.unique(signed)
+        frames = []
+        for start in range(0, len(unique), self._query_chunksize):
+            stored = self._row_hashes.query_hashes(
+                service_key, unique[start:start + self._query_chunksize].tolist())
+            if stored is None:
+                self._ios.log_and_print(
+                    "Could not read row_hashes, skipping the history check.",
+                    self._ios.Severity.WARNING)
+                return []
+            frames.append(stored)
+
+        first_row_ids = pandas.concat(frames).set_index("row_hash")["row_id"]
+        found = []
+        for row_id, row_hash in zip(row_ids.tolist(), signed.tolist()):
+            first_row_id = first_row_ids.get(row_hash)
+            if first_row_id is None or int(first_row_id) in batch_ids:
+                continue
+            found.append((row_id, int(first_row_id), service_key))
+        return found
+
+    def _record(self, service_key, bloom, hashes, row_ids):
+        # Add the rows of one service period to its filter and row_hashes.
+        bloom.add(hashes)
+        df = pandas.DataFrame({"service_key": service_key,
+                               "row_hash": hashes.view("int64"),
+                               "row_id": row_ids})
+        df = df.sort_values("row_id").drop_duplicates("row_hash")
+        if not self._row_hashes.write_table(df.values.tolist()):
+            self._ios.log_and_print(
+                "Could not record row hashes of service_key " + str(service_key) + ".",
+                self._ios.Severity.WARNING)
+
+    def _verify(self, df, candidates):
+        # Keep the candidates whose content equals the earlier row's, read back
+        # from Portal. Hashes can collide, the rows cannot.
+        if not candidates:
+            return []
+
+        first_row_ids = sorted(set(candidate[1] for candidate in candidates))
+        frames = []
+        for start in range(0, len(first_row_ids), self._query_chunksize):
+            earlier = self._ctran.query_row_ids(first_row_ids[start:start + self._query_chunksize])
+            if earlier is None:
+                self._ios.log_and_print(
+                    "Could not read back earlier rows, skipping the history check.",
+                    self._ios.Severity.WARNING)
+                return []
+            frames.append(earlier)
+        earlier = pandas.concat(frames)
+        earlier = earlier[~earlier.index.duplicated()]
+
+        left = df.loc[[candidate[0] for candidate in candidates]]
+        right = earlier.reindex([candidate[1] for candidate in candidates])[list(df.columns)]
+        # <NA> has no truth value, nulls are compared as None.
+        left = left.astype(object).where(left.notna(), None).to_numpy()
+        right = right.astype(object).where(right.notna(), None).to_numpy()
+        same = ((left == right) | (pandas.isna(left) & pandas.isna(right))).all(axis=1)
+
+        service_dates = df["service_date"]
+        return [(row_id, first_row_id, service_key, service_dates.loc[row_id])
+                for (row_id, first_row_id, service_key), is_same in zip(candidates, same)
+                if is_same]
+
+    def _rotate(self):
+        # Drop every service period but the latest ones by start date: their
+        # filter files, and the row_hashes rows of every other service_key,
+        # including periods whose filter file is already gone. Reprocessing
+        # an old period must not evict the current one, so the order is not
+        # the one the files were written in. Must be called with the lock held.
+        entries = []
+        try:
+            names = os.listdir(self._path)
+        except OSError:
+            return
+
+        for name in names:
+            if not name.endswith(".bloom"):
+                continue
+            try:
+                entries.append(int(name[:-len(".bloom")]))
+            except ValueError:
+                continue
+
+        # Without a filter there is nothing to tell the kept periods by.
+        if not entries:
+            return
+
+        start_dates = self._service_periods.get_start_dates()
+        if start_dates is None:
+            self._ios.log_and_print(
+                "Could not read the service periods, the row history is not rotated.",
+                self._ios.Severity.WARNING)
+            return
+        # Periods whose start date is unknown sort as the oldest.
+        oldest = numpy.datetime64(0, "D")
+        entries = sorted(entries, reverse=True,
+                         key=lambda key: (start_dates.get(key, oldest), key))
+        kept = entries[:self._periods]
+        expired = entries[self._periods:]
+        for service_key in expired:
+            bloom = self._filters.pop(service_key, None)
+            if bloom is not None:
+                bloom.close()
+            try:
+                os.remove(self._filter_path(service_key))
+            except OSError:
+                pass
+
+        if self._row_hashes.retain_service_keys(kept):
+            self._rotated = True
+        if expired:
+            self._ios.log_and_print(
+                "Rotated out the row history of service_keys " + str(expired) + ".")
+
+    def _filter(self, service_key):
+        bloom = self._filters.get(service_key)
+        if bloom is None:
+            try:
+                os.makedirs(self._path, exist_ok=True)
+                bloom = Bloom_Filter(self._filter_path(service_key), self._capacity,
+                                     self._error_rate)
+            except (OSError, ValueError) as error:
+                self._ios.log_and_print(
+                    "Could not open the row history filter: " + str(error),
+                    self._ios.Severity.WARNING)
+                return None
+            self._filters[service_key] = bloom
+        return bloom
+
+    def _filter_path(self, service_key):
+        return "".join([self._path, str(service_key), ".bloom"])
+
+
+class Bloom_Filter():
+    # Bloom filter over 64-bit hashes, memory-mapped from a file so it
+    # persists between runs and is only paged in where it is used. The file
+    # starts with two uint64: the number of bit positions per hash, then the
+    # number of bits.
+
+    _header_bytes = 16
+
+    def __init__(self, path, capacity, error_rate=0.01):
+        if not os.path.exists(path):
+            self._create(path, capacity, error_rate)
+
+        header = numpy.fromfile(path, dtype=numpy.uint64, count=2)
+        if len(header) != 2 or header[1] == 0 or header[1] % 8:
+            raise ValueError(path + " is not a Bloom filter.")
+        self._hashes = int(header[0])
+        self._bits = numpy.uint64(header[1])
+        self._array = numpy.memmap(path, dtype=numpy.uint8, mode="r+",
+                                   offset=self._header_bytes, shape=(int(header[1]) // 8,))
+
+    #######################################################
+
+    def add(self, hashes):
+        positions = self._positions(hashes).ravel()
+        numpy.bitwise_or.at(self._array, positions >> numpy.uint64(3),
+                            (numpy.uint64(1) << (positions & numpy.uint64(7))).astype(numpy.uint8))
+        self._array.flush()
+
+    #######################################################
+
+    def contains(self, hashes):
+        # Returns a bool array, False where a hash was certainly never added.
+        positions = self._positions(hashes)
+        bits = self._array[positions >> numpy.uint64(3)] >> (positions & numpy.uint64(7)).astype(numpy.uint8)
+        return (bits & 1).astype(bool).all(axis=1)
+
+    #######################################################
+
+    def close(self):
+        self._array.flush()
+        self._array = None
+
+    #######################################################
+
+    def _positions(self, hashes):
+        # Double hashing: position i of a hash is h1 + i * h2, from its two
+        # 32-bit halves. Returns an array of shape (len(hashes), hashes).
+        hashes = numpy.asarray(hashes, dtype=numpy.uint64)
+        low = hashes & numpy.uint64(0xFFFFFFFF)
+        high = (hashes >> numpy.uint64(32)) | numpy.uint64(1)
+        steps = numpy.arange(self._hashes, dtype=numpy.uint64)
+        return (low[:, None] + steps[None, :] * high[:, None]) % self._bits
+
+    def _create(self, path, capacity, error_rate):
+        # Size the filter for capacity hashes at error_rate false positives.
+        # The file is written aside then renamed, so a reader never sees a
+        # partial header.
+        bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2 / 8)) * 8
+        hashes = max(1, int(round(bits / capacity * math.log(2))))
+        temp_path = "".join([path, ".", uuid.uuid4().hex, ".tmp"])
+        try:
+            with open(temp_path, "wb") as temp_file:
+                numpy.array([hashes, bits], dtype=numpy.uint64).tofile(temp_file)
+                temp_file.truncate(self._header_bytes + bits // 8)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
@@ -1,3 +1,5 @@
+import threading
+import numpy
 import pandas
 
 from .table import Table
@@ -23,18 +25,24 @@ class Service_Periods(Table):
                 end_date DATE NOT NULL,
                 UNIQUE (start_date, end_date)
             );"""])
+        # In-memory interval index of the known service periods, sorted by
+        # start_date. Loaded on the first call to resolve().
+        self._starts = None
+        self._ends = None
+        self._keys = None
+        self._lock = threading.Lock()
 
     
     def write_table(self, dates):
-        # Dates: list of datetime dates. Only important value in the dates are
-        # month and year.
+        # Dates: list of datetime dates. Writes the service period each date
+        # falls in; periods that already exist are left as they are.
         # NOTE: not currently being used but could be useful in the future.
-        data = []
+        data = set()
         for date in dates:
-            data.append([date.month, date.year, self.get_ternary(date.month)])
-        df = pandas.DataFrame(data, columns=self._expected_cols)
-        # service_key is BIGSERIAL so there should never be a conflict.
-        return self._write_table(df)  
+            data.add(self.get_service_period(date))
+        df = pandas.DataFrame(sorted(data), columns=self._expected_cols)
+        # service_key is BIGSERIAL, so conflicts can only come from the dates.
+        return self._write_table(df, conflict_columns=["start_date", "end_date"])
 
 
     def query(self, date):
@@ -53,10 +61,10 @@ class Service_Periods(Table):
                        " BETWEEN start_date AND end_date;"
                        ])
         try:
-            with self._engine.connect() as con:
-                result = con.execute(sql)
-                if result.rowcount != 0:
-                    return result.first()["service_key"]
+            with self._connect() as con:
+                row = con.execute(sql).first()
+                if row is not None:
+                    return row["service_key"]
         except SQLAlchemyError as error:
             self._ios.log_and_print(
                 "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
@@ -83,9 +91,10 @@ class Service_Periods(Table):
                        end_date.strftime("'%Y-%m-%d'"),
                        ") RETURNING service_key;"])
         try:
-            with self._engine.connect() as con:
-                result = con.execute(sql)
-                return result.first()[0]
+            # The returned row is fetched before the commit, which SQLite
+            # requires of RETURNING.
+            with self._connect() as con, con.begin():
+                return con.execute(sql).first()[0]
         except SQLAlchemyError as error:
             self._ios.log_and_print(
                 "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
@@ -102,6 +111,106 @@ class Service_Periods(Table):
         return self.insert_one(date)
         
 
+    def resolve(self, dates):
+        # Retrieves the service_key of every date in dates, a pandas.Series or
+        # list of dates, datetimes or datetime64s. Dates are matched against
+        # the in-memory interval index; only the periods not found there are
+        # inserted, in a single statement.
+        # Returns a float pandas.Series of service_keys aligned with dates,
+        # with NaN where no service_key could be found or created.
+        if not isinstance(dates, pandas.Series):
+            dates = pandas.Series(dates)
+        days = pandas.to_datetime(dates).to_numpy().astype("datetime64[D]")
+        unique_days, inverse = numpy.unique(days, return_inverse=True)
+
+        with self._lock:
+            if self._starts is None and not self._load_periods():
+                return pandas.Series(numpy.nan, index=dates.index)
+
+            keys = self._lookup(unique_days)
+            missing = numpy.isnan(keys) & ~numpy.isnat(unique_days)
+            if missing.any():
+                periods = set(self.get_service_period(day.astype(dt.date))
+                              for day in unique_days[missing])
+                if self._insert_periods(sorted(periods)) and self._load_periods():
+                    keys = self._lookup(unique_days)
+
+        return pandas.Series(keys[inverse.reshape(-1)], index=dates.index)
+
+
+    def get_start_dates(self):
+        # Returns a dict of service_key: start_date (as datetime64[D]) of every
+        # service period, None on failure.
+        with self._lock:
+            if self._starts is None and not self._load_periods():
+                return None
+            return dict(zip(self._keys.tolist(), self._starts))
+
+
+    def _lookup(self, days):
+        # Finds the service_key of each datetime64[D] in days with the interval
+        # index. Returns a float array, NaN where no period contains the day.
+        keys = numpy.full(len(days), numpy.nan)
+        if len(self._starts) == 0:
+            return keys
+
+        positions = numpy.searchsorted(self._starts, days, side="right") - 1
+        clipped = numpy.clip(positions, 0, None)
+        found = (positions >= 0) & ~numpy.isnat(days) & (days <= self._ends[clipped])
+        keys[found] = self._keys[clipped[found]]
+        return keys
+
+
+    def _load_periods(self):
+        # (Re)load every service period into the interval index.
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return False
+
+        sql = "".join(["SELECT service_key, start_date, end_date FROM ",
+                       self._schema, ".", self._table_name,
+                       " ORDER BY start_date;"])
+        try:
+            with self._connect() as con:
+                rows = con.execute(sql).fetchall()
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return False
+
+        self._keys = numpy.array([row[0] for row in rows], dtype="int64")
+        self._starts = numpy.array([row[1] for row in rows], dtype="datetime64[D]")
+        self._ends = numpy.array([row[2] for row in rows], dtype="datetime64[D]")
+        return True
+
+
+    def _insert_periods(self, periods):
+        # Insert every (start_date, end_date) in periods with one statement.
+        # Periods inserted concurrently by another run are left as they are.
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print(
+                "self._engine is not an Engine, cannot continue.",
+                self._ios.Severity.ERROR)
+            return False
+
+        values = ", ".join(["".join(["(", start_date.strftime("'%Y-%m-%d'"), ", ",
+                                     end_date.strftime("'%Y-%m-%d'"), ")"])
+                            for start_date, end_date in periods])
+        sql = "".join(["INSERT INTO ", self._schema, ".", self._table_name,
+                       " (start_date, end_date) VALUES ", values,
+                       " ON CONFLICT (start_date, end_date) DO NOTHING;"])
+        try:
+            self._ios.log_and_print(sql)
+            with self._connect() as con:
+                con.execute(sql)
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return False
+
+        return True
+
+
     def get_service_period(self, date):
         # Convert date to service periods in the format of (start_date, end_date)
         # date is a datetime object.
@@ -1,13 +1,38 @@
 import abc
 import sys
 import getpass
+import contextlib
 import pandas
-from sqlalchemy import create_engine
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.engine.base import Engine
+from sqlalchemy.engine.url import make_url
 import os
+import uuid
+import shutil
+import datetime
+import tempfile
 
 from ..ios import ios
+from .engines import engines
+from .dialects import get_dialect
+
+# pyarrow is only needed for parquet output, so it is imported on first use
+# rather than with the tables. See _load_pyarrow().
+_pyarrow = None
+_pyarrow_loaded = False
+
+
+def _load_pyarrow():
+    # Returns the pyarrow module, or None if it is not installed.
+    global _pyarrow, _pyarrow_loaded
+    if not _pyarrow_loaded:
+        try:
+            import pyarrow
+            _pyarrow = pyarrow
+        except ImportError:
+            pass
+        _pyarrow_loaded = True
+    return _pyarrow
 
 
 
@@ -25,15 +50,25 @@ class Table(abc.ABC):
         self._ios = ios
         self._table_name = None
         self._index_col = None
+        # Column name to pandas dtype of the query results, set by tables
+        # with a fixed layout. None keeps pandas' inferred dtypes.
+        self._dtypes = None
         self._chunksize = 1000
+        self._write_chunksize = 100000
+        self._spool_size = 64 * 1024 * 1024
+        self._parquet_compression = "snappy"
 
         if schema is None:
             self._schema = self._ios.prompt("Enter the table's schema: ")
         else:
             self._schema = schema
 
+        # The engine is only created, from self._url, when first used, so
+        # tables that are never queried cost nothing to construct.
+        self._engine_created = False
+        self._engine_value = None
         if engine is not None:
-            self._engine = create_engine(engine)
+            self._url = make_url(engine)
 
         else:
             if user is None:
@@ -47,11 +82,26 @@ class Table(abc.ABC):
 
             self._build_engine(user, passwd, hostname, db_name)
 
+        self._dialect = get_dialect(self._url)
+
     #######################################################
 
     def get_engine(self):
         return self._engine
 
+    def get_url(self):
+        # The URL of the database, without creating the engine.
+        return self._url
+
+    def get_schema(self):
+        return self._schema
+
+    #######################################################
+
+    # Number of rows sent per COPY by _write_table.
+    def set_write_chunksize(self, chunksize):
+        self._write_chunksize = chunksize
+
     #######################################################
     
     def get_full_table(self):
@@ -85,11 +135,14 @@ class Table(abc.ABC):
             self._ios.log_and_print("self._engine is not an Engine, cannot continue.", ios.Severity.ERROR)
             return False
 
-        sql = "".join(["CREATE SCHEMA IF NOT EXISTS ", self._schema, ";"])
+        sql = self._dialect.create_schema_sql(self._schema)
+        if sql is None:
+            return True
+
         try:
-            conn = self._engine.connect()
             self._ios.log_and_print(sql)
-            conn.execute(sql)
+            with self._connect() as conn:
+                conn.execute(sql)
 
         except SQLAlchemyError as error:
             self._ios.log_and_print("SQLAlchemy: " + str(error), ios.Severity.ERROR)
@@ -104,11 +157,11 @@ class Table(abc.ABC):
             self._ios.log_and_print("self._engine is not an Engine, cannot continue.", ios.Severity.ERROR)
             return False
 
-        sql = "".join(["DROP SCHEMA IF EXISTS ", self._schema, " CASCADE;"])
         try:
-            conn = self._engine.connect()
-            self._ios.log_and_print(sql)
-            conn.execute(sql)
+            with self._connect() as conn:
+                for sql in self._dialect.drop_schema_sql(conn, self._schema):
+                    self._ios.log_and_print(sql)
+                    conn.execute(sql)
 
         except SQLAlchemyError as error:
             self._ios.log_and_print("SQLAlchemy: " + str(error), ios.Severity.ERROR)
@@ -128,9 +181,10 @@ class Table(abc.ABC):
             return False
 
         try:
-            conn = self._engine.connect()
             self._ios.log_and_print(self._creation_sql)
-            conn.execute(self._creation_sql)
+            with self._connect() as conn:
+                for sql in self._dialect.ddl(self._creation_sql):
+                    conn.execute(sql)
 
         except SQLAlchemyError as error:
             self._ios.log_and_print("SQLAlchemy: " + str(error), ios.Severity.ERROR)
@@ -148,9 +202,9 @@ class Table(abc.ABC):
 
         sql = "".join(["DROP TABLE IF EXISTS " + self._schema + "." + self._table_name + ";"])
         try:
-            conn = self._engine.connect()
             self._ios.log_and_print(sql)
-            conn.execute(sql)
+            with self._connect() as conn:
+                conn.execute(sql)
 
         except SQLAlchemyError as error:
             self._ios.log_and_print("SQLAlchemy: " + str(error), ios.Severity.ERROR)
@@ -161,22 +215,27 @@ class Table(abc.ABC):
     ###########################################################################
     # Protected Methods
 
-    def _write_table(self, df, conflict_columns=None):
+    def _write_table(self, df, conflict_columns=None, update_columns=None, replace_where=None):
         # Write the given dataframe into the database.
         # This method is meant to be called by a subclass.
         # df should be a well formed DataFrame, the subclass should form
         # the DataFrame.
         # conflict_columns should be a list of str values used as primary keys.
         #   if conflict_columns is None, will not do ON CONFLICT.
-        #   ON CONFLICT is always set to DO NOTHING. This is to ensure there
-        #   are no errors when inserting a duplicate row.
+        #   By default ON CONFLICT is set to DO NOTHING. This is to ensure
+        #   there are no errors when inserting a duplicate row.
+        # update_columns is a list of str values. When given with
+        #   conflict_columns, ON CONFLICT will DO UPDATE these columns with
+        #   the new values instead (an upsert). Rows whose values did not
+        #   change are left untouched.
+        # replace_where is a SQL condition. When given with conflict_columns,
+        #   the rows of the table matching it that are not in df are deleted
+        #   in the same transaction, so df replaces that part of the table.
         #
-        # TODO: Add an update option to ON CONFLICT.
-        # Currently ON CONFLICT only exists to stop postgres from
-        # throwing a fit whenever there's a duplicate insert. Would be useful
-        # to have an option to overwrite the duplicate data instead.
-        # Will be very useful for updating the flags table without dropping
-        # the whole thing.
+        # On PostgreSQL through psycopg2 the rows are bulk loaded with COPY.
+        # Dialects binding rows (SQLite) send them as parameters of one
+        # INSERT run for every row, otherwise they are sent as one INSERT
+        # statement.
 
         if not self._table_name:
             self._ios.log_and_print(
@@ -195,6 +254,19 @@ class Table(abc.ABC):
 
         self._ios.log_and_print("Writing to table.")
 
+        if self._engine.driver == "psycopg2":
+            return self._copy_table(df, conflict_columns, update_columns, replace_where)
+
+        if self._dialect.binds_rows:
+            return self._insert_rows(df, conflict_columns, update_columns, replace_where)
+
+        return self._insert_table(df, conflict_columns, update_columns, replace_where)
+
+    #######################################################
+
+    def _insert_table(self, df, conflict_columns=None, update_columns=None, replace_where=None):
+        # Write df with a single INSERT statement. Used by _write_table when
+        # COPY is not available.
         columns = ", ".join(list(df))
         # (value1, value2, ...), (value1, value2, ...), ...
         values = ", ".join(["{}".format(tuple(row)) 
@@ -207,16 +279,48 @@ class Table(abc.ABC):
             "Writing to: ", self._schema, ".", self._table_name]))
 
         if conflict_columns:
-            conflict_columns = "({})".format(
-                               ", ".join([s for s in conflict_columns]))
-            sql += "".join([" ON CONFLICT ", conflict_columns, " DO NOTHING;"])
+            sql += self._on_conflict_sql(conflict_columns, update_columns) + ";"
+            if replace_where:
+                # Without a staging table to compare against, clear the
+                # replaced rows first; both statements run in one transaction.
+                sql = "".join(["DELETE FROM ", self._schema, ".", self._table_name,
+                               " WHERE ", replace_where, "; ", sql])
 
         try:
-            con = self._engine.connect()
             # This /doesn't/ log the SQL here as opposed to how it usually is
             # because that would blow away the terminanl and make the file
             # extremely hard to read and needlessly long.
-            con.execute(sql)
+            with self._connect() as con:
+                con.execute(sql)
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error).splitlines()[0],
+                ios.Severity.ERROR)
+            return False
+
+        return True
+
+    #######################################################
+
+    def _insert_rows(self, df, conflict_columns=None, update_columns=None, replace_where=None):
+        # Write df with one INSERT executed for every row, the values bound as
+        # parameters, in a single transaction. Used by _write_table for
+        # dialects binding rows.
+        target = "".join([self._schema, ".", self._table_name])
+        sql = "".join(["INSERT INTO ", target, " (", ", ".join(list(df)), ") VALUES (",
+                       ", ".join([self._dialect.placeholder] * len(df.columns)), ")"])
+        if conflict_columns:
+            sql += self._on_conflict_sql(conflict_columns, update_columns)
+
+        self._ios.log_and_print("".join(["Writing to: ", target]))
+        try:
+            with self._connect() as con:
+                with con.begin():
+                    if conflict_columns and replace_where:
+                        con.execute("".join(["DELETE FROM ", target, " WHERE ", replace_where, ";"]))
+                    rows = self._dialect.rows(con, self._schema, self._table_name, df)
+                    for start in range(0, len(rows), self._write_chunksize):
+                        con.execute(sql + ";", rows[start:start + self._write_chunksize])
         except SQLAlchemyError as error:
             self._ios.log_and_print(
                 "SQLAlchemyError: " + str(error).splitlines()[0],
@@ -227,12 +331,120 @@ class Table(abc.ABC):
 
     #######################################################
 
-    def _check_cols(self, sample_df):
+    def _copy_table(self, df, conflict_columns=None, update_columns=None, replace_where=None):
+        # Bulk load df with COPY FROM STDIN, _write_chunksize rows at a time,
+        # in a single transaction.
+        # COPY has no ON CONFLICT, so when conflict_columns is given the rows
+        # are copied into a temporary staging table first (temporary tables
+        # are not WAL-logged) and merged into the table with one set-based
+        # INSERT ... SELECT ... ON CONFLICT.
+        target = "".join([self._schema, ".", self._table_name])
+        self._ios.log_and_print("".join(["Writing to: ", target]))
+
+        con = None
+        try:
+            con = self._engine.raw_connection()
+            cursor = con.cursor()
+            if conflict_columns:
+                staging = self._table_name + "_staging"
+                columns = ", ".join(list(df))
+                cursor.execute("".join([
+                    "CREATE TEMP TABLE ", staging, " (LIKE ", target,
+                    " INCLUDING DEFAULTS) ON COMMIT DROP;"]))
+                self._copy_rows(cursor, df, staging)
+                cursor.execute("".join([
+                    "INSERT INTO ", target, " (", columns, ") SELECT ", columns,
+                    " FROM ", staging,
+                    self._on_conflict_sql(conflict_columns, update_columns), ";"]))
+                if replace_where:
+                    matches = " AND ".join(["".join([staging, ".", col, " = ",
+                                                     self._table_name, ".", col])
+                                            for col in conflict_columns])
+                    cursor.execute("".join([
+                        "DELETE FROM ", target, " WHERE ", replace_where,
+                        " AND NOT EXISTS (SELECT 1 FROM ", staging, " WHERE ",
+                        matches, ");"]))
+            else:
+                self._copy_rows(cursor, df, target)
+            con.commit()
+        except (SQLAlchemyError, self._engine.dialect.dbapi.Error) as error:
+            if con is not None:
+                con.rollback()
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error).splitlines()[0],
+                ios.Severity.ERROR)
+            return False
+        finally:
+            if con is not None:
+                con.close()
+
+        return True
+
+    #######################################################
+
+    def _on_conflict_sql(self, conflict_columns, update_columns=None):
+        # ON CONFLICT clause for _write_table. The existing row is referred to
+        # by the table's name, the new row by EXCLUDED.
+        # update_columns is a list of columns set to their new value, or a
+        # dict of column: SQL expression to set the column to instead.
+        sql = "".join([" ON CONFLICT (", ", ".join(conflict_columns), ")"])
+        if not update_columns:
+            return sql + " DO NOTHING"
+
+        if not isinstance(update_columns, dict):
+            update_columns = {col: "EXCLUDED." + col for col in update_columns}
+
+        assignments = ", ".join([col + " = " + value for col, value in update_columns.items()])
+        current = [self._table_name + "." + col for col in update_columns]
+        updated = list(update_columns.values())
+        return "".join([sql, " DO UPDATE SET ", assignments,
+                        " WHERE ", self._dialect.distinct_sql(current, updated)])
+
+    #######################################################
+
+    def _copy_rows(self, cursor, df, table):
+        # COPY df into table in chunks of _write_chunksize rows. Each chunk is
+        # formatted as CSV into a buffer that spills to disk when it is large.
+        sql = "".join(["COPY ", table, " (", ", ".join(list(df)),
+                       ") FROM STDIN WITH (FORMAT csv)"])
+        for start in range(0, len(df.index), self._write_chunksize):
+            chunk = df.iloc[start:start + self._write_chunksize]
+            # Integer columns holding NULLs are floats in pandas; write them
+            # as integers, COPY rejects "2.0" for an INTEGER column.
+            for col in chunk.select_dtypes(include="float").columns:
+                values = chunk[col].dropna()
+                if (values == values.round()).all():
+                    chunk = chunk.astype({col: "Int64"})
+
+            with tempfile.SpooledTemporaryFile(max_size=self._spool_size, mode="w+") as buffer:
+                chunk.to_csv(buffer, index=False, header=False)
+                buffer.seek(0)
+                cursor.copy_expert(sql, buffer)
+
+    #######################################################
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # Check a connection out of the engine's pool for the duration of a
+        # with block. The connection is returned to the pool on exit, even
+        # if the block raised.
+        conn = self._engine.connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    #######################################################
+
+    def _check_cols(self, sample_df, expected_cols=None):
         # Check the columns of input df to make sure it matches what we expect.
+        # expected_cols defaults to self._expected_cols.
 
         # We may or may not care about the order of the columns. If not, then
         # wrap both sides in set().
-        if set(list(sample_df)) != set(self._expected_cols):
+        if expected_cols is None:
+            expected_cols = self._expected_cols
+        if set(list(sample_df)) != set(expected_cols):
             return False
 
         return True
@@ -242,11 +454,12 @@ class Table(abc.ABC):
     """
     Queries the C-Tran data table using the given SQL query.
 
-    :argument   a SQL query string
+    :argument   a SQL query string, and optionally the columns the results
+                should have when they are not self._expected_cols
     :returns    a DataFrame containing query results, or
                 None if an exception occurred.
     """
-    def _query_table(self, sql):
+    def _query_table(self, sql, expected_cols=None):
         if not isinstance(self._engine, Engine):
             self._ios.log_and_print("invalid engine", ios.Severity.ERROR)
             return None
@@ -254,7 +467,7 @@ class Table(abc.ABC):
         df = None
         self._ios.log_and_print(sql)
         try:
-            df = pandas.read_sql(sql, self._engine, index_col=self._index_col)
+            df = self._apply_dtypes(pandas.read_sql(sql, self._engine, index_col=self._index_col))
 
         except SQLAlchemyError as error:
             self._ios.log_and_print("SQLAlchemy: " + str(error), ios.Severity.ERROR)
@@ -263,34 +476,94 @@ class Table(abc.ABC):
             self._ios.log_and_print("Pandas: " + str(error), ios.Severity.ERROR)
             return None
 
-        if not self._check_cols(df):
+        if not self._check_cols(df, expected_cols):
             self._ios.log_and_print("the columns of read data does not match the specified columns" , ios.Severity.ERROR)
             return None
 
-        #Converts NaN to None, can't do the same with NaT: null flagger takes care
-        df1 = df.where(df.notnull(), None)
+        return df
+
+    #######################################################
+
+    """
+    Generator version of _query_table that yields the query results in
+    DataFrames of at most chunksize rows. The rows are fetched through a
+    server-side cursor, so only one chunk is held in memory at a time.
+
+    :argument   a SQL query string, and the number of rows per chunk
+    :yields     DataFrames containing the query results. Stops early if an
+                exception occurred.
+    """
+    def _query_table_chunks(self, sql, chunksize):
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("invalid engine", ios.Severity.ERROR)
+            return
+
+        self._ios.log_and_print(sql)
+        try:
+            with self._connect() as conn:
+                conn = conn.execution_options(stream_results=True)
+                for df in pandas.read_sql(sql, conn, index_col=self._index_col, chunksize=chunksize):
+                    if not self._check_cols(df):
+                        self._ios.log_and_print("the columns of read data does not match the specified columns" , ios.Severity.ERROR)
+                        return
+
+                    yield self._apply_dtypes(df)
+
+        except SQLAlchemyError as error:
+            self._ios.log_and_print("SQLAlchemy: " + str(error), ios.Severity.ERROR)
+        except (ValueError, KeyError) as error:
+            self._ios.log_and_print("Pandas: " + str(error), ios.Severity.ERROR)
+
+    #######################################################
 
-        return df1
+    # Gives the columns of df the dtypes of self._dtypes, so nulls are kept
+    # as masks (<NA>, NaN) in compact typed columns. Tables without dtypes
+    # get their NaN converted to None instead; NaT stays, the null flagger
+    # takes care of it.
+    def _apply_dtypes(self, df):
+        if self._dtypes is None:
+            return df.where(df.notnull(), None)
+
+        return df.astype({name: dtype for name, dtype in self._dtypes.items()
+                          if name in df.columns})
 
     ###########################################################################
     # Private Methods
 
     def _build_engine(self, user, passwd, hostname, db_name):
+        # Embedded databases are given to the constructor as an engine URL.
         engine_info = ["postgresql://", user, ":", passwd, "@", hostname, "/", db_name]
-        self._engine = create_engine("".join(engine_info))
-        
-        self._ios.log_and_print("Your engine has been created: ", obj=self._engine)
+        self._url = make_url("".join(engine_info))
+
+        self._ios.log_and_print("Your engine has been configured: ", obj=repr(self._url))
         return True
 
+    @property
+    def _engine(self):
+        # Created, and the schema attached to it, on first use. Tables on the
+        # same URL share the engine.
+        if not self._engine_created:
+            engine = engines.get(self._url)
+            self._dialect.attach_schema(engine, self._schema)
+            self._engine_value = engine
+            self._engine_created = True
+        return self._engine_value
+
+    @_engine.setter
+    def _engine(self, engine):
+        self._engine_value = engine
+        self._engine_created = True
+
     ###########################################################################
 
-    def write_csv(self, df, path):
+    def write_csv(self, df, path, append=False):
         """
         Function is meant to be called by a subclass: saves passed in data to a csv file.
 
         Args: 
             df      (Object): pandas DataFrame that contains data to be saved to a csv.
             path    (String): relative path to where csv will be saved. 
+            append  (Boolean): append to the csv instead of overwriting it, without a header row.
 
         Returns: 
             Boolean representing state of the operation (successfull write: True, error during process: False)
@@ -310,10 +583,166 @@ class Table(abc.ABC):
 
         #Attempt saving
         try:
-            df.to_csv(full_path, index=False, encoding='utf-8')
+            if append:
+                df.to_csv(full_path, index=False, header=False, mode='a', encoding='utf-8')
+            else:
+                df.to_csv(full_path, index=False, encoding='utf-8')
         except:
             self._print("ERROR: write_csv couldn't save data to " + full_path)
             return False
 
         return True
 
+    ###########################################################################
+
+    def _write_parquet(self, df, path, days, merge=False, staging=None):
+        """
+        Function is meant to be called by a subclass: saves df as parquet files partitioned by service_date,
+        one file per day in <path><table name>/service_date=YYYY-MM-DD/part-0.parquet.
+        Each file is written to a hidden temporary file first and renamed over the old one, so readers only
+        ever see a whole day.
+
+        Args:
+            df      (Object): pandas DataFrame with a datetime service_date column, typed as it should be stored.
+            path    (String): relative path to where the files will be saved.
+            days    (List): every day to write. The file of a day without rows in df is replaced by an empty one,
+                            or left as it is when merging.
+            merge   (Boolean): add the rows of df to the files already written instead of replacing them, see
+                               _merge_parquet.
+            staging (String): staging directory of the run, from parquet_staging(). The rows of df are only added
+                              there, and every day is published at once by _publish_parquet() at the end of the run.
+
+        Returns:
+            Boolean representing state of the operation (successfull write: True, error during process: False)
+        """
+
+        if not self._table_name:
+            self._ios.log_and_print("_write_parquet not called by a subclass.", ios.Severity.ERROR)
+            return False
+
+        pyarrow = _load_pyarrow()
+        if pyarrow is None:
+            self._ios.log_and_print("pyarrow is required for parquet output.", ios.Severity.ERROR)
+            return False
+
+        df = df.assign(service_date=pandas.to_datetime(df["service_date"]).dt.date)
+        parts = dict(list(df.groupby("service_date", sort=False)))
+        if staging is not None:
+            return self._stage_parquet(parts, staging)
+
+        days = set(pandas.to_datetime(pandas.Series(list(days), dtype=object)).dt.date) | set(parts)
+        empty = df.iloc[0:0].drop(columns="service_date")
+        status = True
+        for day in sorted(days):
+            part = parts[day].drop(columns="service_date") if day in parts else None
+            status = self._publish_day(path, day, part, empty, merge) and status
+
+        return status
+
+    def parquet_staging(self, path):
+        """
+        Returns a new staging directory for the parquet files of a run, under <path><table name>/. It is hidden
+        (starts with a dot), so readers of the table skip it, and only created once rows are staged.
+        """
+        return "".join([path, self._table_name, "/.staging-", uuid.uuid4().hex, "/"])
+
+    def discard_parquet_staging(self, staging):
+        # Removes a staging directory and what was staged in it.
+        shutil.rmtree(staging, ignore_errors=True)
+
+    def _stage_parquet(self, parts, staging):
+        # Adds each day's part to its own file in the staging directory.
+        pyarrow = _load_pyarrow()
+        for day, part in parts.items():
+            directory = "".join([staging, "service_date=", day.isoformat()])
+            try:
+                os.makedirs(directory, exist_ok=True)
+                full_path = "".join([directory, "/part-", str(len(os.listdir(directory))), ".parquet"])
+                part.drop(columns="service_date").to_parquet(
+                    full_path, engine="pyarrow", index=False, compression=self._parquet_compression)
+            except (OSError, pyarrow.ArrowException) as error:
+                self._ios.log_and_print(
+                    "ERROR: _stage_parquet couldn't stage data to " + directory + ": " + str(error),
+                    ios.Severity.ERROR)
+                return False
+
+        return True
+
+    def _publish_parquet(self, path, days, staging, empty, merge=False):
+        """
+        Function is meant to be called by a subclass: publishes the days staged in staging (see _write_parquet)
+        and every day of days, each in one rename, then removes the staging directory.
+
+        Args:
+            path    (String): relative path to where the files are saved.
+            days    (List): every day processed by the run, including the ones without staged rows.
+            staging (String): staging directory of the run.
+            empty   (Object): pandas DataFrame without rows, typed as the files are, for the days without rows.
+            merge   (Boolean): see _write_parquet.
+
+        Returns:
+            Boolean representing state of the operation (successfull write: True, error during process: False)
+        """
+
+        pyarrow = _load_pyarrow()
+        if pyarrow is None:
+            self._ios.log_and_print("pyarrow is required for parquet output.", ios.Severity.ERROR)
+            return False
+
+        staged = {}
+        if os.path.isdir(staging):
+            for name in os.listdir(staging):
+                staged[datetime.date.fromisoformat(name[len("service_date="):])] = staging + name
+
+        days = set(pandas.to_datetime(pandas.Series(list(days), dtype=object)).dt.date) | set(staged)
+        status = True
+        for day in sorted(days):
+            part = None
+            if day in staged:
+                try:
+                    files = sorted(os.listdir(staged[day]), key=lambda name: int(name[5:-8]))
+                    part = pandas.concat([pandas.read_parquet(staged[day] + "/" + name) for name in files],
+                                         ignore_index=True)
+                except (OSError, pyarrow.ArrowException) as error:
+                    self._ios.log_and_print(
+                        "ERROR: _publish_parquet couldn't read the staged data of " + str(day) + ": " + str(error),
+                        ios.Severity.ERROR)
+                    status = False
+                    continue
+            status = self._publish_day(path, day, part, empty, merge) and status
+
+        self.discard_parquet_staging(staging)
+        return status
+
+    def _publish_day(self, path, day, part, empty, merge):
+        # Writes the file of day: part (None if the day has no rows), merged
+        # with the file already written if merge is True.
+        pyarrow = _load_pyarrow()
+        directory = "".join([path, self._table_name, "/service_date=", day.isoformat()])
+        full_path = directory + "/part-0.parquet"
+        temp_path = "".join([directory, "/.part-0.", uuid.uuid4().hex, ".tmp"])
+        try:
+            os.makedirs(directory, exist_ok=True)
+            if merge and os.path.exists(full_path):
+                if part is None:
+                    return True
+                part = self._merge_parquet(pandas.read_parquet(full_path), part)
+            elif part is None:
+                part = empty
+            part.to_parquet(temp_path, engine="pyarrow", index=False,
+                            compression=self._parquet_compression)
+            os.replace(temp_path, full_path)
+        except (OSError, pyarrow.ArrowException) as error:
+            self._ios.log_and_print(
+                "ERROR: _write_parquet couldn't save data to " + full_path + ": " + str(error),
+                ios.Severity.ERROR)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+
+        return True
+
+    def _merge_parquet(self, existing, part):
+        # Rows of a day's file once part is added to it. Identical rows are
+        # kept once. Subclasses override this when rows have another key.
+        return pandas.concat([existing, part], ignore_index=True).drop_duplicates(ignore_index=True)
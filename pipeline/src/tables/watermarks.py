@@ -0,0 +1,108 @@
+import pandas
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from .table import Table
+
+
+class Watermarks(Table):
+    # Records the highest CTran row_id processed for each service date, so
+    # incremental runs only need to read the rows added since.
+
+    def __init__(self, user=None, passwd=None, hostname=None, db_name=None, schema="hive", engine=None):
+        super().__init__(user, passwd, hostname, db_name, schema, engine)
+        self._table_name = "watermarks"
+        self._index_col = None
+        self._expected_cols = [
+            "service_date",
+            "max_row_id"
+        ]
+        self._creation_sql = "".join(["""
+            CREATE TABLE IF NOT EXISTS """, self._schema, ".", self._table_name, """
+            (
+                service_date DATE PRIMARY KEY,
+                max_row_id BIGINT NOT NULL
+            );"""])
+
+    #######################################################
+
+    def write_table(self, data):
+        # data is list of [service_date, max_row_id]. A watermark never moves
+        # back, so reprocessing an older range leaves it where it is.
+        if data == []:
+            return True
+
+        df = pandas.DataFrame(data, columns=self._expected_cols)
+        df["service_date"] = pandas.to_datetime(df["service_date"]).dt.strftime("%Y-%m-%d")
+        return self._write_table(df, conflict_columns=["service_date"],
+                 update_columns={"max_row_id": self._dialect.greatest_sql(
+                     self._table_name + ".max_row_id", "EXCLUDED.max_row_id")})
+
+    #######################################################
+
+    # Record the watermarks of a processed CTran DataFrame, indexed by row_id.
+    def record(self, ctran_df):
+        return self.write_table(list(map(list, self.max_row_ids(ctran_df).items())))
+
+    #######################################################
+
+    # Return a dict of service_date: highest row_id of a CTran DataFrame,
+    # indexed by row_id.
+    def max_row_ids(self, ctran_df):
+        row_ids = pandas.Series(ctran_df.index, index=ctran_df.index)
+        max_row_ids = row_ids.groupby(ctran_df["service_date"]).max()
+        return {service_date: int(row_id) for service_date, row_id in max_row_ids.items()}
+
+    #######################################################
+
+    # Return the highest row_id processed on any service date, None if
+    # nothing was recorded or on failure. Days recorded without rows (a
+    # max_row_id of 0) do not count as a watermark.
+    def get_watermark(self):
+        sql = "".join(["SELECT MAX(max_row_id) FROM ",
+                       self._schema, ".", self._table_name,
+                       " WHERE max_row_id > 0;"])
+        return self._query_value(sql)
+
+    #######################################################
+
+    # Return the latest service date (as date) with a watermark, None if
+    # nothing was recorded or on failure.
+    def get_latest_day(self):
+        sql = "".join(["SELECT MAX(service_date) FROM ",
+                       self._schema, ".", self._table_name, ";"])
+        return self._dialect.date_value(self._query_value(sql))
+
+    #######################################################
+
+    # Return the sorted list of service dates (as dates) with a watermark,
+    # None on failure.
+    def get_days(self):
+        sql = "".join(["SELECT service_date FROM ",
+                       self._schema, ".", self._table_name,
+                       " ORDER BY service_date;"])
+        df = self._query_table(sql)
+        if df is None:
+            return None
+        return [self._dialect.date_value(day) for day in df["service_date"]]
+
+    #######################################################
+
+    def _query_value(self, sql):
+        # Run a query returning a single value.
+        if not isinstance(self._engine, Engine):
+            self._ios.log_and_print("Invalid engine.", self._ios.Severity.ERROR)
+            return None
+
+        try:
+            self._ios.log_and_print(sql)
+            with self._connect() as con:
+                row = con.execute(sql).first()
+        except SQLAlchemyError as error:
+            self._ios.log_and_print(
+                "SQLAlchemyError: " + str(error), self._ios.Severity.ERROR)
+            return None
+
+        if row is None:
+            return None
+        return row[0]
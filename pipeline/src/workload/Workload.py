@@ -0,0 +1,226 @@
+import os
+import datetime
+import numpy
+import pandas
+
+from flaggers.flagger import Flags
+from flaggers.null import Null
+
+
+# Columns of ctran_data, in the order of ctran_trips_sample.csv.
+COLUMNS = [
+    "service_date", "vehicle_number", "leave_time", "train", "route_number",
+    "direction", "service_key", "trip_number", "stop_time", "arrive_time",
+    "dwell", "location_id", "door", "lift", "ons", "offs", "estimated_load",
+    "maximum_speed", "train_mileage", "pattern_distance", "location_distance",
+    "x_coordinate", "y_coordinate", "data_source", "schedule_status", "trip_id",
+]
+
+# Columns nulls are injected into. A row without service_date has no
+# service_key and is skipped rather than flagged.
+NULLABLE_COLUMNS = [column for column in COLUMNS if column != "service_date"]
+
+
+class Workload:
+    """
+    Seeded synthetic AVL data in the layout of ctran_data, for load testing.
+
+    Every vehicle runs the same number of trips a day on one route, stopping
+    at every stop of the route, so a day has vehicles * trips * stops rows
+    plus the injected duplicates. Anomalies are injected at exact counts
+    (rate * rows, rounded) into distinct rows, so each row carries at most
+    one and expected() knows the flags they must raise:
+    - null_rate: one column set to null (NaN), raising its <COLUMN>_NULL.
+    - zero_door_rate: door 0, raising UNOPENED_DOOR.
+    - far_rate: location_distance above far_distance, raising UNOBSERVED_STOP.
+    - duplicate_rate: an exact copy right after the row, both raising
+      DUPLICATE.
+    Other values stay within the default config bounds, so clean rows raise
+    no flag.
+
+    Each day is generated from its own generator seeded with (seed, day), so
+    days are the same whichever are generated, in any order.
+    """
+
+    def __init__(self, start_date="2020-01-06", days=1, vehicles=100, trips=10,
+                 stops=40, routes=20, seed=0, null_rate=0.0, zero_door_rate=0.0,
+                 far_rate=0.0, duplicate_rate=0.0, far_distance=50):
+        self.start_date = pandas.Timestamp(start_date).date()
+        self.days = days
+        self.vehicles = vehicles
+        self.trips = trips
+        self.stops = stops
+        self.routes = routes
+        self.seed = seed
+        self.null_rate = null_rate
+        self.zero_door_rate = zero_door_rate
+        self.far_rate = far_rate
+        self.duplicate_rate = duplicate_rate
+        self.far_distance = far_distance
+
+        rows = self.vehicles * self.trips * self.stops
+        if self._count(self.null_rate) + self._count(self.zero_door_rate) \
+                + self._count(self.far_rate) + self._count(self.duplicate_rate) > rows:
+            raise ValueError("The anomaly rates add up to more than the rows of a day.")
+
+    def rows_per_day(self):
+        # Rows of each day, duplicates included.
+        return self.vehicles * self.trips * self.stops + self._count(self.duplicate_rate)
+
+    def frame(self, day=0):
+        """
+        Generates one day.
+
+        Args:
+            day (int): index of the day, from 0 (start_date) to days - 1.
+
+        Returns:
+            pandas.DataFrame: the COLUMNS of the day's rows, indexed by
+                row_id, numbered on from the rows of the days before.
+        """
+        rng = numpy.random.default_rng([self.seed, day, 0])
+        rows = self.vehicles * self.trips * self.stops
+        shape = (self.vehicles, self.trips, self.stops)
+        service_date = self.start_date + datetime.timedelta(days=day)
+
+        vehicle = numpy.broadcast_to(numpy.arange(self.vehicles)[:, None, None], shape)
+        trip = numpy.broadcast_to(numpy.arange(self.trips)[None, :, None], shape)
+        stop = numpy.broadcast_to(numpy.arange(self.stops)[None, None, :], shape)
+        route = numpy.broadcast_to(rng.integers(1, self.routes + 1, self.vehicles)[:, None, None], shape)
+        direction = trip % 2
+        # Stops are visited in reverse on the way back.
+        sequence = numpy.where(direction == 0, stop, self.stops - 1 - stop)
+
+        # Vehicles start between 5:00 and 7:00; trips take 90s per stop plus
+        # a 10 minute layover.
+        first_departure = 5 * 3600 + rng.integers(0, 2 * 3600, self.vehicles)
+        trip_start = first_departure[:, None] + numpy.arange(self.trips)[None, :] * (self.stops * 90 + 600)
+        stop_time = trip_start[:, :, None] + stop * 90
+        arrive_time = stop_time + numpy.clip(rng.normal(60, 90, shape), -120, 900).astype("int64")
+        door = rng.integers(1, 4, shape)
+        dwell = rng.integers(5, 60, shape)
+        ons = rng.poisson(2, shape)
+        offs = rng.poisson(2, shape)
+        estimated_load = numpy.maximum(numpy.cumsum(ons - offs, axis=2), 0)
+
+        spacing = rng.uniform(500, 3000, (self.routes + 1, self.stops))
+        pattern_distance = numpy.cumsum(spacing, axis=1)[route, sequence]
+        stop_miles = numpy.concatenate([numpy.zeros(shape[:2] + (1,)),
+                                        numpy.diff(pattern_distance, axis=2) / 5280], axis=2)
+        train_mileage = numpy.cumsum(numpy.abs(stop_miles).reshape(self.vehicles, -1), axis=1).reshape(shape)
+        angle = rng.uniform(0, 2 * numpy.pi, self.routes + 1)[route]
+
+        weekday = service_date.weekday()
+        columns = {
+            "service_date": numpy.full(rows, service_date, dtype=object),
+            "vehicle_number": 1000 + vehicle,
+            "leave_time": arrive_time + dwell,
+            "train": 100 + vehicle,
+            "route_number": route,
+            "direction": direction,
+            "service_key": numpy.full(rows, "W" if weekday < 5 else "S" if weekday == 5 else "U"),
+            "trip_number": numpy.broadcast_to(trip_start[:, :, None] // 60, shape),
+            "stop_time": stop_time,
+            "arrive_time": arrive_time,
+            "dwell": dwell,
+            "location_id": route * 1000 + sequence,
+            "door": door,
+            "lift": (rng.random(shape) < 0.01).astype("int64"),
+            "ons": ons,
+            "offs": offs,
+            "estimated_load": estimated_load,
+            "maximum_speed": rng.integers(0, 56, shape),
+            "train_mileage": numpy.round(train_mileage, 2),
+            "pattern_distance": numpy.round(pattern_distance, 1),
+            "location_distance": numpy.round(rng.uniform(0, 0.6 * self.far_distance, shape), 1),
+            "x_coordinate": numpy.round(1100000 + pattern_distance * numpy.cos(angle), 1),
+            "y_coordinate": numpy.round(110000 + pattern_distance * numpy.sin(angle), 1),
+            "data_source": numpy.zeros(shape, dtype="int64"),
+            "schedule_status": numpy.zeros(shape, dtype="int64"),
+            "trip_id": (day * self.vehicles + vehicle) * self.trips + trip + 1,
+        }
+        df = pandas.DataFrame({name: numpy.reshape(values, rows) for name, values in columns.items()},
+                              columns=COLUMNS)
+
+        nulls, null_columns, zero_doors, far, duplicates = self._plan(day)
+        df.loc[zero_doors, ["door", "dwell", "ons", "offs"]] = 0
+        df.loc[zero_doors, "leave_time"] = df.loc[zero_doors, "arrive_time"]
+        df.loc[far, "location_distance"] = numpy.round(
+            rng.uniform(1.5 * self.far_distance, 20 * self.far_distance, len(far)), 1)
+        for position, column in enumerate(NULLABLE_COLUMNS):
+            rows_nulled = nulls[null_columns == position]
+            if len(rows_nulled):
+                if df[column].dtype.kind in "iu":
+                    df[column] = df[column].astype("float64")
+                df.loc[rows_nulled, column] = numpy.nan if df[column].dtype.kind == "f" else None
+
+        # Each copy goes right after its row, as a double report would.
+        order = numpy.argsort(numpy.concatenate([numpy.arange(rows), duplicates]), kind="stable")
+        df = df.iloc[numpy.concatenate([numpy.arange(rows), duplicates])[order]]
+        df.index = pandas.RangeIndex(1, len(df) + 1, name="row_id") + day * self.rows_per_day()
+        return df
+
+    def frames(self):
+        # Yields the frame of every day in order, one at a time.
+        for day in range(self.days):
+            yield self.frame(day)
+
+    def expected(self, day=None):
+        """
+        Flags the injected anomalies must raise.
+
+        Args:
+            day (int): index of the day, None for every day.
+
+        Returns:
+            dict: Flags member mapped to the number of rows it is raised for.
+        """
+        days = range(self.days) if day is None else [day]
+        expected = {}
+        null_flags = [Null.columns_flag_dict[column] for column in NULLABLE_COLUMNS]
+        for day in days:
+            nulls, null_columns, zero_doors, far, duplicates = self._plan(day)
+            counts = numpy.bincount(null_columns, minlength=len(NULLABLE_COLUMNS))
+            for flag, count in zip(null_flags, counts):
+                expected[flag] = expected.get(flag, 0) + int(count)
+            expected[Flags.UNOPENED_DOOR] = expected.get(Flags.UNOPENED_DOOR, 0) + len(zero_doors)
+            expected[Flags.UNOBSERVED_STOP] = expected.get(Flags.UNOBSERVED_STOP, 0) + len(far)
+            expected[Flags.DUPLICATE] = expected.get(Flags.DUPLICATE, 0) + 2 * len(duplicates)
+        return {flag: count for flag, count in expected.items() if count}
+
+    def write_csv(self, path):
+        """
+        Writes every day to the CSV file path, in the layout of
+        ctran_trips_sample.csv, so CTran_Data.create_table() can load it.
+        Days are generated and appended one at a time.
+
+        Returns:
+            bool: True on success, False if the file could not be written.
+        """
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, "w", newline="") as csv_file:
+                for day, df in enumerate(self.frames()):
+                    df.to_csv(csv_file, header=day == 0, index=False, date_format="%Y-%m-%d")
+        except OSError:
+            return False
+        return True
+
+    #######################################################
+
+    def _count(self, rate):
+        return int(round(rate * self.vehicles * self.trips * self.stops))
+
+    def _plan(self, day):
+        # Positions of the rows of day given each anomaly, from a generator of
+        # their own so expected() does not need to generate the values. Each
+        # row gets at most one anomaly; duplicates are copies of clean rows.
+        rng = numpy.random.default_rng([self.seed, day, 1])
+        rows = rng.permutation(self.vehicles * self.trips * self.stops)
+        counts = numpy.cumsum([self._count(rate) for rate in (
+            self.null_rate, self.zero_door_rate, self.far_rate, self.duplicate_rate)])
+        nulls, zero_doors, far, duplicates = numpy.split(rows[:counts[-1]], counts[:-1])
+        null_columns = rng.integers(0, len(NULLABLE_COLUMNS), len(nulls))
+        return nulls, null_columns, numpy.sort(zero_doors), numpy.sort(far), numpy.sort(duplicates)
@@ -0,0 +1 @@
+from .Workload import Workload
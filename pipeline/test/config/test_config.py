@@ -111,3 +111,51 @@ def test_save_config(loaded_config, tmp_path):
 
     return loaded_config
 
+
+def test_get_columns(loaded_config, empty_config):
+    columns = loaded_config.get_columns()
+    assert columns == MOCK_CONFIG["columns"]
+    # A copy, the config is not changed through it.
+    columns["maximum_speed"]["max"] = 10
+    assert loaded_config.get_bounds("maximum_speed")["max"] == 150
+    assert empty_config.get_columns() == {}
+
+def test_snapshot(loaded_config):
+    snapshot = loaded_config.snapshot()
+    assert snapshot is loaded_config.snapshot()
+    assert snapshot.get_value("pipeline_user") == "sw23"
+    # Run values are typed, with their default when missing.
+    assert snapshot.unobserved_stop_distance == 50.0
+    assert snapshot.backfill_workers == 1
+    assert snapshot.parallel_workers == 1
+    assert snapshot.parallel_min_partition_rows == 10000
+    assert snapshot.stream_chunksize == 0
+    assert snapshot.max_skipped_rows is None
+    with pytest.raises(AttributeError):
+        snapshot.backfill_workers = 4
+
+    assert snapshot.check_bounds("maximum_speed", 180) == BoundsResult.MAX_ERROR
+    assert snapshot.check_bounds("vehicle_number", 2) == BoundsResult.VALID
+    assert snapshot.check_bounds("service_date", "1970-01-03") == BoundsResult.MIN_ERROR
+    assert snapshot.check_bounds("no_bounds", -10000) == BoundsResult.VALID
+
+    # A new snapshot is taken once the values change, the old one stays as is.
+    loaded_config.set_value("backfill_workers", "4")
+    assert loaded_config.snapshot().backfill_workers == 4
+    assert snapshot.backfill_workers == 1
+
+def test_snapshot_invalid_value(empty_config):
+    empty_config.set_value("backfill_workers", "many")
+    with pytest.raises(ValueError, match="backfill_workers"):
+        empty_config.snapshot()
+
+def test_reload_if_changed(loaded_config, tmp_path):
+    p = tmp_path / "test_config.json"
+    assert not loaded_config.reload_if_changed()
+
+    p.write_text(json.dumps(dict(MOCK_CONFIG, pipeline_user="other")))
+    stat = os.stat(p)
+    os.utime(p, (stat.st_atime, stat.st_mtime + 10))
+    assert loaded_config.reload_if_changed()
+    assert loaded_config.snapshot().get_value("pipeline_user") == "other"
+    assert not loaded_config.reload_if_changed()
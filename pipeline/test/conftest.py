@@ -0,0 +1,23 @@
+import pytest
+from src.ios import ios
+from src.tables import engines
+
+
+# Disconnect the logging functionality from the main log file: the log of a
+# test run goes to pytest's temporary directory, out of the tree.
+@pytest.fixture(autouse=True, scope="session")
+def test_log(tmp_path_factory):
+    ios.stop()
+    ios.start(str(tmp_path_factory.mktemp("log") / "test_log.txt"))
+    yield
+    ios.stop()
+
+
+# Tables connecting to the same URL share an engine, so a test that mocks its
+# engine's methods would leak the mock into later tests. Start every test
+# with an empty registry.
+@pytest.fixture(autouse=True)
+def reset_engines():
+    engines.dispose()
+    yield
+    engines.dispose()
@@ -0,0 +1,86 @@
+from flaggers.flagger import flaggers, Flags, Flagger
+from flaggers.bounds import compile_bounds
+from src.config import Config
+import numpy
+import pytest
+import pandas
+from datetime import date
+
+@pytest.fixture
+def bounds_flagger():
+    return [f for f in flaggers if f.name == 'Bounds'][0]
+
+@pytest.fixture
+def config():
+    config = Config()
+    config._data = {"columns": {
+        "vehicle_number": {"max": "NA", "min": 0},
+        "maximum_speed": {"max": 150, "min": 0},
+        "service_date": {"min": "1990-01-01"},
+        "no_flags": {"max": 1}}}
+    return config
+
+def test_compile_bounds(config):
+    bounds = {bound.column: bound
+              for bound in compile_bounds(config.snapshot().get_parsed_bounds())}
+    # Columns without flags are skipped.
+    assert sorted(bounds) == ["maximum_speed", "service_date", "vehicle_number"]
+    assert bounds["vehicle_number"].high is None and bounds["vehicle_number"].low == 0
+    assert bounds["service_date"].is_date
+    assert bounds["service_date"].low == numpy.datetime64("1990-01-01", "ns")
+    assert bounds["maximum_speed"].min_flag == Flags.MAXIMUM_SPEED_MIN
+
+def test_compile_bounds_as_check_bounds(bounds_flagger, config):
+    # Bounds are parsed once, by the config snapshot, so the flagger agrees
+    # with check_bounds() on what they mean.
+    config.set_bounds("service_date", "Jan 2 1990", "NA")
+    config.set_bounds("maximum_speed", "slow", 150)
+    snapshot = config.snapshot()
+    bounds = {bound.column: bound for bound in compile_bounds(snapshot.get_parsed_bounds())}
+    assert bounds["service_date"].low == numpy.datetime64("1990-01-02", "ns")
+    # A bound check_bounds() cannot compare is left out.
+    assert bounds["maximum_speed"].low is None and bounds["maximum_speed"].high == 150
+
+    df = pandas.DataFrame({"service_date": [date(1990, 1, 1)]})
+    assert list(bounds_flagger.flag_frame(df, snapshot)) == [Flags.SERVICE_DATE_MIN]
+    assert snapshot.check_bounds("service_date", "1990-01-01").name == "MIN_ERROR"
+
+def test_bounds_flagger_frame(bounds_flagger, config):
+    df = pandas.DataFrame({
+        "service_date": [date(2020, 1, 1), date(1989, 12, 31), None],
+        "vehicle_number": [-1, 5, None],
+        "maximum_speed": [151.0, 20.0, numpy.nan],
+    }, dtype=object)
+    masks = bounds_flagger.flag_frame(df, config)
+    assert set(masks) == {Flags.SERVICE_DATE_MIN, Flags.VEHICLE_NUMBER_MIN,
+                          Flags.MAXIMUM_SPEED_MAX}
+    # Nulls are left to the Null flagger.
+    assert list(masks[Flags.SERVICE_DATE_MIN]) == [False, True, False]
+    assert list(masks[Flags.VEHICLE_NUMBER_MIN]) == [True, False, False]
+    assert list(masks[Flags.MAXIMUM_SPEED_MAX]) == [True, False, False]
+
+    adapter = Flagger.flag_frame(bounds_flagger, df, config)
+    for flag in masks:
+        assert list(adapter[flag]) == list(masks[flag])
+
+def test_bounds_flagger_row(bounds_flagger, config):
+    flags = bounds_flagger.flag({"vehicle_number": 3, "maximum_speed": -2}, config)
+    assert flags == [Flags.MAXIMUM_SPEED_MIN]
+
+def test_bounds_flagger_recompiles(bounds_flagger, config):
+    df = pandas.DataFrame({"maximum_speed": [100]})
+    assert bounds_flagger.flag_frame(df, config) == {}
+    config.set_bounds("maximum_speed", 0, 50)
+    assert list(bounds_flagger.flag_frame(df, config)) == [Flags.MAXIMUM_SPEED_MAX]
+
+def test_bounds_flagger_snapshot(bounds_flagger, config):
+    df = pandas.DataFrame({"maximum_speed": [100]})
+    snapshot = config.snapshot()
+    assert bounds_flagger.flag_frame(df, snapshot) == {}
+    # A frozen config is not compared again, a new snapshot is.
+    config.set_bounds("maximum_speed", 0, 50)
+    assert bounds_flagger.flag_frame(df, snapshot) == {}
+    assert Flags.MAXIMUM_SPEED_MAX in bounds_flagger.flag_frame(df, config.snapshot())
+
+def test_bounds_flagger_without_config(bounds_flagger):
+    assert bounds_flagger.flag_frame(pandas.DataFrame({"maximum_speed": [1000]}), "config") == {}
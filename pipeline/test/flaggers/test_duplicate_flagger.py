@@ -66,3 +66,58 @@ def test_duplicate_flagger_sad(duplicate_flagger, no_duplications):
 def test_duplicate_flagger_bad(duplicate_flagger):
     with pytest.raises(ValueError):
         duplicate_flagger.flag(pandas.DataFrame(), "config")
+
+def test_row_hashes():
+    from flaggers.duplicate import row_hashes
+    df = pandas.DataFrame({"service_date": ["2020-01-01", "2020-01-01", "2020-01-02"],
+                           "door": [1, 1, 1]})
+    hashes = row_hashes(df)
+    assert hashes.dtype == np.uint64
+    assert hashes[0] == hashes[1] and hashes[0] != hashes[2]
+
+def test_row_hashes_ignore_dtype():
+    # The same content hashes the same whether a column came back as int,
+    # float (a null in the batch) or object.
+    from flaggers.duplicate import row_hashes
+    ints = pandas.DataFrame({"door": [1, 2]}, index=[1, 2])
+    floats = pandas.DataFrame({"door": [1.0, np.nan]}, index=[3, 4])
+    objects = pandas.DataFrame({"door": pandas.Series([1, None], index=[5, 6], dtype=object)})
+    assert row_hashes(ints)[0] == row_hashes(floats)[0] == row_hashes(objects)[0]
+    assert row_hashes(floats)[1] == row_hashes(objects)[1]
+
+def test_row_hashes_typed():
+    # Typed CTran columns hash like the None-holding objects they replaced.
+    from flaggers.duplicate import row_hashes
+    objects = pandas.DataFrame({"door": pandas.Series([1, None], dtype=object),
+                                "service_key": pandas.Series(["W", None], dtype=object)})
+    typed = objects.astype({"door": "Int32", "service_key": "category"})
+    assert np.array_equal(row_hashes(objects), row_hashes(typed))
+
+def test_find_across_chunks(duplicate_flagger):
+    from datetime import date
+    from flaggers.duplicate import Seen_Rows
+    day1, day2 = date(2020, 1, 1), date(2020, 1, 2)
+    chunk1 = pandas.DataFrame({"service_date": [day1, day1, day2], "door": [1, 1, 2]},
+                              index=pandas.Index([1, 2, 3], name="row_id"))
+    chunk2 = pandas.DataFrame({"service_date": [day2, day2], "door": [2, 2]},
+                              index=pandas.Index([4, 5], name="row_id"))
+
+    seen = Seen_Rows()
+    row_ids, service_dates = duplicate_flagger.find(chunk1, seen)
+    assert row_ids.tolist() == [1, 2]
+    assert service_dates.tolist() == [day1, day1]
+    # Only the last service_date is carried.
+    assert seen.service_date == day2 and seen.row_ids.tolist() == [3]
+
+    # Row 3 is reported with the rows of chunk2 it duplicates.
+    row_ids, service_dates = duplicate_flagger.find(chunk2, seen)
+    assert row_ids.tolist() == [3, 4, 5]
+    assert service_dates.tolist() == [day2] * 3
+
+    row_ids, _ = duplicate_flagger.find(chunk2.rename(index={4: 6, 5: 7}), seen)
+    assert row_ids.tolist() == [6, 7]
+
+def test_find_empty(duplicate_flagger):
+    row_ids, service_dates = duplicate_flagger.find(
+        pandas.DataFrame({"service_date": []}))
+    assert len(row_ids) == 0 and len(service_dates) == 0
@@ -1,4 +1,5 @@
-from flaggers.flagger import flaggers, Flags
+from flaggers.flagger import flaggers, Flags, Flagger
+import pandas as pd
 import pytest
 
 class DataRowNull():
@@ -111,3 +112,22 @@ def test_null_flaggers_on_null_data(null_flagger, null_data_row):
   assert Flags.DATA_SOURCE_NULL in flags
   assert Flags.SCHEDULE_STATUS_NULL in flags
   assert Flags.TRIP_ID_NULL in flags
+
+
+def test_null_flaggers_frame_on_good_data(null_flagger, good_data_row):
+  df = pd.DataFrame([good_data_row])
+  assert null_flagger.flag_frame(df, "config") == {}
+
+
+def test_null_flaggers_frame_matches_flag(null_flagger, null_data_row, good_data_row):
+  df = pd.DataFrame([good_data_row, null_data_row, good_data_row], dtype=object)
+  masks = null_flagger.flag_frame(df, "config")
+  assert len(masks) == len(null_data_row)
+  for flag, mask in masks.items():
+    assert list(mask) == [False, True, False]
+
+  # The frame path must agree with the row-by-row adapter.
+  adapter = Flagger.flag_frame(null_flagger, df, "config")
+  assert set(adapter) == set(masks)
+  for flag in masks:
+    assert list(adapter[flag]) == list(masks[flag])
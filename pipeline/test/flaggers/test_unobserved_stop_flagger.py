@@ -1,6 +1,7 @@
-from flaggers.flagger import flaggers, Flags
+from flaggers.flagger import flaggers, Flags, Flagger
 from src.config import config
 import pytest
+import pandas
 
 class GoodData():
 	def __init__(self):
@@ -39,3 +40,16 @@ def test_unobserved_stop_flagger_on_bad_data(unobserved_stop_flagger, bad_data,
 	assert len(flags) == 1
 	assert Flags.UNOBSERVED_STOP in flags
 
+#Frame path should only flag the bad rows, and agree with flag()
+def test_unobserved_stop_flagger_frame(unobserved_stop_flagger, good_data, bad_data, config_instance):
+	df = pandas.DataFrame([good_data, bad_data, {"location_distance": None}], dtype=object)
+	masks = unobserved_stop_flagger.flag_frame(df, config_instance)
+	assert list(masks) == [Flags.UNOBSERVED_STOP]
+	assert list(masks[Flags.UNOBSERVED_STOP]) == [False, True, False]
+
+	adapter = Flagger.flag_frame(unobserved_stop_flagger, df, config_instance)
+	assert list(adapter[Flags.UNOBSERVED_STOP]) == list(masks[Flags.UNOBSERVED_STOP])
+
+def test_unobserved_stop_flagger_frame_on_good_data(unobserved_stop_flagger, good_data, config_instance):
+	df = pandas.DataFrame([good_data])
+	assert unobserved_stop_flagger.flag_frame(df, config_instance) == {}
@@ -1,5 +1,6 @@
-from flaggers.flagger import flaggers, Flags
+from flaggers.flagger import flaggers, Flags, Flagger
 import pytest
+import pandas
 
 #Data is good when door opens at least once during the stop
 class GoodData():
@@ -33,3 +34,27 @@ def test_unopened_door_flagger_on_bad_data(unopened_door_flagger, bad_data):
 	flags = unopened_door_flagger.flag(bad_data, "config")
 	assert len(flags) == 1
 	assert Flags.UNOPENED_DOOR in flags
+
+#Frame path should only flag the bad rows, and agree with flag()
+def test_unopened_door_flagger_frame(unopened_door_flagger, good_data, bad_data):
+	df = pandas.DataFrame([good_data, bad_data, {"door": None}], dtype=object)
+	masks = unopened_door_flagger.flag_frame(df, "config")
+	assert list(masks) == [Flags.UNOPENED_DOOR]
+	assert list(masks[Flags.UNOPENED_DOOR]) == [False, True, False]
+
+	adapter = Flagger.flag_frame(unopened_door_flagger, df, "config")
+	assert list(adapter[Flags.UNOPENED_DOOR]) == list(masks[Flags.UNOPENED_DOOR])
+
+def test_unopened_door_flagger_frame_on_good_data(unopened_door_flagger, good_data):
+	df = pandas.DataFrame([good_data])
+	assert unopened_door_flagger.flag_frame(df, "config") == {}
+
+#Nulls of a nullable column (as from CTran_Data) are not unopened doors
+def test_unopened_door_flagger_nullable(unopened_door_flagger):
+	df = pandas.DataFrame({"door": pandas.array([1, 0, None], dtype="Int32")})
+	masks = unopened_door_flagger.flag_frame(df, "config")
+	assert list(masks[Flags.UNOPENED_DOOR]) == [False, True, False]
+	assert unopened_door_flagger.flag({"door": pandas.NA}, "config") == []
+
+	adapter = Flagger.flag_frame(unopened_door_flagger, df, "config")
+	assert list(adapter[Flags.UNOPENED_DOOR]) == list(masks[Flags.UNOPENED_DOOR])
@@ -190,3 +190,68 @@ def test_flag_with_limit_arg_succeeds(ai):
 
 def test_daily_succeeds(ai):
     ai._parse_cl_args(['--daily'])
+
+
+# TEST WORKERS
+
+
+def test_workers_arg_with_range_succeeds(ai):
+    args = ai._parse_cl_args(['--date-start=2020-01-01', '--date-end=2020-01-02', '-w=4'])
+    assert args.workers == 4
+
+
+def test_workers_arg_with_value_0_fails(ai):
+    with pytest.raises(SystemExit) as sys_ext:
+        ai._parse_cl_args(['--daily', '--workers=0'])
+    assert sys_ext.value.code == 2
+
+
+# TEST BACKFILL
+
+
+def test_backfill_without_value_succeeds(ai):
+    assert ai._parse_cl_args(['--backfill']).backfill == 0
+
+
+def test_backfill_with_value_succeeds(ai):
+    assert ai._parse_cl_args(['--backfill=3']).backfill == 3
+
+
+def test_backfill_with_wrong_value_fails(ai):
+    with pytest.raises(SystemExit) as sys_ext:
+        ai._parse_cl_args(['--backfill=a'])
+    assert sys_ext.value.code == 2
+
+
+def test_invalidate_cache_succeeds(ai):
+    args = ai._parse_cl_args(['--invalidate-cache'])
+    assert args.invalidate_cache
+    assert args.date_start is None
+
+
+def test_invalidate_cache_with_range_succeeds(ai):
+    args = ai._parse_cl_args(['--invalidate-cache', '--date-start=2020-01-01', '--date-end=2020-01-31'])
+    assert args.invalidate_cache
+    assert args.date_end.day == 31
+
+
+# TEST PROFILE
+
+
+def test_profile_with_daily_succeeds(ai):
+    assert ai._parse_cl_args(['--daily', '--profile']).profile
+
+
+def test_profile_defaults_off(ai):
+    assert not ai._parse_cl_args(['--daily']).profile
+
+
+# TEST SHOW CONFIG
+
+
+def test_show_config_hides_passwords(ai, capsys):
+    assert ai._parse_cl_args(['--show-config']).show_config
+    assert ai.main(['--show-config']) is None
+    out = capsys.readouterr().out
+    assert '"pipeline_passwd": "***"' in out
+    assert '"pipeline_user"' in out
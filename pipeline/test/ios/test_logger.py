@@ -0,0 +1,96 @@
+import os
+import gzip
+import multiprocessing
+import pytest
+from src.ios.logger import Logger, Severity
+
+@pytest.fixture
+def logger(tmp_path):
+    logger = Logger()
+    logger.start(str(tmp_path / "log.txt"))
+    yield logger
+    logger._close()
+
+def read(path):
+    with open(path) as log_file:
+        return log_file.read().splitlines()
+
+def test_log_returns_message(logger):
+    assert logger.log("Hello") == "Hello"
+    assert logger.log("Oops", Severity.ERROR) == "[ERROR]: Oops"
+
+def test_flush_writes_lines(logger):
+    for index in range(100):
+        logger.log(str(index))
+    logger.flush()
+
+    lines = read(logger._path)
+    assert len(lines) == 100
+    assert lines[0].startswith("[INFO] (") and lines[-1].endswith(":   99")
+
+def test_stop_writes_queue(logger):
+    logger.log("last words", Severity.WARNING)
+    logger.stop()
+    lines = read(logger._path)
+    assert lines[0].endswith("last words")
+    assert lines[1].endswith("The logger is shutting down.")
+
+    # Lines logged once stopped are still written.
+    logger.log("after")
+    assert read(logger._path)[-1].endswith("after")
+
+def test_configure(logger):
+    with pytest.raises(ValueError):
+        logger.configure(fsync="sometimes")
+    logger.configure(fsync="interval", fsync_interval_ms=10)
+    assert logger._fsync == "interval" and logger._fsync_interval == 0.01
+    logger.log("synced later")
+    logger.flush()
+    assert read(logger._path)[-1].endswith("synced later")
+
+def test_rotation(logger):
+    logger.configure(max_bytes=200, backups=2, compress=True)
+    for index in range(20):
+        logger.log("line " + str(index))
+        logger.flush()
+
+    path = logger._path
+    assert os.path.getsize(path) < 200
+    assert os.path.exists(path + ".1.gz") and os.path.exists(path + ".2.gz")
+    assert not os.path.exists(path + ".3.gz")
+    with gzip.open(path + ".1.gz", "rt") as rotated:
+        assert "line" in rotated.read()
+
+def test_failing_write(logger, monkeypatch, capsys):
+    write = logger._write
+    def failing_write(lines, error):
+        monkeypatch.setattr(logger, "_write", write)
+        raise OSError(28, "No space left on device")
+    monkeypatch.setattr(logger, "_write", failing_write)
+
+    # The writer survives the failure, so flush() returns.
+    logger.log("lost")
+    logger.flush()
+    assert "No space left on device" in capsys.readouterr().err
+
+    logger.log("written")
+    logger.flush()
+    assert read(logger._path) and read(logger._path)[-1].endswith("written")
+    assert not any(line.endswith("lost") for line in read(logger._path))
+
+def _log_from_child(logger):
+    for index in range(50):
+        logger.log("child " + str(index))
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(),
+                    reason="needs fork")
+def test_log_from_forked_process(logger):
+    logger.log("parent")
+    process = multiprocessing.get_context("fork").Process(target=_log_from_child, args=(logger,))
+    process.start()
+    process.join()
+    logger.flush()
+
+    lines = read(logger._path)
+    assert len(lines) == 51
+    assert all(line.startswith("[INFO] (") for line in lines)
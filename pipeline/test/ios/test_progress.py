@@ -0,0 +1,52 @@
+import io
+import time
+from src.ios import Progress
+
+def test_line_with_total():
+    progress = Progress(total=200, tty=True, stream=io.StringIO(), enabled=False)
+    progress.start()
+    progress._started -= 10
+    progress.stage("flag")
+    progress.advance(100)
+    assert progress.line() == "[flag] 100/200 rows (50%), 10 rows/s, ETA 0:00:10"
+
+def test_line_without_total():
+    progress = Progress(unit="days", tty=True, stream=io.StringIO(), enabled=False)
+    progress.start()
+    progress._started -= 2
+    progress.advance(4)
+    assert progress.line() == "[start] 4 days, 2 days/s, elapsed 0:00:02"
+
+def test_add_total():
+    progress = Progress(tty=True, stream=io.StringIO(), enabled=False)
+    progress.add_total(10)
+    progress.add_total(5)
+    progress.advance(15)
+    assert "15/15 rows (100%)" in progress.line()
+
+def test_tty_redraws():
+    stream = io.StringIO()
+    with Progress(total=10, tty=True, stream=stream, interval=0.01) as progress:
+        progress.stage("extract")
+        time.sleep(0.05)
+        progress.advance(10)
+
+    output = stream.getvalue()
+    # Redrawn in place, with a newline only once done.
+    assert output.startswith("\r[") and output.count("\n") == 1
+    assert "[extract] 10/10 rows (100%)" in output.splitlines()[-1]
+
+def test_logs_when_not_tty():
+    logged = []
+    progress = Progress(total=10, tty=False, log_interval=0.01)
+    progress._ios = type("Mock_IOs", (), {"log_and_print": lambda self, line: logged.append(line)})()
+    with progress:
+        time.sleep(0.05)
+    assert len(logged) >= 2 and logged[0].startswith("[start] 0/10 rows")
+
+def test_disabled_reports_nothing():
+    stream = io.StringIO()
+    with Progress(total=10, tty=True, stream=stream, interval=0.01, enabled=False) as progress:
+        progress.advance(10)
+        time.sleep(0.03)
+    assert stream.getvalue() == ""
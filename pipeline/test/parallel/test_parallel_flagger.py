@@ -0,0 +1,100 @@
+import pytest
+import numpy
+import pandas
+from src.config import config
+from src.parallel import ParallelFlagger, collect_masks
+from flaggers.flagger import flaggers, Flags
+
+@pytest.fixture
+def sample_df():
+    # Object columns holding None mimic the output of Table._query_table.
+    rows = 40
+    return pandas.DataFrame({
+            "service_date": pandas.date_range("2020-01-01", periods=rows, freq="h"),
+            "service_key": ["W" if i % 2 else None for i in range(rows)],
+            "door": numpy.array([i % 3 for i in range(rows)], dtype=object),
+            "location_distance": numpy.array(
+                [None if i % 7 == 0 else float(i * 10) for i in range(rows)], dtype=object),
+        }, index=pandas.Index(range(100, 100 + rows), name="row_id"))
+
+@pytest.fixture
+def config_instance():
+    config.load()
+    return config
+
+def test_partition(sample_df):
+    instance = ParallelFlagger(4, min_partition_rows=10)
+    assert instance._partition(40) == [(0, 10), (10, 20), (20, 30), (30, 40)]
+    assert instance._partition(25) == [(0, 12), (12, 25)]
+    assert instance._partition(9) == [(0, 9)]
+
+def test_parallel_matches_serial(sample_df, config_instance):
+    expected, expected_errors = collect_masks(flaggers, sample_df, config_instance)
+    masks, errors = ParallelFlagger(4, min_partition_rows=10).flag_frame(sample_df, config_instance)
+
+    assert errors == expected_errors == []
+    assert set(masks) == set(expected)
+    for flag in expected:
+        assert numpy.array_equal(masks[flag], expected[flag])
+    assert Flags.UNOPENED_DOOR in masks
+    assert Flags.UNOBSERVED_STOP in masks
+    assert Flags.SERVICE_KEY_NULL in masks
+
+def test_parallel_reuses_pool(sample_df, config_instance):
+    expected, _ = collect_masks(flaggers, sample_df, config_instance)
+    with ParallelFlagger(4, min_partition_rows=10) as instance:
+        masks, _ = instance.flag_frame(sample_df, config_instance)
+        executor = instance._executor
+        assert executor is not None
+        masks_again, _ = instance.flag_frame(sample_df, config_instance)
+        assert instance._executor is executor
+    assert instance._executor is None
+    for flag in expected:
+        assert numpy.array_equal(masks[flag], expected[flag])
+        assert numpy.array_equal(masks_again[flag], expected[flag])
+
+def test_parallel_typed_columns(sample_df, config_instance):
+    # Nullable and categorical columns, as returned by CTran_Data.
+    df = sample_df.astype({"service_key": "category", "door": "Int32"})
+    df.loc[df.index[::5], "door"] = None
+    expected, _ = collect_masks(flaggers, df, config_instance)
+    masks, errors = ParallelFlagger(4, min_partition_rows=10).flag_frame(df, config_instance)
+
+    assert errors == []
+    assert set(masks) == set(expected)
+    for flag in expected:
+        assert numpy.array_equal(masks[flag], expected[flag])
+    assert Flags.DOOR_NULL in masks
+
+def test_collect_masks_skips_duplicate(sample_df, config_instance):
+    masks, _ = collect_masks(flaggers, pandas.concat([sample_df, sample_df]), config_instance)
+    assert Flags.DUPLICATE not in masks
+
+def test_collect_masks_reports_errors(sample_df, config_instance):
+    class Broken():
+        name = "Broken"
+        def flag_frame(self, data, config):
+            raise KeyError("broken")
+
+    masks, errors = collect_masks([Broken()], sample_df, config_instance)
+    assert masks == {}
+    assert errors == [("Broken", "'broken'")]
+
+def test_collect_masks_timings(sample_df, config_instance):
+    class Every_Other():
+        name = "Every_Other"
+        def flag_frame(self, data, config):
+            return {Flags.DOOR_NULL: numpy.arange(len(data.index)) % 2 == 0}
+
+    timings = {"Every_Other": [1.0, 3]}
+    collect_masks([Every_Other()], sample_df, config_instance, timings)
+    assert timings["Every_Other"][0] >= 1.0
+    assert timings["Every_Other"][1] == 3 + 20
+
+def test_parallel_timings(sample_df, config_instance):
+    expected = {}
+    collect_masks(flaggers, sample_df, config_instance, expected)
+    timings = {}
+    ParallelFlagger(4, min_partition_rows=10).flag_frame(sample_df, config_instance, timings)
+    assert {name: raised for name, (_, raised) in timings.items()} == \
+        {name: raised for name, (_, raised) in expected.items()}
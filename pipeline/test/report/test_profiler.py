@@ -0,0 +1,56 @@
+import threading
+from src.report import Profiler
+
+def work(n):
+    return sum(i * i for i in range(n))
+
+def allocate():
+    return [str(i) * 10 for i in range(20000)]
+
+def test_stages(tmp_path):
+    profiler = Profiler(top=10)
+    profiler.start()
+    profiler.stage("flag")
+    work(10000)
+    profiler.stage("write")
+    kept = allocate()
+    profiler.stop()
+
+    full_path = profiler.write(str(tmp_path) + "/")
+    text = open(full_path).read()
+    assert "Stage flag, by cumulative time" in text
+    assert "work" in text.split("Stage write")[0]
+    assert "Stage write, top allocators" in text
+    assert "test_profiler.py" in text.split("Stage write, top allocators")[1]
+    assert (tmp_path / full_path.split("/")[-1].replace(".txt", "_flag.prof")).exists()
+    assert len(kept) == 20000
+
+def test_threads():
+    profiler = Profiler()
+    profiler.start()
+
+    def run():
+        profiler.stage("flag")
+        work(1000)
+        profiler.stage(None)
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+        # One at a time, newer Pythons allow a single active profiler.
+        thread.join()
+    profiler.stop()
+
+    stats = profiler._stats()
+    assert list(stats) == ["flag"]
+    calls = [count for (_, _, name), (_, count, _, _, _) in stats["flag"].stats.items()
+             if name == "work"]
+    assert calls == [2]
+
+def test_write_fails(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    profiler = Profiler()
+    profiler.start()
+    profiler.stop()
+    assert profiler.write(str(blocker) + "/") is None
@@ -0,0 +1,82 @@
+import json
+import time
+from src.report import RunReport
+
+def test_stages():
+    report = RunReport()
+    report.stage("extract")
+    time.sleep(0.01)
+    report.stage("flag", 10)
+    report.stage("extract")
+    report.stage("flag", 5)
+    report.finish(True)
+
+    stages = report.to_dict()["stages"]
+    assert stages["extract"]["calls"] == 2
+    assert stages["extract"]["seconds"] >= 0.01
+    assert stages["flag"]["rows"] == 15
+    assert report.to_dict()["seconds"] >= stages["extract"]["seconds"]
+
+def test_counters_and_flaggers():
+    report = RunReport()
+    report.count("rows", 10)
+    report.count("rows", 5)
+    report.add_flaggers({"Null": [0.5, 3]})
+    report.add_flaggers({"Null": [0.25, 1], "Bounds": [0.1, 0]})
+
+    result = report.to_dict()
+    assert result["counters"] == {"rows": 15}
+    assert result["flaggers"]["Null"] == {"seconds": 0.75, "flags": 4}
+    assert result["flaggers"]["Bounds"] == {"seconds": 0.1, "flags": 0}
+
+def test_merge():
+    report = RunReport("backfill")
+    for rows in [3, 4]:
+        day = RunReport()
+        day.stage("flag", rows)
+        day.count("rows", rows)
+        day.add_flaggers({"Null": [0.5, rows]})
+        day.finish(True)
+        report.merge(day)
+
+    result = report.to_dict()
+    assert result["stages"]["flag"]["rows"] == 7
+    assert result["stages"]["flag"]["calls"] == 2
+    assert result["counters"] == {"rows": 7}
+    assert result["flaggers"]["Null"] == {"seconds": 1.0, "flags": 7}
+
+def test_write_json(tmp_path):
+    report = RunReport()
+    report.stage("write", 2)
+    report.finish(False)
+
+    full_path = report.write_json(str(tmp_path) + "/reports/")
+    assert full_path.endswith(".json")
+    with open(full_path) as report_file:
+        result = json.load(report_file)
+    assert result["success"] == False
+    assert result["stages"]["write"]["rows"] == 2
+    assert list((tmp_path / "reports").iterdir()) == [tmp_path / "reports" / full_path.split("/")[-1]]
+
+def test_write_prometheus(tmp_path):
+    report = RunReport()
+    report.stage("flag", 4)
+    report.count("flags", 2)
+    report.add_flaggers({"Null": [0.5, 2]})
+    report.finish(True)
+
+    full_path = str(tmp_path / "stopspot.prom")
+    assert report.write_prometheus(full_path)
+    lines = open(full_path).read().splitlines()
+    assert 'stopspot_pipeline_last_run_success{run="process_data"} 1' in lines
+    assert 'stopspot_pipeline_last_run_total{run="process_data",counter="flags"} 2' in lines
+    assert 'stopspot_pipeline_stage_rows{run="process_data",stage="flag"} 4' in lines
+    assert 'stopspot_pipeline_flagger_flags{run="process_data",flagger="Null"} 2' in lines
+    assert "# TYPE stopspot_pipeline_stage_seconds gauge" in lines
+
+def test_write_fails(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    report = RunReport()
+    assert report.write_json(str(blocker) + "/") is None
+    assert not report.write_prometheus(str(blocker / "stopspot.prom"))
@@ -0,0 +1,64 @@
+import os
+import pytest
+import pandas
+from datetime import date
+from src.tables import CTran_Cache
+
+pytest.importorskip("pyarrow")
+
+@pytest.fixture
+def cache(tmp_path):
+    return CTran_Cache(str(tmp_path) + "/", 10 * 1024 * 1024)
+
+@pytest.fixture
+def day_df():
+    df = pandas.DataFrame({"service_date": [date(2020, 1, 1), date(2020, 1, 1)],
+                           "door": [0, 1],
+                           "location_distance": [10.5, None]},
+                          index=pandas.Index([3, 7], name="row_id"))
+    return df.where(df.notnull(), None)
+
+def test_put_get(cache, day_df):
+    assert cache.get(date(2020, 1, 1)) is None
+    assert cache.put(date(2020, 1, 1), day_df)
+
+    df = cache.get(date(2020, 1, 1))
+    assert list(df.index) == [3, 7]
+    assert df.index.name == "row_id"
+    assert list(df["door"]) == [0, 1]
+    assert df["location_distance"][3] == 10.5
+    assert pandas.isna(df["location_distance"][7])
+    assert list(df["service_date"]) == [date(2020, 1, 1)] * 2
+
+def test_evict_least_recently_used(tmp_path, day_df):
+    cache = CTran_Cache(str(tmp_path) + "/", 10 * 1024 * 1024)
+    assert cache.put(date(2020, 1, 1), day_df)
+    size = os.path.getsize(str(tmp_path) + "/2020-01-01.parquet")
+    cache._max_bytes = 2 * size
+
+    assert cache.put(date(2020, 1, 2), day_df)
+    # Reading 01-01 makes 01-02 the least recently used.
+    os.utime(str(tmp_path) + "/2020-01-01.parquet", (0, 0))
+    os.utime(str(tmp_path) + "/2020-01-02.parquet", (0, 0))
+    assert cache.get(date(2020, 1, 1)) is not None
+    assert cache.put(date(2020, 1, 3), day_df)
+
+    assert cache.get(date(2020, 1, 2)) is None
+    assert cache.get(date(2020, 1, 1)) is not None
+    assert cache.get(date(2020, 1, 3)) is not None
+
+def test_invalidate(cache, day_df):
+    for day in [1, 2, 3, 4]:
+        cache.put(date(2020, 1, day), day_df)
+
+    assert cache.invalidate(date(2020, 1, 2), date(2020, 1, 3)) == 2
+    assert cache.get(date(2020, 1, 2)) is None
+    assert cache.get(date(2020, 1, 4)) is not None
+    assert cache.invalidate() == 2
+    assert cache.get(date(2020, 1, 1)) is None
+
+def test_no_pyarrow(monkeypatch, cache, day_df):
+    monkeypatch.setattr("src.tables.ctran_cache._load_pyarrow", lambda: None)
+    assert not cache.is_available()
+    assert cache.put(date(2020, 1, 1), day_df) == False
+    assert cache.get(date(2020, 1, 1)) is None
@@ -1,6 +1,7 @@
 import io
 import pytest
 import pandas
+from datetime import datetime
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
 from src.tables import CTran_Data
@@ -27,6 +28,8 @@ def dummy_engine():
 @pytest.fixture
 def custom_connect():
     class custom_connect():
+        def close(self):
+            return
         def execute(self, sql):
             global g_is_valid
             global g_expected
@@ -174,3 +177,75 @@ def test_create_table_helper_sqlalchemy_fail(custom_connect, instance_fixture):
     instance_fixture._engine.connect = custom_connect
     instance_fixture.create_schema = lambda: True
     assert instance_fixture.create_table() == False
+
+def test_query_date_range_chunks(instance_fixture):
+    def custom_query_table_chunks(sql, chunksize):
+        return sql, chunksize
+
+    instance_fixture._query_table_chunks = custom_query_table_chunks
+    expected = "".join(["SELECT * FROM ", instance_fixture._schema, ".",
+                        instance_fixture._table_name,
+                        " WHERE service_date BETWEEN '2020-01-01' AND '2020-01-31'",
+                        " ORDER BY service_date, row_id;"])
+    assert instance_fixture.query_date_range_chunks(
+        datetime(2020, 1, 1), datetime(2020, 1, 31), 500) == (expected, 500)
+
+def test_query_new_rows(instance_fixture):
+    instance_fixture._query_table = lambda sql: sql
+    instance_fixture._query_table_chunks = lambda sql, chunksize: (sql, chunksize)
+    table = "".join([instance_fixture._schema, ".", instance_fixture._table_name])
+    assert instance_fixture.query_new_rows(42) == \
+        "SELECT * FROM " + table + " WHERE row_id > 42;"
+    assert instance_fixture.query_new_rows_chunks(42, 500) == \
+        ("SELECT * FROM " + table + " WHERE row_id > 42 ORDER BY service_date, row_id;", 500)
+
+def test_query_date_range_cache(monkeypatch, instance_fixture):
+    class Custom_Cache():
+        def __init__(self):
+            self.days = {datetime(2020, 1, 2).date(): pandas.DataFrame(
+                {"service_date": [datetime(2020, 1, 2).date()]}, index=[2])}
+            self.put_days = []
+        def get(self, day):
+            return self.days.get(day)
+        def put(self, day, df):
+            self.put_days.append(day)
+
+    queried = []
+    def custom_query_date_range(date_from, date_to):
+        queried.append((date_from, date_to))
+        return pandas.DataFrame({"service_date": [date_from, date_to]},
+                                index=[date_from.day, date_to.day + 10])
+
+    cache = Custom_Cache()
+    instance_fixture.set_cache(cache)
+    instance_fixture._query_date_range = custom_query_date_range
+    df = instance_fixture.query_date_range(datetime(2020, 1, 1), datetime(2020, 1, 4))
+
+    # Only the missing days are queried, one query per run of days.
+    d = lambda day: datetime(2020, 1, day).date()
+    assert queried == [(d(1), d(1)), (d(3), d(4))]
+    assert sorted(df.index) == [1, 2, 3, 11, 14]
+    assert cache.put_days == [d(1), d(3), d(4)]
+
+def test_query_date_range_cache_fails(instance_fixture):
+    class Custom_Cache():
+        def get(self, day):
+            return None
+
+    instance_fixture.set_cache(Custom_Cache())
+    instance_fixture._query_date_range = lambda date_from, date_to: None
+    assert instance_fixture.query_date_range(datetime(2020, 1, 1), datetime(2020, 1, 4)) is None
+
+def test_apply_dtypes(instance_fixture):
+    # As read_sql returns them: an INTEGER column with a null is float64,
+    # without one int64.
+    df = pandas.DataFrame({
+        "door": [1.0, None],
+        "direction": [0, 1],
+        "service_key": ["W", None],
+        "location_distance": [12.5, None],
+    }, index=pandas.Index([1, 2], name="row_id"))
+    df = instance_fixture._apply_dtypes(df)
+    assert df.dtypes.astype(str).tolist() == ["Int32", "Int16", "category", "float64"]
+    assert df["door"].isna().tolist() == [False, True]
+    assert df["service_key"].isna().tolist() == [False, True]
@@ -0,0 +1,102 @@
+import pytest
+import pandas
+from src.tables import Flagged_Bitmask
+import flaggers.flagger as flagger
+
+@pytest.fixture
+def instance_fixture():
+    instance = Flagged_Bitmask("sw23", "invalid", "localhost", "aperture")
+    return instance
+
+@pytest.fixture
+def flagged_rows():
+    # [row_id, service_key, flag_id, service_date]
+    return [[1, 2, 3, "2020/1/1"],
+            [1, 2, 5, "2020/1/1"],
+            [1, 2, 3, "2020/1/1"],
+            [4, 2, 1, "2020/1/2"]]
+
+def test_creation_sql(instance_fixture):
+    sql = instance_fixture._creation_sql
+    assert "flags BIGINT NOT NULL" in sql
+    assert "PRIMARY KEY (service_key, row_id)" in sql
+    for flag in flagger.Flags:
+        assert "".join(["flagged_bitmask_flag_", str(flag.value), "\n"]) in sql
+    assert "CREATE OR REPLACE VIEW hive.flagged_bitmask_rows AS" in sql
+    assert "ON (fb.flags & (1::BIGINT << f.flag_id)) <> 0;" in sql
+
+def test_to_masks(instance_fixture, flagged_rows):
+    df = instance_fixture._to_masks(flagged_rows)
+    assert list(df.columns) == instance_fixture._expected_cols
+    assert df.values.tolist() == [[1, 2, (1 << 3) | (1 << 5), "2020/1/1"],
+                                  [4, 2, 1 << 1, "2020/1/2"]]
+
+def test_to_masks_flag_too_large(instance_fixture):
+    assert instance_fixture._to_masks([[1, 2, 63, "2020/1/1"]]) is None
+
+def test_write_table(instance_fixture, flagged_rows):
+    calls = []
+    instance_fixture._write_table = lambda df, **kwargs: calls.append((df, kwargs)) or True
+    assert instance_fixture.write_table(flagged_rows)
+    df, kwargs = calls[0]
+    assert len(df.index) == 2
+    assert kwargs["conflict_columns"] == ["service_key", "row_id"]
+    # New flags are OR'ed into the stored mask.
+    assert kwargs["update_columns"] == {"flags": "flagged_bitmask.flags | EXCLUDED.flags"}
+
+    assert instance_fixture.write_table(flagged_rows, upsert=True)
+    assert calls[1][1]["update_columns"] == ["flags", "service_date"]
+
+def test_write_table_no_data(instance_fixture):
+    assert instance_fixture.write_table([]) == False
+
+def test_replace_date_range(instance_fixture, flagged_rows):
+    calls = []
+    instance_fixture._write_table = lambda df, **kwargs: calls.append(kwargs) or True
+    assert instance_fixture.replace_date_range(flagged_rows, "2020/1/1", "2020/1/2")
+    assert calls[0]["update_columns"] == ["flags", "service_date"]
+    assert calls[0]["replace_where"] == \
+        "flagged_bitmask.service_date BETWEEN '2020-01-01' AND '2020-01-02'"
+
+def test_query_by_flag_id(monkeypatch, instance_fixture):
+    calls = []
+    monkeypatch.setattr(instance_fixture, "_query_table",
+                        lambda sql, expected_cols=None: calls.append((sql, expected_cols)))
+    instance_fixture.query_by_flag_id(3, 10)
+    assert calls == [("SELECT row_id, service_key, 3 AS flag_id, service_date"
+                      " FROM hive.flagged_bitmask WHERE (flags & 8) <> 0 LIMIT '10';",
+                      ["row_id", "service_key", "flag_id", "service_date"])]
+
+def test_query_by_flags(monkeypatch, instance_fixture):
+    calls = []
+    monkeypatch.setattr(instance_fixture, "_query_table", lambda sql: calls.append(sql))
+    instance_fixture.query_by_flags([1, 3])
+    instance_fixture.query_by_flags([1, 3], match_all=True, limit=5)
+    assert calls == [
+        "SELECT * FROM hive.flagged_bitmask"
+        " WHERE (flags & 2) <> 0 OR (flags & 8) <> 0;",
+        "SELECT * FROM hive.flagged_bitmask"
+        " WHERE (flags & 2) <> 0 AND (flags & 8) <> 0 LIMIT '5';"]
+
+def test_write_csv(tmp_path, instance_fixture, flagged_rows):
+    path = str(tmp_path) + "/"
+    assert instance_fixture.write_csv(path, flagged_rows)
+    df = pandas.read_csv(path + "flagged_bitmask.csv")
+    assert list(df.columns) == instance_fixture._expected_cols
+    assert list(df["flags"]) == [40, 2]
+
+def test_write_parquet(tmp_path, instance_fixture, flagged_rows):
+    pytest.importorskip("pyarrow")
+    path = str(tmp_path) + "/"
+    assert instance_fixture.write_parquet(path, flagged_rows, [])
+    df = pandas.read_parquet(path + "flagged_bitmask/service_date=2020-01-01/part-0.parquet")
+    assert df.values.tolist() == [[1, 2, 40]]
+
+def test_write_parquet_merge(tmp_path, instance_fixture, flagged_rows):
+    pytest.importorskip("pyarrow")
+    path = str(tmp_path) + "/"
+    assert instance_fixture.write_parquet(path, flagged_rows, [])
+    # The masks of a row already saved are OR'd.
+    assert instance_fixture.write_parquet(path, [[1, 2, 1, "2020/1/1"], [9, 2, 1, "2020/1/1"]], [], merge=True)
+    df = pandas.read_parquet(path + "flagged_bitmask/service_date=2020-01-01/part-0.parquet")
+    assert sorted(df.values.tolist()) == [[1, 2, 42], [9, 2, 2]]
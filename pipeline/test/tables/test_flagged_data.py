@@ -32,6 +32,8 @@ def mock_connection():
             return self
         def __exit__(self, type, value, traceback):
             return
+        def close(self):
+            return
         def execute(self, sql):
             print(sql)
             self.sql = sql
@@ -124,6 +126,8 @@ def test_create_view(monkeypatch, instance_fixture):
             return self
         def __exit__(self, type, value, traceback):
             return
+        def close(self):
+            return
         def execute(self, sql):
             self.sql = sql
 
@@ -141,3 +145,46 @@ def test_create_view(monkeypatch, instance_fixture):
     ])
     instance_fixture.create_view_for_flag(mock_flag.test)
     assert mock.sql == expected
+
+def test_write_table_upsert(instance_fixture):
+    calls = []
+    instance_fixture._write_table = lambda df, **kwargs: calls.append(kwargs) or True
+    assert instance_fixture.write_table([[1, 2, 3, "2020/1/1"]], upsert=True)
+    assert calls[0]["update_columns"] == ["service_date"]
+
+def test_replace_date_range(instance_fixture):
+    calls = []
+    instance_fixture._write_table = lambda df, **kwargs: calls.append((df, kwargs)) or True
+    assert instance_fixture.replace_date_range([[1, 2, 3, "2020/1/1"]], "2020/1/2", "2020/1/1")
+
+    df, kwargs = calls[0]
+    assert list(df.columns) == instance_fixture._expected_cols
+    assert kwargs["conflict_columns"] == ["row_id", "flag_id", "service_key"]
+    assert kwargs["update_columns"] == ["service_date"]
+    assert kwargs["replace_where"] == \
+        "flagged_data.service_date BETWEEN '2020-01-01' AND '2020-01-02'"
+
+def test_replace_date_range_no_data(instance_fixture):
+    instance_fixture.delete_date_range = lambda start_date, end_date: "deleted"
+    assert instance_fixture.replace_date_range([], "2020/1/1") == "deleted"
+
+def test_write_parquet(tmp_path, instance_fixture):
+    pytest.importorskip("pyarrow")
+    path = str(tmp_path) + "/"
+    rows = [[1, 2, 3, "2020/1/1"], [4, 2, 5, "2020/1/2"]]
+    days = [datetime.date(2020, 1, 1), datetime.date(2020, 1, 2), datetime.date(2020, 1, 3)]
+    assert instance_fixture.write_parquet(path, rows, days)
+
+    df = pandas.read_parquet(path + "flagged_data/service_date=2020-01-01/part-0.parquet")
+    assert df.values.tolist() == [[1, 2, 3]]
+    assert [str(dtype) for dtype in df.dtypes] == ["int64", "int32", "int16"]
+    # Processed days without flags get an empty file.
+    df = pandas.read_parquet(path + "flagged_data/service_date=2020-01-03/part-0.parquet")
+    assert df.empty
+
+    # Reprocessing a day replaces its file, other days are left alone.
+    assert instance_fixture.write_parquet(path, [[7, 2, 1, "2020/1/1"]], [datetime.date(2020, 1, 1)])
+    df = pandas.read_parquet(path + "flagged_data/service_date=2020-01-01/part-0.parquet")
+    assert df.values.tolist() == [[7, 2, 1]]
+    df = pandas.read_parquet(path + "flagged_data/service_date=2020-01-02/part-0.parquet")
+    assert df.values.tolist() == [[4, 2, 5]]
@@ -0,0 +1,43 @@
+import pytest
+from src.tables import engines, Row_Hashes
+
+@pytest.fixture
+def instance_fixture():
+    instance = Row_Hashes("sw23", "invalid", "localhost", "aperture")
+    return instance
+
+def test_table_name(instance_fixture):
+    assert instance_fixture._table_name == "row_hashes"
+
+def test_write_table(instance_fixture):
+    calls = []
+    instance_fixture._write_table = lambda df, **kwargs: calls.append((df, kwargs)) or True
+    assert instance_fixture.write_table([[1, -5, 10], [1, 6, 11]])
+
+    df, kwargs = calls[0]
+    assert df.values.tolist() == [[1, -5, 10], [1, 6, 11]]
+    # The first row_id of a hash is kept.
+    assert kwargs == {"conflict_columns": ["service_key", "row_hash"]}
+
+def test_query_hashes(instance_fixture):
+    queries = []
+    instance_fixture._query_table = lambda sql: queries.append(sql)
+    instance_fixture.query_hashes(3, [-5, 6])
+    assert queries == [
+        "SELECT * FROM hive.row_hashes WHERE service_key = 3 AND row_hash IN (-5, 6);"]
+
+def test_delete_service_keys_bad_connection(instance_fixture):
+    assert instance_fixture.delete_service_keys([])
+    assert not instance_fixture.delete_service_keys([1, 2])
+
+def test_retain_service_keys(tmp_path):
+    instance = Row_Hashes(engine="sqlite:///" + str(tmp_path / "pipeline.db"))
+    assert instance.create_table()
+    assert instance.write_table([[1, -5, 10], [2, 6, 11], [3, 7, 12]])
+    assert instance.retain_service_keys([])
+    assert instance.retain_service_keys([2, 3])
+    assert instance.get_full_table()["service_key"].tolist() == [2, 3]
+    engines.dispose()
+
+def test_retain_service_keys_bad_connection(instance_fixture):
+    assert not instance_fixture.retain_service_keys([1, 2])
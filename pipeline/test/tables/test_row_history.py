@@ -0,0 +1,155 @@
+import os
+import numpy
+import pandas
+import pytest
+from datetime import date
+from src.tables import Row_History
+from src.tables.row_history import Bloom_Filter
+
+
+class Mock_Row_Hashes():
+    def __init__(self):
+        self.rows = {}
+        self.deleted = []
+
+    def write_table(self, data):
+        for service_key, row_hash, row_id in data:
+            self.rows.setdefault((service_key, row_hash), row_id)
+        return True
+
+    def query_hashes(self, service_key, hashes):
+        found = [[service_key, row_hash, self.rows[(service_key, row_hash)]]
+                 for row_hash in hashes if (service_key, row_hash) in self.rows]
+        return pandas.DataFrame(found, columns=["service_key", "row_hash", "row_id"])
+
+    def delete_service_keys(self, service_keys):
+        self.deleted.extend(service_keys)
+        self.rows = {key: row_id for key, row_id in self.rows.items()
+                     if key[0] not in service_keys}
+        return True
+
+    def retain_service_keys(self, service_keys):
+        return self.delete_service_keys(sorted({key[0] for key in self.rows} - set(service_keys)))
+
+
+class Mock_CTran():
+    def __init__(self):
+        self.df = None
+
+    def query_row_ids(self, row_ids):
+        return self.df.loc[[row_id for row_id in row_ids if row_id in self.df.index]]
+
+
+class Mock_Service_Periods():
+    def __init__(self):
+        # Service periods start in the order of their service_key.
+        self.start_dates = {service_key: numpy.datetime64("2020-01-01") + 120 * service_key
+                            for service_key in range(1, 10)}
+
+    def get_start_dates(self):
+        return self.start_dates
+
+
+def frame(row_ids, doors, day=date(2020, 1, 1)):
+    return pandas.DataFrame({"service_date": [day] * len(row_ids), "door": doors},
+                            index=pandas.Index(row_ids, name="row_id"))
+
+
+@pytest.fixture
+def history(tmp_path):
+    return Row_History(str(tmp_path) + "/", 1000, 2, Mock_Row_Hashes(), Mock_CTran(),
+                       Mock_Service_Periods())
+
+
+def test_bloom_filter(tmp_path):
+    path = str(tmp_path / "1.bloom")
+    bloom = Bloom_Filter(path, 1000)
+    added = numpy.arange(0, 500, dtype=numpy.uint64) * numpy.uint64(2654435761)
+    bloom.add(added)
+    assert bloom.contains(added).all()
+
+    others = numpy.arange(500, 10500, dtype=numpy.uint64) * numpy.uint64(2654435761)
+    assert bloom.contains(others).mean() < 0.05
+    bloom.close()
+
+    # The filter persists, whatever the sizing given on reopening.
+    reopened = Bloom_Filter(path, 10)
+    assert reopened.contains(added).all()
+
+def test_bloom_filter_bad_file(tmp_path):
+    path = tmp_path / "1.bloom"
+    path.write_bytes(b"")
+    with pytest.raises(ValueError):
+        Bloom_Filter(str(path), 1000)
+
+def test_check_earlier_run(history):
+    first = frame([1, 2], [0, 1])
+    history._ctran.df = first
+    assert history.check(first, pandas.Series([7, 7], index=first.index)) == []
+
+    # Row 10 repeats row 2 of the earlier batch, row 11 is new.
+    second = frame([10, 11], [1, 2])
+    assert history.check(second, pandas.Series([7, 7], index=second.index)) == [
+        (10, 2, 7, date(2020, 1, 1))]
+
+def test_check_same_rows_again(history):
+    # Reprocessing a batch does not report its rows as their own duplicates.
+    df = frame([1, 2], [0, 1])
+    history._ctran.df = df
+    service_keys = pandas.Series([7, 7], index=df.index)
+    history.check(df, service_keys)
+    assert history.check(df, service_keys) == []
+
+def test_check_verifies_content(history):
+    df = frame([1], [0])
+    history.check(df, pandas.Series([7], index=df.index))
+
+    # Portal returns different content for row 1: a hash collision.
+    history._ctran.df = frame([1], [5])
+    again = frame([2], [0])
+    assert history.check(again, pandas.Series([7], index=again.index)) == []
+
+def test_check_exclude_and_skipped(history):
+    df = frame([1, 2], [0, 1])
+    history._ctran.df = df
+    history.check(df, pandas.Series([7, 7], index=df.index))
+
+    again = frame([3, 4], [0, 1])
+    assert history.check(again, pandas.Series([7, numpy.nan], index=again.index), exclude={3}) == []
+
+def test_rotate(history, tmp_path):
+    for service_key in [1, 2, 3]:
+        df = frame([service_key], [service_key])
+        history.check(df, pandas.Series([service_key], index=df.index))
+
+    df = frame([4], [4])
+    history.check(df, pandas.Series([4], index=df.index))
+    assert sorted(os.listdir(str(tmp_path))) == ["3.bloom", "4.bloom"]
+    assert sorted(history._row_hashes.deleted) == [1, 2]
+
+    # Reprocessing an old period does not evict the latest ones.
+    df = frame([5], [5])
+    history.check(df, pandas.Series([1], index=df.index))
+    assert sorted(os.listdir(str(tmp_path))) == ["3.bloom", "4.bloom"]
+    assert sorted({key[0] for key in history._row_hashes.rows}) == [3, 4]
+
+def test_rotate_by_start_date(history, tmp_path):
+    # A period inserted later can start earlier.
+    history._service_periods.start_dates[3] = numpy.datetime64("2019-01-01")
+    for service_key in [1, 2, 3]:
+        df = frame([service_key], [service_key])
+        history.check(df, pandas.Series([service_key], index=df.index))
+    assert sorted(os.listdir(str(tmp_path))) == ["1.bloom", "2.bloom"]
+
+def test_rotate_prunes_row_hashes(history, tmp_path):
+    # Hashes of a period whose filter file is gone, left by an earlier run.
+    history._row_hashes.write_table([[1, 5, 10]])
+    df = frame([2], [2])
+    history.check(df, pandas.Series([2], index=df.index))
+    assert history._row_hashes.deleted == [1]
+    assert [key[0] for key in history._row_hashes.rows] == [2]
+
+    # Later checks of the same periods do not rotate again.
+    df = frame([3], [3])
+    history.check(df, pandas.Series([2], index=df.index))
+    assert history._row_hashes.deleted == [1]
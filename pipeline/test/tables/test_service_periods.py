@@ -1,5 +1,6 @@
 import io
 import pytest
+import numpy
 import pandas
 from sqlalchemy import create_engine
 from src.tables import Service_Periods
@@ -93,6 +94,10 @@ def test_insert_one(instance_fixture):
             return self
         def __exit__(self, type, value, traceback):
             return
+        def close(self):
+            return
+        def begin(self):
+            return self
         def execute(self, sql):
             return type('X', (object,), dict(first=lambda: (sql, 0)))
     instance_fixture._engine.connect = lambda: mock_connection()
@@ -102,3 +107,62 @@ def test_insert_one(instance_fixture):
                         " VALUES ('2019-01-10', '2019-05-09') RETURNING service_key;"])
 
     assert instance_fixture.insert_one(datetime(2019, 3, 1)) == expected
+
+@pytest.fixture
+def mock_periods_connection():
+    class mock_periods_connection():
+        def __init__(self):
+            self.rows = [(1, date(2018, 9, 10), date(2019, 1, 9)),
+                         (2, date(2019, 1, 10), date(2019, 5, 9))]
+            self.statements = []
+        def __enter__(self):
+            return self
+        def __exit__(self, type, value, traceback):
+            return
+        def close(self):
+            return
+        def execute(self, sql):
+            self.statements.append(sql)
+            if sql.startswith("INSERT"):
+                self.rows.append((3, date(2019, 5, 10), date(2019, 9, 9)))
+            return type('X', (object,), dict(fetchall=lambda: list(self.rows)))
+
+    return mock_periods_connection()
+
+def test_resolve_known_periods(mock_periods_connection, instance_fixture):
+    instance_fixture._engine.connect = lambda: mock_periods_connection
+    dates = pandas.Series([datetime(2019, 1, 9), date(2019, 1, 10), None, datetime(2018, 9, 10)],
+                          index=[5, 6, 7, 8])
+    keys = instance_fixture.resolve(dates)
+    assert list(keys.index) == [5, 6, 7, 8]
+    assert keys[5] == 1 and keys[6] == 2 and keys[8] == 1
+    assert pandas.isna(keys[7])
+    # The index is loaded once and nothing is inserted.
+    assert len(mock_periods_connection.statements) == 1
+
+    instance_fixture.resolve([datetime(2019, 2, 1)])
+    assert len(mock_periods_connection.statements) == 1
+
+def test_resolve_inserts_missing_periods_once(mock_periods_connection, instance_fixture):
+    instance_fixture._engine.connect = lambda: mock_periods_connection
+    keys = instance_fixture.resolve([datetime(2019, 6, 1), datetime(2019, 7, 1), datetime(2019, 2, 1)])
+    assert list(keys) == [3, 3, 2]
+
+    inserts = [sql for sql in mock_periods_connection.statements if sql.startswith("INSERT")]
+    assert inserts == ["".join(["INSERT INTO ", instance_fixture._schema, ".",
+                                instance_fixture._table_name, " (start_date, end_date)"\
+                                " VALUES ('2019-05-10', '2019-09-09')"\
+                                " ON CONFLICT (start_date, end_date) DO NOTHING;"])]
+
+def test_resolve_bad_connection(instance_fixture):
+    # Since the default engine is already terrible, the index cannot load.
+    keys = instance_fixture.resolve([datetime(2019, 6, 1)])
+    assert keys.isna().all()
+
+def test_get_start_dates(mock_periods_connection, instance_fixture):
+    instance_fixture._engine.connect = lambda: mock_periods_connection
+    assert instance_fixture.get_start_dates() == {1: numpy.datetime64("2018-09-10"),
+                                                  2: numpy.datetime64("2019-01-10")}
+
+def test_get_start_dates_bad_connection(instance_fixture):
+    assert instance_fixture.get_start_dates() is None
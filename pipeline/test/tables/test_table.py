@@ -1,9 +1,11 @@
 import io
+import os
 import pytest
 import pandas
 from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
 from src.tables import Table
+from src.tables import engines
 
 g_is_valid = None
 g_expected = None
@@ -72,6 +74,8 @@ def custom_read_sql(sample_df, instance_fixture):
 @pytest.fixture
 def custom_connect():
     class custom_connect():
+        def close(self):
+            return
         def execute(self, sql):
             global g_is_valid
             global g_expected
@@ -95,6 +99,13 @@ def test_constructor_given_engine(dummy_engine):
     instance = Table_Dummy(engine=engine_url)
     assert instance._engine.url == engine.url
 
+def test_engine_created_on_first_use(dummy_engine):
+    engine_url = dummy_engine[0].url
+    instance = Table_Dummy(engine=engine_url)
+    assert instance.get_url() == engine_url
+    assert engines.stats() == []
+    assert instance.get_engine() is engines.get(engine_url)
+
 def test_no_print(instance_fixture):
     with pytest.raises(AttributeError):
         assert instance_fixture.print("string")
@@ -255,6 +266,8 @@ def test_write_table(monkeypatch, instance_fixture):
             return self
         def __exit__(self, type, value, traceback):
             return
+        def close(self):
+            return
         def execute(self, sql):
             print(sql)
             self.sql = sql
@@ -271,5 +284,184 @@ def test_write_table(monkeypatch, instance_fixture):
                         instance_fixture._table_name, " (col1, col2)"\
                         " VALUES (1, 2), (3, 4) ON CONFLICT (col1) DO NOTHING;"])
 
-    instance_fixture._write_table(df, conflict_columns=conflict_columns)
+    instance_fixture._insert_table(df, conflict_columns=conflict_columns)
     assert mock.sql == expected
+
+@pytest.fixture
+def mock_raw_connection():
+    class mock_raw_connection():
+        def __init__(self):
+            self.statements = []
+            self.copied = []
+            self.committed = False
+            self.closed = False
+        def cursor(self):
+            return self
+        def execute(self, sql):
+            self.statements.append(sql)
+        def copy_expert(self, sql, buffer):
+            self.statements.append(sql)
+            self.copied.append(buffer.read())
+        def commit(self):
+            self.committed = True
+        def rollback(self):
+            return
+        def close(self):
+            self.closed = True
+
+    return mock_raw_connection()
+
+def test_write_table_copy(mock_raw_connection, instance_fixture):
+    instance_fixture._expected_cols = ["col1", "col2"]
+    df = pandas.DataFrame([[1, 2], [3, None], [5, 6]], columns=instance_fixture._expected_cols)
+    instance_fixture._engine.raw_connection = lambda: mock_raw_connection
+    instance_fixture.set_write_chunksize(2)
+
+    assert instance_fixture._write_table(df) == True
+    target = instance_fixture._schema + "." + instance_fixture._table_name
+    copy_sql = "COPY " + target + " (col1, col2) FROM STDIN WITH (FORMAT csv)"
+    assert mock_raw_connection.statements == [copy_sql, copy_sql]
+    assert mock_raw_connection.copied == ["1,2\n3,\n", "5,6\n"]
+    assert mock_raw_connection.committed and mock_raw_connection.closed
+
+def test_write_table_copy_conflict_columns(mock_raw_connection, instance_fixture):
+    instance_fixture._expected_cols = ["col1", "col2"]
+    df = pandas.DataFrame([[1, 2]], columns=instance_fixture._expected_cols)
+    instance_fixture._engine.raw_connection = lambda: mock_raw_connection
+
+    assert instance_fixture._write_table(df, conflict_columns=["col1"]) == True
+    target = instance_fixture._schema + "." + instance_fixture._table_name
+    assert mock_raw_connection.statements == [
+        "CREATE TEMP TABLE fake_staging (LIKE " + target + " INCLUDING DEFAULTS) ON COMMIT DROP;",
+        "COPY fake_staging (col1, col2) FROM STDIN WITH (FORMAT csv)",
+        "INSERT INTO " + target + " (col1, col2) SELECT col1, col2 FROM fake_staging"\
+        " ON CONFLICT (col1) DO NOTHING;"]
+
+def test_write_table_copy_sqlalchemy_error(instance_fixture):
+    instance_fixture._expected_cols = ["col1", "col2"]
+    df = pandas.DataFrame([[1, 2]], columns=instance_fixture._expected_cols)
+    # Since the default engine cannot connect, this will fail.
+    assert instance_fixture._write_table(df) == False
+
+def test_query_table_chunks_bad_engine(instance_fixture):
+    instance_fixture._engine = None
+    assert list(instance_fixture._query_table_chunks("SELECT 1;", 10)) == []
+
+def test_query_table_chunks_sqlalchemy_error(instance_fixture):
+    # Since this table is fake, SQLalchemy will not be able to find it, which
+    # will cause this to stop without yielding.
+    assert list(instance_fixture._query_table_chunks("SELECT 1;", 10)) == []
+
+def test_query_table_chunks(monkeypatch, sample_df, instance_fixture):
+    class mock_connection():
+        def __enter__(self):
+            return self
+        def __exit__(self, type, value, traceback):
+            return
+        def close(self):
+            return
+        def execution_options(self, stream_results):
+            assert stream_results
+            return self
+
+    def custom_read_sql(sql, con, index_col, chunksize):
+        return iter([sample_df.iloc[:chunksize], sample_df.iloc[chunksize:]])
+
+    instance_fixture._engine.connect = lambda: mock_connection()
+    monkeypatch.setattr("pandas.read_sql", custom_read_sql)
+    chunks = list(instance_fixture._query_table_chunks("SELECT 1;", 1))
+    assert [len(chunk.index) for chunk in chunks] == [1, 1]
+
+def test_write_csv_append(tmp_path, sample_df, instance_fixture):
+    path = str(tmp_path) + "/"
+    assert instance_fixture.write_csv(sample_df, path)
+    assert instance_fixture.write_csv(sample_df, path, append=True)
+    with open(path + instance_fixture._table_name + ".csv") as f:
+        lines = f.read().splitlines()
+    assert lines == ["this,is,a,fake,table", "a,b,c,d,e", "AA,BB,CC,DD,EE",
+                     "a,b,c,d,e", "AA,BB,CC,DD,EE"]
+
+def test_write_table_copy_upsert_replace(mock_raw_connection, instance_fixture):
+    instance_fixture._expected_cols = ["col1", "col2"]
+    df = pandas.DataFrame([[1, 2]], columns=instance_fixture._expected_cols)
+    instance_fixture._engine.raw_connection = lambda: mock_raw_connection
+
+    assert instance_fixture._write_table(df, conflict_columns=["col1"],
+                                         update_columns=["col2"],
+                                         replace_where="fake.col2 > 0") == True
+    target = instance_fixture._schema + "." + instance_fixture._table_name
+    assert mock_raw_connection.statements[2:] == [
+        "INSERT INTO " + target + " (col1, col2) SELECT col1, col2 FROM fake_staging"\
+        " ON CONFLICT (col1) DO UPDATE SET col2 = EXCLUDED.col2"\
+        " WHERE (fake.col2) IS DISTINCT FROM (EXCLUDED.col2);",
+        "DELETE FROM " + target + " WHERE fake.col2 > 0 AND NOT EXISTS"\
+        " (SELECT 1 FROM fake_staging WHERE fake_staging.col1 = fake.col1);"]
+
+def test_on_conflict_sql(instance_fixture):
+    assert instance_fixture._on_conflict_sql(["a", "b"]) == " ON CONFLICT (a, b) DO NOTHING"
+    assert instance_fixture._on_conflict_sql(["a"], ["b", "c"]) == \
+        " ON CONFLICT (a) DO UPDATE SET b = EXCLUDED.b, c = EXCLUDED.c"\
+        " WHERE (fake.b, fake.c) IS DISTINCT FROM (EXCLUDED.b, EXCLUDED.c)"
+    assert instance_fixture._on_conflict_sql(["a"], {"b": "fake.b + EXCLUDED.b"}) == \
+        " ON CONFLICT (a) DO UPDATE SET b = fake.b + EXCLUDED.b"\
+        " WHERE (fake.b) IS DISTINCT FROM (fake.b + EXCLUDED.b)"
+
+def test_connect_closes(instance_fixture):
+    class mock_connection():
+        closed = False
+        def close(self):
+            self.closed = True
+
+    mock = mock_connection()
+    instance_fixture._engine.connect = lambda: mock
+    with pytest.raises(ValueError):
+        with instance_fixture._connect() as con:
+            assert con is mock
+            raise ValueError
+    assert mock.closed
+
+def test_write_parquet_staging(tmp_path, instance_fixture):
+    pytest.importorskip("pyarrow")
+    path = str(tmp_path) + "/"
+    day = pandas.Timestamp(2020, 1, 1)
+    other = pandas.Timestamp(2020, 1, 2)
+    first = pandas.DataFrame({"this": [1], "service_date": [day]})
+    second = pandas.DataFrame({"this": [2], "service_date": [day]})
+    assert instance_fixture._write_parquet(pandas.DataFrame({"this": [9], "service_date": [day]}),
+                                           path, [day])
+
+    staging = instance_fixture.parquet_staging(path)
+    assert instance_fixture._write_parquet(first, path, [day], staging=staging)
+    assert instance_fixture._write_parquet(second, path, [day], staging=staging)
+    # Nothing is published before the end of the run.
+    directory = path + "fake/service_date=2020-01-01/"
+    assert list(pandas.read_parquet(directory + "part-0.parquet")["this"]) == [9]
+
+    empty = first.iloc[0:0].drop(columns="service_date")
+    assert instance_fixture._publish_parquet(path, [day, other], staging, empty)
+    assert list(pandas.read_parquet(directory + "part-0.parquet")["this"]) == [1, 2]
+    assert pandas.read_parquet(path + "fake/service_date=2020-01-02/part-0.parquet").empty
+    # Neither the staging directory nor temporary files are left behind.
+    assert sorted(os.listdir(path + "fake")) == ["service_date=2020-01-01", "service_date=2020-01-02"]
+    assert os.listdir(directory) == ["part-0.parquet"]
+
+def test_write_parquet_merge(tmp_path, instance_fixture):
+    pytest.importorskip("pyarrow")
+    path = str(tmp_path) + "/"
+    day = pandas.Timestamp(2020, 1, 1)
+    other = pandas.Timestamp(2020, 1, 2)
+    assert instance_fixture._write_parquet(
+        pandas.DataFrame({"this": [1, 2], "service_date": [day, other]}), path, [day, other])
+
+    # Rows are added to the days' files, identical rows kept once, and days
+    # without rows are left alone.
+    late = pandas.DataFrame({"this": [2, 3], "service_date": [day, day]})
+    assert instance_fixture._write_parquet(late, path, [day, other], merge=True)
+    directory = path + "fake/service_date="
+    assert list(pandas.read_parquet(directory + "2020-01-01/part-0.parquet")["this"]) == [1, 2, 3]
+    assert list(pandas.read_parquet(directory + "2020-01-02/part-0.parquet")["this"]) == [2]
+
+def test_write_parquet_no_pyarrow(monkeypatch, tmp_path, instance_fixture):
+    monkeypatch.setattr("src.tables.table._load_pyarrow", lambda: None)
+    df = pandas.DataFrame({"this": [1], "service_date": [pandas.Timestamp(2020, 1, 1)]})
+    assert instance_fixture._write_parquet(df, str(tmp_path) + "/", []) == False
@@ -0,0 +1,59 @@
+import pytest
+import pandas
+from datetime import datetime, date
+from src.tables import Watermarks
+
+@pytest.fixture
+def instance_fixture():
+    instance = Watermarks("sw23", "invalid", "localhost", "aperture")
+    return instance
+
+def test_table_name(instance_fixture):
+    assert instance_fixture._table_name == "watermarks"
+
+def test_expected_cols(instance_fixture):
+    assert instance_fixture._expected_cols == ["service_date", "max_row_id"]
+
+def test_write_table(instance_fixture):
+    calls = []
+    instance_fixture._write_table = lambda df, **kwargs: calls.append((df, kwargs)) or True
+    assert instance_fixture.write_table([[datetime(2020, 1, 1), 5], [date(2020, 1, 2), 9]])
+
+    df, kwargs = calls[0]
+    assert df.values.tolist() == [["2020-01-01", 5], ["2020-01-02", 9]]
+    assert kwargs["conflict_columns"] == ["service_date"]
+    # Watermarks never move back.
+    assert kwargs["update_columns"] == {
+        "max_row_id": "GREATEST(watermarks.max_row_id, EXCLUDED.max_row_id)"}
+
+def test_write_table_no_data(instance_fixture):
+    instance_fixture._write_table = lambda df, **kwargs: False
+    assert instance_fixture.write_table([])
+
+def test_max_row_ids(instance_fixture):
+    day1, day2 = datetime(2020, 1, 1), datetime(2020, 1, 2)
+    df = pandas.DataFrame({"service_date": [day1, day2, day1]},
+                          index=pandas.Index([5, 6, 9], name="row_id"))
+    assert instance_fixture.max_row_ids(df) == {day1: 9, day2: 6}
+
+def test_get_watermark(instance_fixture):
+    class mock_connection():
+        def __enter__(self):
+            return self
+        def __exit__(self, type, value, traceback):
+            return
+        def close(self):
+            return
+        def execute(self, sql):
+            self.sql = sql
+            return type('X', (object,), dict(first=lambda: (42,)))
+
+    mock = mock_connection()
+    instance_fixture._engine.connect = lambda: mock
+    assert instance_fixture.get_watermark() == 42
+    assert mock.sql == "SELECT MAX(max_row_id) FROM hive.watermarks WHERE max_row_id > 0;"
+
+def test_get_watermark_bad_connection(instance_fixture):
+    # Since the default engine cannot connect, there is no watermark.
+    assert instance_fixture.get_watermark() is None
+    assert instance_fixture.get_latest_day() is None
@@ -1,5 +1,18 @@
+import os
+import sys
+import subprocess
 import pytest
+import pandas
+from datetime import datetime, timedelta
+from flaggers.flagger import Flags, flaggers
 from src.client import _Client
+from src.config import config
+from src.ios import Progress
+from src.report import Profiler, RunReport
+from src.tables import CTran_Data, Flagged_Data, Service_Periods, Watermarks, Row_Hashes
+from src.tables import engines
+from src.tables import Flags as Flags_Table
+from src.workload import Workload
 
 @pytest.fixture
 def mock_config():
@@ -26,6 +39,18 @@ def mock_config():
 
     return Mock_Config()
 
+# Set values of the global config for one test. Runs read them from their
+# snapshot of the config.
+@pytest.fixture
+def set_config():
+    saved = {}
+    def set_value(name, value):
+        saved.setdefault(name, config.get_value(name))
+        config.set_value(name, value)
+    yield set_value
+    for name, value in saved.items():
+        config.set_value(name, value)
+
 @pytest.fixture
 def instance_fixture(mock_config):
     client_instance = _Client(read_env_data=False)
@@ -50,5 +75,456 @@ def test_create_hive(instance_fixture):
     instance_fixture.flags = custom
     instance_fixture.service_periods = custom
     instance_fixture.flagged = custom
+    instance_fixture.watermarks = custom
+    instance_fixture.row_hashes = custom
     instance_fixture.create_hive()
-    assert custom.value == 3
+    assert custom.value == 5
+
+def test_flag_frame(instance_fixture):
+    df = pandas.DataFrame({
+            "service_date": [datetime(2020, 1, 2), datetime(2020, 1, 3)],
+            "door": [0, 1],
+            "location_distance": [10.0, 500.0],
+        }, index=pandas.Index([7, 3], name="row_id"))
+    service_keys = pandas.Series([1, 2], index=df.index)
+
+    flagged_rows, duplicate = instance_fixture._flag_frame(df, service_keys)
+
+    assert duplicate is not None and duplicate.name == "Duplicate"
+    assert flagged_rows == [
+        [7, 1, int(Flags.UNOPENED_DOOR), "2020/1/2"],
+        [3, 2, int(Flags.UNOBSERVED_STOP), "2020/1/3"],
+    ]
+
+def test_flag_duplicates_stream(instance_fixture):
+    class Custom_Service_Periods():
+        def resolve(self, dates):
+            return pandas.Series(1.0, index=dates.index)
+
+    instance_fixture.service_periods = Custom_Service_Periods()
+    duplicate = [f for f in flaggers if f.name == "Duplicate"][0]
+    day1, day2 = datetime(2020, 1, 1), datetime(2020, 1, 2)
+    # Rows 2 and 3 are duplicates split across the chunk boundary, as are 5
+    # and 6 within the second chunk.
+    chunk1 = pandas.DataFrame({"service_date": [day1, day2, day2], "door": [1, 2, 3]},
+                              index=pandas.Index([0, 1, 2], name="row_id"))
+    chunk2 = pandas.DataFrame({"service_date": [day2, day2, day2], "door": [3, 4, 4]},
+                              index=pandas.Index([3, 5, 6], name="row_id"))
+
+    rows, carry = instance_fixture._flag_duplicates_stream(chunk1, duplicate)
+    assert rows == []
+    assert sorted(carry.row_ids) == [1, 2]
+
+    rows, carry = instance_fixture._flag_duplicates_stream(chunk2, duplicate, carry)
+    assert sorted(row[0] for row in rows) == [2, 3, 5, 6]
+    # Only the first row of each content is carried.
+    assert dict(zip(carry.row_ids, carry.reported)) == {1: False, 2: True, 5: True}
+
+    # Rows already reported are not reported again.
+    chunk3 = pandas.DataFrame({"service_date": [day2], "door": [4]},
+                              index=pandas.Index([7], name="row_id"))
+    rows, carry = instance_fixture._flag_duplicates_stream(chunk3, duplicate, carry)
+    assert [row[0] for row in rows] == [7]
+
+def test_flag_history_duplicates(instance_fixture):
+    class Custom_Service_Periods():
+        def resolve(self, dates):
+            return pandas.Series(1.0, index=dates.index)
+
+    class Custom_History():
+        def check(self, df, service_keys, exclude=(), hashes=None):
+            self.exclude = exclude
+            return [(4, 1, 1, datetime(2020, 1, 2)), (5, 1, 1, datetime(2020, 1, 2))]
+
+    assert instance_fixture._flag_history_duplicates(None, []) == []
+
+    instance_fixture.service_periods = Custom_Service_Periods()
+    instance_fixture._row_history = Custom_History()
+    df = pandas.DataFrame({"service_date": [datetime(2020, 1, 2)] * 3},
+                          index=pandas.Index([4, 5, 6], name="row_id"))
+    # Row 5 was already reported by the Duplicate flagger, row 1 is only
+    # reported once.
+    rows = instance_fixture._flag_history_duplicates(
+        df, [[5, 1, int(Flags.DUPLICATE), "2020/1/2"]])
+    assert instance_fixture._row_history.exclude == {5}
+    assert rows == [[4, 1, Flags.DUPLICATE, "2020/1/2"], [1, 1, Flags.DUPLICATE, "2020/1/2"]]
+
+def test_backfill(monkeypatch, instance_fixture):
+    class Custom_Flagged():
+        def get_latest_day(self):
+            return (datetime.now() - timedelta(days=3)).date()
+
+    class Custom_Service_Periods():
+        def __init__(self):
+            self.days = []
+        def resolve(self, dates):
+            self.days.extend(dates)
+
+    processed = []
+    failing = [(datetime.now() - timedelta(days=1)).date()]
+    def custom_process_data(start_date, end_date, restart=False, progress=None, report=None,
+                            allow_empty=False):
+        processed.append(start_date)
+        assert start_date == end_date
+        assert allow_empty
+        if start_date in failing:
+            raise ValueError("connection lost")
+        # Today has no CTran rows yet.
+        return 0 if start_date == datetime.now().date() else 10
+
+    class Custom_Watermarks():
+        def __init__(self):
+            self.days = []
+        def get_days(self):
+            return sorted(self.days)
+        def get_latest_day(self):
+            return max(self.days) if self.days else None
+
+    instance_fixture.flagged = Custom_Flagged()
+    instance_fixture.service_periods = Custom_Service_Periods()
+    instance_fixture.watermarks = Custom_Watermarks()
+    instance_fixture._process_data = custom_process_data
+    instance_fixture._write_report = lambda report: None
+
+    # The failing day does not stop the others, but is reported.
+    assert instance_fixture.backfill(2) == False
+    expected = [(datetime.now() - timedelta(days=i)).date() for i in [2, 1, 0]]
+    assert sorted(processed) == expected
+    assert instance_fixture.service_periods.days == expected
+
+    # Only the days without a watermark are processed again, so the failed
+    # day is retried.
+    instance_fixture.watermarks.days = [expected[0], expected[2]]
+    processed.clear()
+    assert instance_fixture.backfill(2) == False
+    assert processed == [expected[1]]
+
+    # A day without rows is not a failure.
+    failing.clear()
+    instance_fixture.watermarks.days = []
+    assert instance_fixture.backfill(2) == True
+
+def test_process_data_allow_empty(instance_fixture):
+    class Custom_CTran():
+        def query_date_range(self, start_date, end_date):
+            return pandas.DataFrame({"service_date": []})
+
+    instance_fixture.ctran = Custom_CTran()
+    instance_fixture._write_report = lambda report: None
+    day = datetime(2020, 1, 2).date()
+    assert instance_fixture._process_data(day, day) is None
+    assert instance_fixture._process_data(day, day, allow_empty=True) == 0
+
+def test_reprocess_upsert(instance_fixture):
+    class Custom_Flagged():
+        def delete_date_range(self, start_date, end_date):
+            raise AssertionError("reprocess should not delete in upsert mode")
+
+    calls = []
+    def custom_process_data(start_date, end_date, restart=False, replace=False):
+        calls.append((start_date, end_date, replace))
+        return 10
+
+    instance_fixture.flagged = Custom_Flagged()
+    instance_fixture._process_data = custom_process_data
+    instance_fixture._upsert = True
+
+    assert instance_fixture.reprocess("2020/01/01", "2020/01/02") == True
+    assert calls == [(datetime(2020, 1, 1), datetime(2020, 1, 2), True)]
+
+def test_tables_share_engine(instance_fixture):
+    engine = instance_fixture.flagged.get_engine()
+    assert instance_fixture.flags.get_engine() is engine
+    assert instance_fixture.service_periods.get_engine() is engine
+
+@pytest.fixture
+def custom_watermarks():
+    class Custom_Watermarks():
+        def __init__(self):
+            self.watermark = None
+            self.recorded = []
+        def get_watermark(self):
+            return self.watermark
+        def get_latest_day(self):
+            return None
+        def get_days(self):
+            return []
+        def max_row_ids(self, ctran_df):
+            return {d: int(max(ctran_df.index[ctran_df["service_date"] == d]))
+                    for d in ctran_df["service_date"]}
+        def record(self, ctran_df):
+            self.recorded.append(self.max_row_ids(ctran_df))
+            return True
+        def write_table(self, data):
+            self.recorded.append(dict(data))
+            return True
+
+    return Custom_Watermarks()
+
+def test_process_next_day_watermark(instance_fixture, custom_watermarks):
+    calls = []
+    def custom_process_data(start_date, end_date, restart=False, replace=False, after_row_id=None):
+        calls.append((start_date, end_date, restart, after_row_id))
+        return 10
+
+    custom_watermarks.watermark = 42
+    instance_fixture.watermarks = custom_watermarks
+    instance_fixture._process_data = custom_process_data
+
+    assert instance_fixture.process_next_day(restart=True)
+    assert instance_fixture.process_since_checkpoint()
+    assert calls == [(None, None, True, 42), (None, None, False, 42)]
+
+def test_process_data_records_watermarks(instance_fixture, custom_watermarks, set_config):
+    day1, day2 = datetime(2020, 1, 1), datetime(2020, 1, 2)
+    df = pandas.DataFrame({"service_date": [day1, day2, day1]},
+                          index=pandas.Index([5, 6, 9], name="row_id"))
+
+    class Custom_CTran():
+        def query_new_rows(self, row_id):
+            assert row_id == 4
+            return df
+        def query_new_rows_chunks(self, row_id, chunksize):
+            return iter([df.iloc[:2], df.iloc[2:]])
+
+    saved = []
+    instance_fixture.ctran = Custom_CTran()
+    instance_fixture.watermarks = custom_watermarks
+    instance_fixture._flag_rows = lambda ctran_df, progress=None, report=None: ([], None, 0)
+    instance_fixture._save_output = lambda *args, **kwargs: saved.append(args) or True
+    instance_fixture._write_report = lambda report: None
+
+    assert instance_fixture._process_data(None, None, after_row_id=4) == 3
+    assert custom_watermarks.recorded == [{day1: 9, day2: 6}]
+
+    # Streaming only records once every chunk is saved.
+    set_config("stream_chunksize", 2)
+    assert instance_fixture._process_data(None, None, after_row_id=4) == 3
+    assert custom_watermarks.recorded[1] == {day1: 9, day2: 6}
+
+    instance_fixture._save_output = lambda *args, **kwargs: False
+    assert instance_fixture._process_data(None, None, after_row_id=4) is None
+    assert len(custom_watermarks.recorded) == 2
+
+def test_record_empty_days(instance_fixture, custom_watermarks):
+    instance_fixture.watermarks = custom_watermarks
+    today = datetime.now().date()
+    # Today may still receive rows, so it gets no watermark.
+    instance_fixture._record_empty_days(today - timedelta(days=2), today)
+    assert custom_watermarks.recorded == [{today - timedelta(days=2): 0,
+                                           today - timedelta(days=1): 0}]
+    instance_fixture._record_empty_days(today, today)
+    assert len(custom_watermarks.recorded) == 1
+
+def test_process_data_writes_report(instance_fixture, custom_watermarks):
+    df = pandas.DataFrame({"service_date": [datetime(2020, 1, 1)] * 3},
+                          index=pandas.Index([5, 6, 9], name="row_id"))
+
+    class Custom_CTran():
+        def query_new_rows(self, row_id):
+            return df
+
+    reports = []
+    instance_fixture.ctran = Custom_CTran()
+    instance_fixture.watermarks = custom_watermarks
+    instance_fixture._flag_rows = lambda ctran_df, progress=None, report=None: (
+        [[5, 1, 2, "2020/1/1"]], None, 1)
+    instance_fixture._save_output = lambda *args, **kwargs: True
+    instance_fixture._write_report = reports.append
+
+    assert instance_fixture._process_data(None, None, after_row_id=4) == 3
+    result = reports[0].to_dict()
+    assert result["success"] == True
+    assert result["counters"] == {"rows": 3, "skipped_rows": 1, "flags": 1}
+    assert set(result["stages"]) == {"extract", "write"}
+    assert result["stages"]["write"]["rows"] == 1
+
+    # Failed runs are reported too.
+    instance_fixture._save_output = lambda *args, **kwargs: 1 / 0
+    with pytest.raises(ZeroDivisionError):
+        instance_fixture._process_data(None, None, after_row_id=4)
+    assert reports[1].to_dict()["success"] == False
+
+def test_process_data_progress(instance_fixture, custom_watermarks):
+    df = pandas.DataFrame({"service_date": [datetime(2020, 1, 1)] * 3},
+                          index=pandas.Index([5, 6, 9], name="row_id"))
+
+    class Custom_CTran():
+        def query_new_rows(self, row_id):
+            return df
+
+    progress = Progress(enabled=False)
+    seen = []
+    instance_fixture.ctran = Custom_CTran()
+    instance_fixture.watermarks = custom_watermarks
+    instance_fixture._flag_rows = lambda ctran_df, progress=None, report=None: (
+        seen.append(progress._done) or ([], None, 0))
+    instance_fixture._save_output = lambda *args, **kwargs: seen.append(progress._done) or True
+
+    # Rows count as done once read and once flagged, before the write.
+    assert instance_fixture._process_data(None, None, after_row_id=4, progress=progress,
+                                          report=RunReport()) == 3
+    assert seen == [3, 6]
+    assert (progress._done, progress._total) == (9, 9)
+
+def test_parallel_flagger_per_run(instance_fixture, set_config):
+    set_config("parallel_workers", 3)
+    set_config("parallel_min_partition_rows", 500)
+    instance_fixture._write_report = lambda report: None
+    started = []
+    def custom_process_data_stream(*args, **kwargs):
+        started.append(instance_fixture._parallel_flagger)
+        return 0
+    instance_fixture._process_data_stream = custom_process_data_stream
+    set_config("stream_chunksize", 2)
+
+    assert instance_fixture._process_data(None, None) == 0
+    # The run flags every chunk with one ParallelFlagger, closed once done.
+    assert started[0].workers == 3
+    assert started[0].min_partition_rows == 500
+    assert instance_fixture._parallel_flagger is None
+
+    set_config("parallel_workers", 1)
+    assert instance_fixture._process_data(None, None) == 0
+    assert started[1] is None
+
+def test_select_loads_only_what_it_needs(tmp_path):
+    # A flag query neither processes data nor flags, so it must not import
+    # the flaggers, parquet, profiling or multiprocessing support.
+    code = "\n".join([
+        "import sys",
+        "from src.ios import ios",
+        "ios.stop()",
+        "ios.start({!r})".format(str(tmp_path / "log.txt")),
+        "from src.interface import ArgInterface",
+        "from src.client import _Client",
+        "client = _Client(read_env_data=False)",
+        "ArgInterface().query_with_args(client, ['--select', '-f', 'duplicate'])",
+        "ios.stop()",
+        "print(' '.join(sorted(sys.modules)))"])
+    result = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    modules = set(result.stdout.split())
+    assert "src.client" in modules
+    for module in ["pyarrow", "multiprocessing.shared_memory", "cProfile", "tracemalloc",
+                   "src.parallel", "src.report.Profiler", "src.tables.ctran_cache",
+                   "src.tables.row_history", "flaggers.duplicate", "flaggers.bounds",
+                   "flaggers.null"]:
+        assert module not in modules
+
+def test_log_pool_stats_in_memory(instance_fixture):
+    # The StaticPool of an in-memory SQLite database keeps no counts.
+    engines.get("sqlite://")
+    instance_fixture.log_pool_stats()
+
+def test_set_parallel_workers(instance_fixture, set_config):
+    set_config("parallel_workers", 1)
+    instance_fixture._snapshot_config()
+    instance_fixture.set_parallel_workers(3)
+    # Read from the snapshot of the next run.
+    assert instance_fixture._settings.parallel_workers == 1
+    assert instance_fixture._snapshot_config().parallel_workers == 3
+
+def test_process_data_profiles(monkeypatch, instance_fixture, custom_watermarks):
+    df = pandas.DataFrame({"service_date": [datetime(2020, 1, 1)] * 3},
+                          index=pandas.Index([5, 6, 9], name="row_id"))
+
+    class Custom_CTran():
+        def query_new_rows(self, row_id):
+            return df
+
+    profiles = []
+    monkeypatch.setattr(Profiler, "write", lambda self, path: profiles.append(self) or path + "profile.txt")
+    instance_fixture.ctran = Custom_CTran()
+    instance_fixture.watermarks = custom_watermarks
+    instance_fixture._flag_rows = lambda ctran_df, progress=None, report=None: ([], None, 0)
+    instance_fixture._save_output = lambda *args, **kwargs: True
+    instance_fixture._write_report = lambda report: None
+
+    assert instance_fixture._process_data(None, None, after_row_id=4) == 3
+    assert profiles == []
+
+    instance_fixture.set_profiling(True)
+    assert instance_fixture._process_data(None, None, after_row_id=4) == 3
+    assert len(profiles) == 1
+    assert set(profiles[0]._stats()) == {"extract", "write"}
+    assert instance_fixture._profiler is None
+
+def test_save_output_writes_flags(instance_fixture):
+    calls = []
+    class Custom_Flags():
+        def write_flags(self):
+            calls.append("flags")
+            return True
+    class Custom_Flagged():
+        def write_table(self, rows, upsert=False):
+            calls.append("flagged")
+            return True
+
+    instance_fixture.flags = Custom_Flags()
+    instance_fixture.flagged = Custom_Flagged()
+    instance_fixture._output_type = "aperture"
+    # Every flag is in the flags table before the first flagged_data write,
+    # once per client.
+    assert instance_fixture._save_output([[1, 2, 3, "2020/1/1"]], ["2020-01-01"])
+    assert instance_fixture._save_output([[1, 2, 3, "2020/1/1"]], ["2020-01-01"])
+    assert calls == ["flags", "flagged", "flagged"]
+
+def test_save_output_parquet(instance_fixture):
+    class Custom_Flagged():
+        def write_parquet(self, path, data, days, merge=False, staging=None):
+            self.call = (path, data, days, merge, staging)
+            return True
+        def write_table(self, data, upsert=False):
+            raise AssertionError("parquet output should not write to the database")
+
+    instance_fixture.flagged = Custom_Flagged()
+    instance_fixture._output_type = "parquet"
+    assert instance_fixture._save_output([[1, 2, 3, "2020/1/1"]], ["2020-01-01"],
+                                         merge=True, staging="staging/")
+    assert instance_fixture.flagged.call == (
+        instance_fixture._output_path, [[1, 2, 3, "2020/1/1"]], ["2020-01-01"], True, "staging/")
+
+@pytest.mark.parametrize("chunksize", [0, 100])
+def test_parquet_late_rows(tmp_path, instance_fixture, set_config, chunksize):
+    # A run over the rows added since the last one adds their flags to the
+    # day's file instead of replacing it.
+    pytest.importorskip("pyarrow")
+    url = "sqlite:///" + str(tmp_path / "pipeline.db")
+    instance_fixture.ctran = CTran_Data(schema="aperture", engine=url)
+    instance_fixture.flagged = Flagged_Data(engine=url)
+    instance_fixture.flags = Flags_Table(engine=url)
+    instance_fixture.service_periods = Service_Periods(engine=url)
+    instance_fixture.watermarks = Watermarks(engine=url)
+    instance_fixture.row_hashes = Row_Hashes(engine=url)
+    instance_fixture._output_type = "parquet"
+    instance_fixture._output_path = str(tmp_path) + "/"
+    set_config("stream_chunksize", chunksize)
+    instance_fixture._write_report = lambda report: None
+    instance_fixture.create_hive()
+
+    df = Workload(vehicles=2, trips=2, stops=20, zero_door_rate=0.1, far_rate=0.05).frame(0)
+    ctran = instance_fixture.ctran
+    assert super(CTran_Data, ctran).create_table() and ctran._write_table(df)
+    day = df["service_date"].iloc[0]
+    assert instance_fixture.process_data(day, day)
+    path = str(tmp_path) + "/flagged_data/service_date=" + day.isoformat() + "/part-0.parquet"
+    before = pandas.read_parquet(path)
+    assert len(before) == 12
+
+    late = df.iloc[:5].copy()
+    late["door"] = 0
+    late["dwell"] = 7
+    late.index = late.index + len(df.index)
+    assert ctran._write_table(late)
+    assert instance_fixture.process_since_checkpoint()
+
+    # Every earlier flag is kept, the late rows' are added.
+    after = pandas.read_parquet(path)
+    kept = after.merge(before)
+    assert len(kept) == len(before)
+    assert set(after["row_id"]) - set(before["row_id"]) == set(late.index)
+    # 5 unopened doors, one of them also far from its stop.
+    assert len(after) == len(before) + 6
+    # No staging directory is left behind.
+    assert os.listdir(str(tmp_path) + "/flagged_data") == ["service_date=" + day.isoformat()]
@@ -0,0 +1,56 @@
+import pytest
+import pandas
+from src.config import config
+from src.parallel import collect_masks
+from src.workload import Workload
+from flaggers.flagger import flaggers, Flags
+from flaggers.duplicate import Duplicate
+
+@pytest.fixture
+def config_instance():
+    config.load()
+    return config
+
+@pytest.fixture
+def workload():
+    return Workload(days=2, vehicles=10, trips=4, stops=25, seed=7, null_rate=0.02,
+                    zero_door_rate=0.03, far_rate=0.04, duplicate_rate=0.01)
+
+def test_shape(workload):
+    df = workload.frame(1)
+    assert len(df) == workload.rows_per_day() == 1010
+    assert df.index.name == "row_id"
+    assert df.index[0] == 1011
+    assert list(df.columns)[0] == "service_date"
+    assert df["service_date"].iloc[0] == pandas.Timestamp("2020-01-07").date()
+
+def test_deterministic(workload):
+    pandas.testing.assert_frame_equal(workload.frame(1), list(workload.frames())[1])
+    other = Workload(days=2, vehicles=10, trips=4, stops=25, seed=8, null_rate=0.02)
+    assert not other.frame(0).equals(workload.frame(0))
+
+def test_expected_flags(workload, config_instance):
+    for day in range(workload.days):
+        df = workload.frame(day)
+        masks, errors = collect_masks(flaggers, df, config_instance)
+        assert errors == []
+        raised = {flag: int(mask.sum()) for flag, mask in masks.items()}
+        raised[Flags.DUPLICATE] = len(Duplicate().find(df)[0])
+        assert raised == workload.expected(day)
+
+    expected = workload.expected()
+    assert expected[Flags.UNOPENED_DOOR] == 60
+    assert expected[Flags.UNOBSERVED_STOP] == 80
+    assert expected[Flags.DUPLICATE] == 40
+
+def test_rates_too_high():
+    with pytest.raises(ValueError):
+        Workload(vehicles=1, trips=1, stops=10, null_rate=0.6, far_rate=0.6)
+
+def test_write_csv(workload, tmp_path):
+    path = str(tmp_path / "csv" / "ctran_trips_sample.csv")
+    assert workload.write_csv(path)
+    df = pandas.read_csv(path, parse_dates=["service_date"])
+    assert len(df) == 2 * workload.rows_per_day()
+    assert df["service_date"].dt.day.unique().tolist() == [6, 7]
+    assert df.isna().sum().sum() == 2 * 20